@@ -1,31 +1,37 @@
 # CalendarSync.pyw - Run with pythonw.exe (no console window)
 # Dependencies: pip install pystray pillow
+import sys
+
+# first, so the imports below are measured too
+import system.constants as constants
+from system.startup_report import StartupReport
+
+startup_report = StartupReport()
+if constants.STARTUP_REPORT_ENABLED or '--startup-report' in sys.argv:
+    startup_report.trace_imports()
+
 import configparser
-import ctypes
 import json
 import logging
 import os
 import queue
-import sys
 import threading
 import time
 import tkinter as tk
-from datetime import datetime
 from pathlib import Path
 from tkinter import scrolledtext
 
 import pystray
-import pythoncom
 from PIL import Image
 from PIL import ImageDraw
 from pystray import MenuItem as Item
 
-import system.constants as constants
 from system.constants import INTERVAL_OBSERVER
-from system.constants import INTERVAL_SYNC_JOB
-from system.settings_screen import load_runtime_settings
+from system.control_server import ControlServer
+from system.runtime_settings import load_runtime_settings
 from system.settings_screen import open_settings
-from system.sync_tasks import SyncTask
+from system.sync_pacer import sync_pacer
+from system.sync_service import SyncService
 from system.tools import line_number
 from system.tools import print_display
 
@@ -40,7 +46,7 @@ constants.RUN_GUI = True
 if constants.RUN_GUI:
     sys.stdout = _log_file
     sys.stderr = _log_file
-load_runtime_settings()
+startup_report.step('imports done')
 
 sys.path.insert(0,
                 _base)
@@ -86,21 +92,22 @@ def _ensure_ini_defaults():
         with open(_INI_PATH, 'w', encoding='utf-8') as f:
             cfg.write(f)
 
-_ensure_ini_defaults()
-MAX_LOG_LINES = _load_ini_int('logging', 'max_log_lines', 1000)
+# read from the ini by _startup_in_background(); the default holds until then
+MAX_LOG_LINES = 1000
 
 # ---------------------------------------------------------------------------
 # Global Tkinter root (created on main thread)
 # ---------------------------------------------------------------------------
 root = tk.Tk()
 root.withdraw()
+startup_report.step('Tk root created')
 
 # ---------------------------------------------------------------------------
 # State
 # ---------------------------------------------------------------------------
-paused = threading.Event()
-paused.set()  # set = NOT paused (running)
-stop_event = threading.Event()
+# scheduler, jobs and sync engine; shared with the headless CalendarSyncService.py
+sync_service = SyncService()
+paused = sync_service.paused
 
 # ---------------------------------------------------------------------------
 # Logger
@@ -143,24 +150,6 @@ class PauseToken:
         return not self._event.is_set()
 
 
-class SystemObserver:
-    def __init__(self):
-        self.enabled = True
-        self.continuous = 0x80000000
-        self.system_required = 0x00000001
-        self.display_required = 0x00000002
-
-    def system_observer_state(self):
-        if self.enabled:
-            print_display(f'{line_number()} System observing state...')
-            ctypes.windll.kernel32.SetThreadExecutionState(self.continuous | self.system_required | self.display_required)
-
-    def system_original_state(self):
-        if self.enabled:
-            print_display(f'{line_number()} System continuous system state...')
-            ctypes.windll.kernel32.SetThreadExecutionState(self.continuous)
-
-
 logger = logging.getLogger('CalendarSync Logger')
 logger.setLevel(logging.DEBUG)
 _handler = ListHandler()
@@ -207,37 +196,8 @@ def load_settings():
     return '700x400'  # Default if no file exists
 
 
-# Load the memory immediately when the script starts
-_viewer_geom = load_settings()
-
-
-# ---------------------------------------------------------------------------
-# Pause-aware helpers
-# ---------------------------------------------------------------------------
-def interruptible_sleep(seconds: float,
-                        interval: float = 0.5):
-    """Sleep for `seconds`, honoring pause and stop at each interval tick."""
-    deadline = time.monotonic() + seconds
-    while time.monotonic() < deadline:
-        if stop_event.is_set():
-            raise StopIteration('stop requested')
-        if not paused.is_set():
-            paused.wait()
-            deadline = time.monotonic() + (deadline - time.monotonic())
-        remaining = deadline - time.monotonic()
-        time.sleep(min(interval,
-                       max(remaining,
-                           0)))
-
-
-def check_pause():
-    """Block if paused; raise StopIteration if stop was requested."""
-    if stop_event.is_set():
-        raise StopIteration('stop requested')
-    if not paused.is_set():
-        paused.wait()
-    if stop_event.is_set():
-        raise StopIteration('stop requested')
+# read by _startup_in_background(), so the tray does not wait for the disk
+_viewer_geom = '700x400'
 
 
 # ---------------------------------------------------------------------------
@@ -309,8 +269,6 @@ def make_icon_anim(frame: int):
 # Priority rule: pause > animate > idle
 # ---------------------------------------------------------------------------
 icon_queue = queue.Queue()
-_active_jobs = 0
-_active_jobs_lock = threading.Lock()
 
 
 def _icon_manager(tray):
@@ -345,114 +303,16 @@ def _set_icon_state(state: str):
 
 
 # ---------------------------------------------------------------------------
-# Job wrapper — increments active counter, drives icon state
+# Job hook — the service reports how many jobs run, the icon follows
 # ---------------------------------------------------------------------------
-def _job_wrapper(func,
-                 *args,
-                 **kwargs):
-    global _active_jobs
-    with _active_jobs_lock:
-        _active_jobs += 1
+def _on_jobs_changed(active_jobs: int):
+    if active_jobs > 0:
         _set_icon_state('animate')
-    try:
-        func(*args,
-             **kwargs)
-    finally:
-        with _active_jobs_lock:
-            _active_jobs -= 1
-            if _active_jobs == 0:
-                _set_icon_state('pause' if not paused.is_set() else 'idle')
-
-
-# ---------------------------------------------------------------------------
-# Worker functions — replace bodies with real logic
-# ---------------------------------------------------------------------------
-def function_observer():
-    logger.info('[Observer] started')
-    system_observer = SystemObserver()
-    try:
-        check_pause()
-        system_observer.system_observer_state()
-        interruptible_sleep(3)
-    except StopIteration:
-        logger.warning('[Observer] interrupted')
-        system_observer.system_original_state()
-    logger.info('[Observer] Cycled')
-
-
-def function_sync_job():
-    logger.info('[Sync Job] started')
-    pythoncom.CoInitialize()
-    try:
-        check_pause()
-        sync_task = SyncTask()
-        sync_task.sync_task()
-        interruptible_sleep(4)
-    except StopIteration:
-        logger.warning('[Sync Job] interrupted')
-    finally:
-        # Always uninitialize COM to clean up resources
-        pythoncom.CoUninitialize()
-    logger.info('[Sync Job] Cycled')
-
+    else:
+        _set_icon_state('pause' if not paused.is_set() else 'idle')
 
-# ---------------------------------------------------------------------------
-# Scheduler — lightweight loop, never blocks on actual work
-# ---------------------------------------------------------------------------
-def main_loop():
-    last_observer = 0.0
-    last_sync_job = 0.0
-    running_observer = threading.Event()
-    running_sync_job = threading.Event()
-
-    def run_observer():
-        running_observer.set()
-        _job_wrapper(function_observer)
-        running_observer.clear()
-
-    def run_sync_job():
-        running_sync_job.set()
-        _job_wrapper(function_sync_job)
-        running_sync_job.clear()
-
-    while not stop_event.is_set():
-        # Pause handling
-        if not paused.is_set():
-            _set_icon_state('pause')
-            paused.wait()
-            _set_icon_state('animate' if _active_jobs > 0 else 'idle')
-
-        now = time.monotonic()
-
-        # Stage 1 — Observer Task every 5 minutes
-        if now - last_observer >= INTERVAL_OBSERVER:
-            last_observer = time.monotonic()
-            if not running_observer.is_set():
-                logger.info('Scheduling [Observer]...')
-                threading.Thread(target=run_observer,
-                                 daemon=True).start()
-                # Log next Observer run
-                next_obs = datetime.fromtimestamp(time.time() + INTERVAL_OBSERVER).strftime('%Y.%m.%d %p %I:%M:%S')
-                logger.info(f'Next [[OBSERVER]] scheduled for [{next_obs}]')
-            else:
-                logger.warning('Observer Task still running — skipping this cycle')
-
-        # Stage 2 — Sync Job every 30 minutes
-        if now - last_sync_job >= INTERVAL_SYNC_JOB:
-            last_sync_job = time.monotonic()
-            if not running_sync_job.is_set():
-                logger.info('Scheduling [Sync Job]...')
-                threading.Thread(target=run_sync_job,
-                                 daemon=True).start()
-                next_sync = datetime.fromtimestamp(time.time() + INTERVAL_SYNC_JOB).strftime('%Y.%m.%d %p %I:%M:%S')
-                logger.info(f'Next [[SYNC JOB]] scheduled for [{next_sync}]')
-            else:
-                logger.warning('Sync Job still running — skipping this cycle')
 
-        try:
-            interruptible_sleep(10)
-        except StopIteration:
-            break
+sync_service.on_jobs_changed = _on_jobs_changed
 
 
 # ---------------------------------------------------------------------------
@@ -772,7 +632,7 @@ def _create_or_raise_about():
               f'Every {INTERVAL_OBSERVER // 60} min')
     _meta_row(meta_frame,
               'Sync interval',
-              f'Every {INTERVAL_SYNC_JOB // 60} min')
+              f'Every {sync_pacer.interval() // 60} min')
 
     # ── close button ────────────────────────────────────────────────────────
     btn_frame = tk.Frame(about_window,
@@ -808,16 +668,32 @@ def _on_about_close(win):
 # ---------------------------------------------------------------------------
 # Tray menu callbacks
 # ---------------------------------------------------------------------------
-def on_pause_resume(icon,
-                    item):
-    if paused.is_set():
-        paused.clear()
+def _set_paused(pause: bool) -> bool:
+    # the menu and the control socket both come here, so the icon always follows
+    if pause:
+        if not sync_service.pause():
+            return False
         _set_icon_state('pause')
-        logger.info('Paused by user')
     else:
-        paused.set()
-        logger.info('Resumed by user')
-        _set_icon_state('animate' if _active_jobs > 0 else 'idle')
+        if not sync_service.resume():
+            return False
+        _set_icon_state('animate' if sync_service.active_jobs > 0 else 'idle')
+    return True
+
+
+def on_pause_resume(icon,
+                    item):
+    _set_paused(not sync_service.is_paused)
+
+
+def on_sync_now(icon,
+                item):
+    sync_service.sync_now()
+
+
+def on_cancel_sync(icon,
+                   item):
+    sync_service.cancel_sync()
 
 
 def is_paused(item):
@@ -849,8 +725,8 @@ def on_about(icon,
 
 def on_quit(icon,
             item):
-    stop_event.set()
-    paused.set()
+    sync_service.stop()
+    control_server.stop()
     _set_icon_state('stop')
     icon.stop()
     root.after(0,
@@ -862,6 +738,53 @@ def on_settings(icon,
     open_settings(root)
 
 
+# status, pause, resume, sync and cancel for monitoring, on the loopback interface
+control_server = ControlServer({
+        **sync_service.control_commands(),
+        'pause' : lambda: _set_paused(True),
+        'resume': lambda: _set_paused(False)})
+
+
+# ---------------------------------------------------------------------------
+# Startup — the tray appears first, settings and the scheduler follow
+# ---------------------------------------------------------------------------
+_tray_ready = threading.Event()
+
+
+def _on_tray_ready(icon):
+    # pystray calls this on its own thread once the icon exists
+    icon.visible = True
+    startup_report.step('tray icon visible')
+    _tray_ready.set()
+
+
+def _startup_in_background():
+    global MAX_LOG_LINES, _viewer_geom
+    _ensure_ini_defaults()
+    MAX_LOG_LINES = _load_ini_int('logging', 'max_log_lines', 1000)
+    # before the scheduler: the intervals and the sync window come from here
+    load_runtime_settings()
+    _viewer_geom = load_settings()
+    startup_report.step('settings loaded')
+
+    # Scheduler and the Outlook event thread
+    sync_service.start()
+
+    if constants.CONTROL_ENABLED:
+        try:
+            control_server.start()
+        except OSError as os_error:
+            # another instance holds the port; the tray works without it
+            logger.warning(f'[Control] socket not started: {os_error}')
+    startup_report.step('scheduler started')
+
+    logger.info('CalendarSync Started...')
+    _tray_ready.wait(10)
+    startup_report.stop_tracing()
+    for report_line in startup_report.report().splitlines():
+        logger.info(report_line)
+
+
 # ---------------------------------------------------------------------------
 # Entry point
 # ---------------------------------------------------------------------------
@@ -869,6 +792,10 @@ def main():
     menu = pystray.Menu(Item('Paused',
                              on_pause_resume,
                              checked=is_paused),
+                        Item('Sync Now',
+                             on_sync_now),
+                        Item('Cancel Sync',
+                             on_cancel_sync),
                         Item('Log Viewer',
                              on_log_viewer),
                         Item('Clear Log',
@@ -893,15 +820,16 @@ def main():
                      args=(icon,),
                      daemon=True).start()
 
-    # Scheduler
-    threading.Thread(target=main_loop,
-                     daemon=True).start()
-
     # pystray on its own thread; Tkinter owns the main thread
     threading.Thread(target=icon.run,
+                     kwargs={
+                             'setup': _on_tray_ready},
+                     daemon=True).start()
+
+    # ini, settings, scheduler and control socket, without holding up the tray
+    threading.Thread(target=_startup_in_background,
                      daemon=True).start()
 
-    logger.info('CalendarSync Started...')
     root.mainloop()
 
 
@@ -0,0 +1,108 @@
+# CalendarSyncService.py - headless sync: no Tk, no tray icon, no PIL
+#   python CalendarSyncService.py                 run the scheduler until Ctrl+C
+#   python CalendarSyncService.py --log-file x    also append the log to a file
+#   python CalendarSyncService.py status          ask a running service or tray app (pause, resume, sync, cancel)
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+
+sys.path.insert(0,
+                os.path.dirname(os.path.abspath(__file__)))
+
+import system.constants as constants
+from system.control_server import ControlServer
+from system.control_server import send_command
+from system.runtime_settings import load_runtime_settings
+from system.tools import line_number
+from system.tools import print_display
+
+# what the control socket of the service answers to
+COMMANDS = ('status',
+            'pause',
+            'resume',
+            'sync',
+            'cancel')
+
+
+def _configure_logging(log_file: str = None):
+    # print_display goes through the same logger as in the tray app
+    constants.RUN_HEADLESS = True
+    logger = logging.getLogger('CalendarSync Logger')
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file,
+                                            encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+
+def run_service(port: int = None) -> int:
+    # imported here: a control client has no use for the connectors
+    from system.sync_service import SyncService
+
+    load_runtime_settings()
+    sync_service = SyncService()
+    control_server = ControlServer(sync_service.control_commands(),
+                                   port=port)
+
+    def _on_signal(signal_number,
+                   frame):
+        print_display(f'{line_number()} signal [{signal_number}] received, stopping')
+        sync_service.stop_event.set()
+
+    signal.signal(signal.SIGTERM,
+                  _on_signal)
+    try:
+        control_server.start()
+    except OSError as os_error:
+        print_display(f'{line_number()} [CONTROL] socket not started, is another service or the tray app running? [{os_error}]')
+        return 1
+    sync_service.start()
+    print_display(f'{line_number()} CalendarSync service started...')
+    try:
+        # short waits so Ctrl+C is seen on Windows as well
+        while not sync_service.stop_event.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    sync_service.stop()
+    control_server.stop()
+    print_display(f'{line_number()} Bye...')
+    return 0
+
+
+def main(arguments: list[str] = None) -> int:
+    argument_parser = argparse.ArgumentParser(description='Outlook / Google Calendar sync without the tray icon.')
+    argument_parser.add_argument('command',
+                                 nargs='?',
+                                 choices=COMMANDS,
+                                 help='send this command to a running service instead of starting one')
+    argument_parser.add_argument('--port',
+                                 type=int,
+                                 default=constants.CONTROL_PORT,
+                                 help='port of the control socket')
+    argument_parser.add_argument('--log-file',
+                                 help='append the log to this file as well as printing it')
+    parsed_arguments = argument_parser.parse_args(arguments)
+    if parsed_arguments.command:
+        try:
+            reply = send_command(parsed_arguments.command,
+                                 port=parsed_arguments.port)
+        except OSError as os_error:
+            print(f'no service answering on port [{parsed_arguments.port}]: [{os_error}]')
+            return 1
+        print(json.dumps(reply,
+                         indent=2))
+        return 0 if reply.get('ok') else 1
+    _configure_logging(parsed_arguments.log_file)
+    return run_service(parsed_arguments.port)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
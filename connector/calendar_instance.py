@@ -1,62 +1,94 @@
+import hashlib
 import json
-from datetime import datetime
 
 import tzlocal
-from dateutil import parser
 
+from connector.event_mapping import EventSide
 from connector.g_calendar import GoogleCalendarConnector
 from connector.ms_outlook import MicrosoftOutlookConnector
+import system.constants as constants
+from system.recurrence_rule import RecurrenceRule
 from system.tools import convert_to_local
 from system.tools import remove_timezone_info
 from system.tools import line_number
-from system.tools import compare_rule
 from system.tools import print_display
 from system.tools import print_overline
 from system.tools import print_underline
+from system.tools import to_utc_datetime
+
+
+# Outlook only ever reports the first 200 characters of Body
+# (see MicrosoftOutlookConnector.get_instance_data_ms_outlook), so the
+# fingerprint uses the same prefix on both sides.
+_FINGERPRINT_DESCRIPTION_LENGTH = 200
+
+# Keys mapped onto shared_* fields; everything else is carried over untouched
+# in g_calendar_only / ms_outlook_only.  Built once instead of per event.
+_G_CALENDAR_SHARED_KEYS = frozenset(('iCalUID',
+                                     'summary',
+                                     'description',
+                                     'location',
+                                     'start',
+                                     'end',
+
+                                     # 'organizer',
+                                     # 'attendees',
+
+                                     'recurrence',
+                                     'reminders',
+                                     'visibility',
+                                     'status'))
+_MS_OUTLOOK_SHARED_KEYS = frozenset(('GlobalAppointmentID',
+                                     'Subject',
+                                     'Body',
+                                     'Location',
+                                     'StartUTC',
+                                     'EndUTC',
+
+                                     # 'Organizer',
+                                     # 'RequiredAttendees',
+                                     # 'OptionalAttendees',
+
+                                     'IsRecurring',
+                                     'recurrence_type',
+                                     'recurrence_interval',
+                                     'recurrence_day_of_week_mask',
+                                     'recurrence_instance',
+                                     'recurrence_month_of_year',
+                                     'recurrence_end',
+                                     'ReminderMinutesBeforeStart',
+                                     'Sensitivity',
+                                     'BusyStatus'))
 
 
-# FIX: Outlook DayOfWeekMask bit values => iCalendar BYDAY abbreviations
-_OL_DAY_MASK_TO_BYDAY = {
-        1 : 'SU',
-        2 : 'MO',
-        4 : 'TU',
-        8 : 'WE',
-        16: 'TH',
-        32: 'FR',
-        64: 'SA',
-}
-
-# FIX: iCalendar BYDAY abbreviations => Outlook DayOfWeekMask bit values
-_BYDAY_TO_OL_DAY_MASK = {v: k for k, v in _OL_DAY_MASK_TO_BYDAY.items()}
-
-# FIX: Outlook Instance values (1-5) => iCalendar BYSETPOS values.
-# Outlook uses 5 to mean "last"; iCalendar uses -1.
-_OL_INSTANCE_TO_BYSETPOS = {
-        1: 1,
-        2: 2,
-        3: 3,
-        4: 4,
-        5: -1,
-}
-
-# FIX: iCalendar BYSETPOS values => Outlook Instance values
-_BYSETPOS_TO_OL_INSTANCE = {v: k for k, v in _OL_INSTANCE_TO_BYSETPOS.items()}
-
-
-def _day_mask_to_byday(mask: int) -> str:
-    """Convert an Outlook DayOfWeekMask integer to a BYDAY string (e.g. 'MO,TU,WE,TH,FR')."""
-    return ','.join(day for bit, day in _OL_DAY_MASK_TO_BYDAY.items() if mask & bit)
-
-
-def _byday_to_day_mask(byday: str) -> int:
-    """Convert a BYDAY string (e.g. 'MO,TU,WE,TH,FR') to an Outlook DayOfWeekMask integer."""
-    total = 0
-    for day in byday.split(','):
-        total |= _BYDAY_TO_OL_DAY_MASK.get(day.strip().upper(), 0)
-    return total
-# FIX END
-
 class CalendarInstance:
+    # Plain attribute storage without a per-instance __dict__; SyncTask builds
+    # one of these for every event it looks at.
+    __slots__ = ('shared_uid',
+                 'shared_subject',
+                 'shared_description',
+                 'shared_location',
+                 'shared_start_date',
+                 'shared_end_date',
+                 'shared_recurrence',
+                 'shared_reminder_minutes',
+                 'shared_visibility',
+                 'shared_status',
+                 'ms_outlook_only',
+                 'g_calendar_only')
+
+    # Fields compared by __eq__ and diff(), cheapest and most likely to differ first.
+    # shared_uid is left out on purpose: each side issues its own UID.
+    _COMPARED_FIELDS = ('shared_start_date',
+                        'shared_end_date',
+                        'shared_subject',
+                        'shared_status',
+                        'shared_visibility',
+                        'shared_reminder_minutes',
+                        'shared_location',
+                        'shared_description',
+                        'shared_recurrence')
+
     def __init__(self):
         self.shared_uid = None
         self.shared_subject = None
@@ -76,61 +108,67 @@ class CalendarInstance:
         self.ms_outlook_only = dict()
         self.g_calendar_only = dict()
 
+    @staticmethod
+    def _field_equal(field_name: str,
+                     value_one,
+                     value_two) -> bool:
+        if value_one == value_two:
+            return True
+        if field_name == 'shared_recurrence':
+            if not value_one or not value_two:
+                return not value_one and not value_two
+            if isinstance(value_one,
+                          list):
+                value_one = value_one[0]
+            if isinstance(value_two,
+                          list):
+                value_two = value_two[0]
+            return RecurrenceRule.parse(value_one) == RecurrenceRule.parse(value_two)
+        return False
+
     def __eq__(self,
                other):
+        # Quiet and short-circuiting: stops at the first differing field.
+        # Use diff() when the individual differences are needed.
         if not isinstance(other,
                           CalendarInstance):
             return False
-        eq_subject = self.shared_subject == other.shared_subject
-        print_display(f'{line_number()} [{self.shared_subject}]')
-        print_display(f'{line_number()} [{other.shared_subject}]')
-        eq_description = self.shared_description == other.shared_description
-        if self.shared_description:
-            print_display(f'{line_number()} [{self.shared_description.strip()}]')
-        else:
-            print_display(f'{line_number()} [-empty-]')
-        if other.shared_description:
-            print_display(f'{line_number()} [{other.shared_description.strip()}]')
-        else:
-            print_display(f'{line_number()} [-empty-]')
-        eq_location = self.shared_location == other.shared_location
-        print_display(f'{line_number()} [{self.shared_location}]')
-        print_display(f'{line_number()} [{other.shared_location}]')
-        eq_start_date = self.shared_start_date == other.shared_start_date
-        print_display(f'{line_number()} [{self.shared_start_date}]')
-        print_display(f'{line_number()} [{other.shared_start_date}]')
-        eq_end_date = self.shared_end_date == other.shared_end_date
-        print_display(f'{line_number()} [{self.shared_end_date}]')
-        print_display(f'{line_number()} [{other.shared_end_date}]')
-
-        '''     
-        eq_organizer = self.shared_organizer == other.shared_organizer
-        print_display(f'{line_number()} [{self.shared_organizer}]')
-        print_display(f'{line_number()} [{other.shared_organizer}]')
-
-        eq_attendees = self._normalized_attendees() == other._normalized_attendees()
-        print_display(f'{line_number()} [{self.shared_attendees}]')
-        print_display(f'{line_number()} [{other.shared_attendees}]')
-        '''
-
-        eq_recurrence = compare_rule(self.shared_recurrence,
-                                     other.shared_recurrence)
-        print_display(f'{line_number()} [{self.shared_recurrence}] [{eq_recurrence}]')
-        print_display(f'{line_number()} [{other.shared_recurrence}] [{eq_recurrence}]')
-        eq_reminder = self.shared_reminder_minutes == other.shared_reminder_minutes
-        print_display(f'{line_number()} [{self.shared_reminder_minutes}]')
-        print_display(f'{line_number()} [{other.shared_reminder_minutes}]')
-        eq_visibility = self.shared_visibility == other.shared_visibility
-        print_display(f'{line_number()} [{self.shared_visibility}]')
-        print_display(f'{line_number()} [{other.shared_visibility}]')
-        eq_status = self.shared_status == other.shared_status
-        print_display(f'{line_number()} [{self.shared_status}]')
-        print_display(f'{line_number()} [{other.shared_status}]')
-        eq_result = eq_subject and eq_description and eq_location and eq_start_date and eq_end_date and eq_recurrence and eq_reminder and eq_visibility and eq_status
+        for field_name in self._COMPARED_FIELDS:
+            if not self._field_equal(field_name,
+                                     getattr(self,
+                                             field_name),
+                                     getattr(other,
+                                             field_name)):
+                return False
+        return True
+
+    def diff(self,
+             other: 'CalendarInstance') -> list:
+        """Return [(field, this value, other value)] for every shared field that differs; meant for debug logging."""
+        differences = list()
+        for field_name in self._COMPARED_FIELDS:
+            value_one = getattr(self,
+                                field_name)
+            value_two = getattr(other,
+                                field_name)
+            if not self._field_equal(field_name,
+                                     value_one,
+                                     value_two):
+                differences.append((field_name,
+                                    value_one,
+                                    value_two))
+        return differences
+
+    def print_diff(self,
+                   other: 'CalendarInstance'):
+        if not constants.DEBUG_MODE:
+            return
+        differences = self.diff(other)
         print_underline()
-        print_display(f'{line_number()} SUB[{eq_subject}] DES[{eq_description}] LOC[{eq_location}] STD[{eq_start_date}] END[{eq_end_date}] REC[{eq_recurrence}] REM[{eq_reminder}] VIS[{eq_visibility}] STA[{eq_status}] | [RES[{eq_result}]]')
+        for field_name, value_one, value_two in differences:
+            print_display(f'{line_number()} {field_name}: [{value_one}] <=> [{value_two}]')
+        print_display(f'{line_number()} [{len(differences)}] differing field(s)')
         print_overline()
-        return eq_result
 
     '''
     def _normalized_attendees(self):
@@ -160,7 +198,9 @@ class CalendarInstance:
                                             False)})
         '''
         if 'recurrence' in g_calendar_event:
-            self.shared_recurrence = g_calendar_event['recurrence'][0]
+            # the list may also carry EXDATE/RDATE lines; the RRULE is the shared part
+            g_calendar_rules = [g_calendar_rule for g_calendar_rule in g_calendar_event['recurrence'] if g_calendar_rule.upper().startswith('RRULE')]
+            self.shared_recurrence = g_calendar_rules[0] if g_calendar_rules else g_calendar_event['recurrence'][0]
         # BUG B FIX: the original code used .get('overrides', [{}])[0] which
         # raises IndexError when the API returns overrides as an explicitly
         # empty list [].  Extract the list first and index only when non-empty.
@@ -176,23 +216,12 @@ class CalendarInstance:
                                                       'public')
         self.shared_status = g_calendar_event.get('status',
                                                   'confirmed')
-        self.g_calendar_only = {calendar_key: calendar_value for calendar_key, calendar_value in g_calendar_event.items() if calendar_key not in ['iCalUID',
-                                                                                                                                                  'summary',
-                                                                                                                                                  'description',
-                                                                                                                                                  'location',
-                                                                                                                                                  'start',
-                                                                                                                                                  'end',
-
-                                                                                                                                                  # 'organizer',
-                                                                                                                                                  # 'attendees',
-
-                                                                                                                                                  'recurrence',
-                                                                                                                                                  'reminders',
-                                                                                                                                                  'visibility',
-                                                                                                                                                  'status']}
-
-    def export_g_calendar(self) -> dict:
-        local_timezone = tzlocal.get_localzone_name()
+        self.g_calendar_only = {calendar_key: calendar_value for calendar_key, calendar_value in g_calendar_event.items() if calendar_key not in _G_CALENDAR_SHARED_KEYS}
+
+    def export_g_calendar(self,
+                          local_timezone: str = None) -> dict:
+        if local_timezone is None:
+            local_timezone = tzlocal.get_localzone_name()
         g_calendar_event = {
                 'iCalUID'    : self.shared_uid,
                 'summary'    : self.shared_subject,
@@ -204,10 +233,10 @@ class CalendarInstance:
                 'end'        : {
                         'dateTime': self.shared_end_date,
                         'timeZone': local_timezone},
-        '''        
-                'organizer'  : {
-                        'email': self.shared_organizer},
-        '''        
+
+                # 'organizer'  : {
+                #         'email': self.shared_organizer},
+
                 'reminders'  : {
                         'useDefault': False,
                         'overrides' : [{
@@ -249,101 +278,15 @@ class CalendarInstance:
                         'optional': True})
         '''
         if ms_outlook_event.get('IsRecurring'):
-            # FIX: added type 6 (olRecursYearNth) which was missing entirely
-            # and would have fallen through to the 'DAILY' default
-            frequency_map = {
-                    0: 'DAILY',
-                    1: 'WEEKLY',
-                    2: 'MONTHLY',
-                    3: 'MONTHLY',
-                    5: 'YEARLY',
-                    6: 'YEARLY'}
-            recurrence_type = ms_outlook_event.get('recurrence_type', 0)
-            recurrence_frequency = frequency_map.get(recurrence_type, 'DAILY')
-            recurrence_interval = ms_outlook_event.get('recurrence_interval',
-                                                       1)
-            recurrence_until = ms_outlook_event.get('recurrence_end')
-            recurrence_until_string = None
-            if recurrence_until:
-                try:
-                    recurrence_until_date = datetime.strptime(recurrence_until,
-                                                              '%Y-%m-%d')
-                    recurrence_until_string = recurrence_until_date.strftime('%Y%m%dT235959Z')
-                except ValueError:
-                    recurrence_until_string = recurrence_until.replace('-',
-                                                                       '') + 'T235959Z'
-            recurrence_rule = f'RRULE:FREQ={recurrence_frequency};INTERVAL={recurrence_interval}'
-            # FIX: for weekly recurrences, append BYDAY so Google Calendar
-            # knows exactly which days of the week the event repeats on.
-            # Without this, a Mon-Fri recurrence would be treated as
-            # repeating only on the start date's weekday.            
-            day_mask = ms_outlook_event.get('recurrence_day_of_week_mask', 0)
-            recurrence_instance = ms_outlook_event.get('recurrence_instance', 0)
-            recurrence_month_of_year = ms_outlook_event.get('recurrence_month_of_year', 0)
-
-            if recurrence_frequency == 'WEEKLY':
-                # FIX: weekly — append BYDAY so Google Calendar knows which
-                # days the event repeats on (e.g. Mon-Fri).
-                # Without this a Mon-Fri pattern appears as a single-day weekly.
-                if day_mask:
-                    byday = _day_mask_to_byday(day_mask)
-                    if byday:
-                        recurrence_rule += f';BYDAY={byday}'
-            # FIX END
-            elif recurrence_frequency == 'MONTHLY' and recurrence_type == 3:
-                # FIX: monthly-nth (olRecursMonthNth) — "Nth weekday of month"
-                # e.g. "3rd Thursday" needs BYDAY=TH and BYSETPOS=3.
-                # Plain monthly (type 2) needs neither; the date is in start.
-                if day_mask:
-                    byday = _day_mask_to_byday(day_mask)
-                    bysetpos = _OL_INSTANCE_TO_BYSETPOS.get(recurrence_instance, recurrence_instance)
-                    if byday:
-                        recurrence_rule += f';BYDAY={byday};BYSETPOS={bysetpos}'
-
-            elif recurrence_frequency == 'YEARLY':
-                # FIX: both yearly types need BYMONTH so Google Calendar
-                # knows which month of the year the event falls in.
-                if recurrence_month_of_year:
-                    recurrence_rule += f';BYMONTH={recurrence_month_of_year}'
-                if recurrence_type == 6:
-                    # FIX: yearly-nth (olRecursYearNth) also needs BYDAY and
-                    # BYSETPOS — e.g. "last Friday of November"
-                    if day_mask:
-                        byday = _day_mask_to_byday(day_mask)
-                        bysetpos = _OL_INSTANCE_TO_BYSETPOS.get(recurrence_instance, recurrence_instance)
-                        if byday:
-                            recurrence_rule += f';BYDAY={byday};BYSETPOS={bysetpos}'
-
-            if recurrence_until_string:
-                recurrence_rule += f';UNTIL={recurrence_until_string}'
-            self.shared_recurrence = recurrence_rule
+            # Outlook pattern fields => canonical RRULE (see RecurrenceRule.from_ms_outlook)
+            self.shared_recurrence = RecurrenceRule.from_ms_outlook(ms_outlook_event).to_rrule()
         self.shared_reminder_minutes = ms_outlook_event.get('ReminderMinutesBeforeStart',
                                                             15)
         self.shared_visibility = 'public' if ms_outlook_event.get('Sensitivity',
                                                                   0) == 0 else 'private'
         self.shared_status = 'confirmed' if ms_outlook_event.get('BusyStatus',
                                                                  2) == 2 else 'tentative'
-        self.ms_outlook_only = {item_key: item_value for item_key, item_value in ms_outlook_event.items() if item_key not in ['GlobalAppointmentID',
-                                                                                                                              'Subject',
-                                                                                                                              'Body',
-                                                                                                                              'Location',
-                                                                                                                              'StartUTC',
-                                                                                                                              'EndUTC',
-
-                                                                                                                              # 'Organizer',
-                                                                                                                              # 'RequiredAttendees',
-                                                                                                                              # 'OptionalAttendees',
-
-                                                                                                                              'IsRecurring',
-                                                                                                                              'recurrence_type',
-                                                                                                                              'recurrence_interval',
-                                                                                                                              'recurrence_day_of_week_mask',
-                                                                                                                              'recurrence_instance',
-                                                                                                                              'recurrence_month_of_year',
-                                                                                                                              'recurrence_end',
-                                                                                                                              'ReminderMinutesBeforeStart',
-                                                                                                                              'Sensitivity',
-                                                                                                                              'BusyStatus']}
+        self.ms_outlook_only = {item_key: item_value for item_key, item_value in ms_outlook_event.items() if item_key not in _MS_OUTLOOK_SHARED_KEYS}
 
     def export_ms_outlook(self) -> dict:
         ms_outlook_export_event = {
@@ -369,61 +312,58 @@ class CalendarInstance:
             ms_outlook_export_event['OptionalAttendees'] = ';'.join(optional_attendees)
         '''
         if self.shared_recurrence:
-            recurrence_rule = self.shared_recurrence
-
-            # FIX: determine recurrence_type more precisely now that we
-            # distinguish type 3 (monthly-nth) and type 6 (yearly-nth)
-            has_byday = 'BYDAY=' in recurrence_rule
-            has_bysetpos = 'BYSETPOS=' in recurrence_rule
-            has_bymonth = 'BYMONTH=' in recurrence_rule
-
-            if 'FREQ=DAILY' in recurrence_rule:
-                ms_outlook_export_event['recurrence_type'] = 0
-            elif 'FREQ=WEEKLY' in recurrence_rule:
-                ms_outlook_export_event['recurrence_type'] = 1
-            elif 'FREQ=MONTHLY' in recurrence_rule:
-                # type 3 = monthly-nth (has BYDAY+BYSETPOS); type 2 = plain monthly
-                ms_outlook_export_event['recurrence_type'] = 3 if (has_byday and has_bysetpos) else 2
-            elif 'FREQ=YEARLY' in recurrence_rule:
-                # type 6 = yearly-nth (has BYDAY+BYSETPOS); type 5 = plain yearly
-                ms_outlook_export_event['recurrence_type'] = 6 if (has_byday and has_bysetpos) else 5
-            else:
-                ms_outlook_export_event['recurrence_type'] = 0
-
-            if 'INTERVAL=' in recurrence_rule:
-                ms_outlook_export_event['recurrence_interval'] = int(recurrence_rule.split('INTERVAL=')[1].split(';')[0])
-            if 'UNTIL=' in recurrence_rule:
-                recurrence_until = recurrence_rule.split('UNTIL=')[1].split(';')[0]
-                recurrence_until_date = parser.parse(recurrence_until)
-                recurrence_until_date = recurrence_until_date.date()
-                ms_outlook_export_event['recurrence_end'] = recurrence_until_date.strftime('%Y-%m-%d')
-            # FIX: parse BYDAY from the RRULE and convert back to an Outlook
-            # DayOfWeekMask so that weekly patterns written to Outlook
-            # preserve the correct days of the week.
-            # FIX: parse BYDAY back to DayOfWeekMask for weekly (type 1),
-            # monthly-nth (type 3), and yearly-nth (type 6)
-            if has_byday:
-                byday_value = recurrence_rule.split('BYDAY=')[1].split(';')[0]
-                day_mask = _byday_to_day_mask(byday_value)
-                if day_mask:
-                    ms_outlook_export_event['recurrence_day_of_week_mask'] = day_mask
-            # FIX END
-            # FIX: parse BYSETPOS back to Outlook Instance for monthly-nth
-            # (type 3) and yearly-nth (type 6); iCalendar -1 maps to
-            # Outlook Instance 5 meaning "last"
-            if has_bysetpos:
-                bysetpos_raw = int(recurrence_rule.split('BYSETPOS=')[1].split(';')[0])
-                ol_instance = _BYSETPOS_TO_OL_INSTANCE.get(bysetpos_raw, bysetpos_raw)
-                ms_outlook_export_event['recurrence_instance'] = ol_instance
-
-            # FIX: parse BYMONTH back to MonthOfYear for yearly (type 5)
-            # and yearly-nth (type 6)
-            if has_bymonth:
-                ms_outlook_export_event['recurrence_month_of_year'] = int(recurrence_rule.split('BYMONTH=')[1].split(';')[0])
+            recurrence_rule = self.shared_recurrence[0] if isinstance(self.shared_recurrence,
+                                                                      list) else self.shared_recurrence
+            # RRULE => Outlook pattern fields (see RecurrenceRule.to_ms_outlook)
+            ms_outlook_export_event.update(RecurrenceRule.parse(recurrence_rule).to_ms_outlook())
 
         ms_outlook_export_event.update(self.ms_outlook_only)
         return ms_outlook_export_event
 
+    @classmethod
+    def import_many(cls,
+                    events: dict,
+                    side: EventSide) -> dict:
+        """Convert a whole {event_id: event} snapshot from one side in a single pass."""
+        import_event = cls.import_ms_outlook if side == EventSide.MS_OUTLOOK else cls.import_g_calendar
+        calendar_instances = dict()
+        for event_id, event_data in events.items():
+            calendar_instance = cls()
+            import_event(calendar_instance,
+                         event_data)
+            calendar_instances[event_id] = calendar_instance
+        return calendar_instances
+
+    @staticmethod
+    def export_many(calendar_instances: dict,
+                    side: EventSide) -> dict:
+        """Export {event_id: CalendarInstance} to one side, resolving the local timezone once."""
+        if side == EventSide.MS_OUTLOOK:
+            return {event_id: calendar_instance.export_ms_outlook() for event_id, calendar_instance in calendar_instances.items()}
+        local_timezone = tzlocal.get_localzone_name()
+        return {event_id: calendar_instance.export_g_calendar(local_timezone) for event_id, calendar_instance in calendar_instances.items()}
+
+    def fingerprint(self) -> str:
+        """Stable hash of the normalized shared fields, used to detect edits between sync cycles."""
+        start_date = to_utc_datetime(self.shared_start_date)
+        end_date = to_utc_datetime(self.shared_end_date)
+        description = (self.shared_description or '').replace('\r\n',
+                                                               '\n').strip()
+        recurrence = self.shared_recurrence[0] if isinstance(self.shared_recurrence,
+                                                             list) else self.shared_recurrence
+        fingerprint_fields = [(self.shared_subject or '').strip(),
+                              description[:_FINGERPRINT_DESCRIPTION_LENGTH],
+                              (self.shared_location or '').strip(),
+                              start_date.isoformat() if start_date else None,
+                              end_date.isoformat() if end_date else None,
+                              RecurrenceRule.parse(recurrence).to_rrule() if recurrence else None,
+                              int(self.shared_reminder_minutes or 0),
+                              self.shared_visibility,
+                              self.shared_status]
+        return hashlib.sha1(json.dumps(fingerprint_fields,
+                                       sort_keys=True,
+                                       default=str).encode('utf-8')).hexdigest()
+
     def to_dict(self) -> dict:
         return {
                 'shared_uid'             : self.shared_uid,
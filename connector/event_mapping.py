@@ -1,14 +1,21 @@
 import json
 import os
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
 from enum import Enum
 from pathlib import Path
 from threading import Lock
 from typing import Optional
 from typing import Tuple
 
+import system.constants as constants
+from system.tools import extract_date_id
 from system.tools import line_number
 from system.tools import print_box
 from system.tools import print_display
+from system.tools import to_utc_datetime
 from system.tools import utc_now
 
 
@@ -24,9 +31,16 @@ class EventMapping:
         base_dir = Path(__file__).resolve().parent.parent
         database_dir = (base_dir / 'resources' / 'database').resolve()
         self.event_map_file = str(database_dir / 'event_map.json')
+        self.event_map_archive_file = str(database_dir / 'event_map_archive.jsonl')
         self._lock = Lock()
+        # batch() nesting depth and whether a save was deferred inside it
+        self._batch_depth = 0
+        self._batch_dirty = False
         self._ensure_directory()
+        # modification time of the file as this instance last read or wrote it
+        self._map_mtime: float | None = None
         self.event_map = self._load_map()
+        self._map_mtime = self._file_mtime()
 
     def _ensure_directory(self):
         event_map_directory = os.path.dirname(self.event_map_file)
@@ -38,11 +52,30 @@ class EventMapping:
         return {
                 'single_events'     : {},
                 'single_events_meta': {},
+                'single_events_date': {},
+                'fingerprints'      : {},
                 'recurrent_events'  : {},
                 'metadata'          : {
                         'version'  : self.VERSION,
                         'last_sync': utc_now()}}
 
+    def _file_mtime(self) -> float | None:
+        try:
+            return os.path.getmtime(self.event_map_file)
+        except OSError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        """Re-read the file when another process (reset_data.py) wrote it since this instance
+        last did, so a long-lived instance never saves over it."""
+        with self._lock:
+            if self._batch_depth or self._file_mtime() == self._map_mtime:
+                return False
+            self.event_map = self._load_map()
+            self._map_mtime = self._file_mtime()
+        print_display(f'{line_number()} Event mapping changed on disk: reloaded')
+        return True
+
     def _load_map(self) -> dict:
         if not os.path.exists(self.event_map_file):
             return self._get_default_structure()
@@ -56,6 +89,12 @@ class EventMapping:
                 # migrate existing maps that predate single_events_meta
                 if 'single_events_meta' not in data:
                     data['single_events_meta'] = dict()
+                # migrate existing maps that predate single_events_date
+                if 'single_events_date' not in data:
+                    data['single_events_date'] = dict()
+                # migrate existing maps that predate fingerprints
+                if 'fingerprints' not in data:
+                    data['fingerprints'] = dict()
                 return data
         except (json.JSONDecodeError,
                 IOError) as errors:
@@ -66,7 +105,24 @@ class EventMapping:
             print_display(f'{line_number()} Warning: Corrupted mapping file backed up to {backup_file}. Error: {errors}')
             return self._get_default_structure()
 
+    @contextmanager
+    def batch(self):
+        """Defer _save_map() until the outermost block ends, so a whole sync plan is written once."""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._batch_dirty:
+                    self._batch_dirty = False
+                    self._save_map()
+
     def _save_map(self):
+        if self._batch_depth:
+            self._batch_dirty = True
+            return
         temp_file = f'{self.event_map_file}.tmp'
         try:
             self.event_map['metadata']['last_sync'] = utc_now()
@@ -85,6 +141,7 @@ class EventMapping:
                          0o666)
             os.replace(temp_file,
                        self.event_map_file)
+            self._map_mtime = self._file_mtime()
         except Exception as exception:
             if os.path.exists(temp_file):
                 try:
@@ -153,7 +210,8 @@ class EventMapping:
     def insert_instance(self,
                         ms_outlook_id: str,
                         g_calendar_id: str,
-                        instance_name: str = None) -> bool:
+                        instance_name: str = None,
+                        instance_end=None) -> bool:
         with self._lock:
             print_box(f'{line_number()} [EVENT MAPPING] inserting instance: [{ms_outlook_id}]')
             single_events = self.event_map['single_events']
@@ -162,6 +220,10 @@ class EventMapping:
             single_events[ms_outlook_id] = g_calendar_id
             if instance_name:
                 self.event_map['single_events_meta'][ms_outlook_id] = f'[{instance_name}]'
+            # single event IDs carry no date, so keep the end date for compact_map()
+            instance_end_utc = to_utc_datetime(instance_end)
+            if instance_end_utc:
+                self.event_map['single_events_date'][ms_outlook_id] = instance_end_utc.isoformat()
             self._save_map()
             return True
 
@@ -201,12 +263,18 @@ class EventMapping:
             print_box(f'{line_number()} [EVENT MAPPING] removing instance: [{event_id}]')
             single_events = self.event_map['single_events']
             single_events_meta = self.event_map['single_events_meta']
+            single_events_date = self.event_map['single_events_date']
+            fingerprints = self.event_map['fingerprints']
             side = self._identify_side(event_id,
                                        single_events)
             if side == EventSide.MS_OUTLOOK:
                 del single_events[event_id]
                 single_events_meta.pop(event_id,
                                        None)
+                single_events_date.pop(event_id,
+                                       None)
+                fingerprints.pop(event_id,
+                                 None)
                 self._save_map()
                 return True
             elif side == EventSide.G_CALENDAR:
@@ -215,10 +283,39 @@ class EventMapping:
                         del single_events[ms_outlook_id]
                         single_events_meta.pop(ms_outlook_id,
                                                None)
+                        single_events_date.pop(ms_outlook_id,
+                                               None)
+                        fingerprints.pop(ms_outlook_id,
+                                         None)
                         self._save_map()
                         return True
             return False
 
+    def get_fingerprint(self,
+                        ms_outlook_id: str) -> Optional[dict]:
+        with self._lock:
+            fingerprint = self.event_map['fingerprints'].get(ms_outlook_id)
+            return dict(fingerprint) if fingerprint else None
+
+    def set_fingerprint(self,
+                        ms_outlook_id: str,
+                        ms_outlook_fingerprint: str = None,
+                        g_calendar_fingerprint: str = None) -> bool:
+        """Store the per-side content hash of a mapped single event; None keeps the stored side."""
+        with self._lock:
+            if ms_outlook_id not in self.event_map['single_events']:
+                return False
+            fingerprint = self.event_map['fingerprints'].setdefault(ms_outlook_id,
+                                                                    {
+                                                                            EventSide.MS_OUTLOOK.value: None,
+                                                                            EventSide.G_CALENDAR.value: None})
+            if ms_outlook_fingerprint:
+                fingerprint[EventSide.MS_OUTLOOK.value] = ms_outlook_fingerprint
+            if g_calendar_fingerprint:
+                fingerprint[EventSide.G_CALENDAR.value] = g_calendar_fingerprint
+            self._save_map()
+            return True
+
     def remove_g_calendar_recurrence(self,
                                      g_calendar_instance_id: str) -> bool:
         with self._lock:
@@ -245,7 +342,9 @@ class EventMapping:
             return False
 
     def remove_generic_occurrence(self,
-                                  generic_instance_id: str) -> bool:
+                                  generic_instance_id: str,
+                                  keep_master: bool = False) -> bool:
+        # keep_master: in master-level recurrence mode a series legitimately has no occurrences mapped
         with self._lock:
             print_box(f'{line_number()} [EVENT MAPPING] removing generic: [{generic_instance_id}]')
             recurrent_events = self.event_map['recurrent_events']
@@ -263,7 +362,7 @@ class EventMapping:
                 if side == EventSide.MS_OUTLOOK:
                     if generic_instance_id in ms_outlook_instances:
                         del ms_outlook_instances[generic_instance_id]
-                        if not ms_outlook_instances:
+                        if not ms_outlook_instances and not keep_master:
                             del recurrent_events[ms_outlook_master_id]
                         self._save_map()
                         return True
@@ -271,8 +370,94 @@ class EventMapping:
                     for ms_outlook_instance_id, g_calendar_instance_id in list(ms_outlook_instances.items()):
                         if g_calendar_instance_id == generic_instance_id:
                             del ms_outlook_instances[ms_outlook_instance_id]
-                            if not ms_outlook_instances:
+                            if not ms_outlook_instances and not keep_master:
                                 del recurrent_events[ms_outlook_master_id]
                             self._save_map()
                             return True
             return False
+
+    def _archive_entries(self,
+                         archived_entries: list):
+        if not archived_entries:
+            return
+        archived_at = utc_now()
+        try:
+            with open(self.event_map_archive_file,
+                      'a',
+                      encoding='utf-8') as archive_writer:
+                for archived_entry in archived_entries:
+                    archived_entry['archived_at'] = archived_at
+                    archive_writer.write(json.dumps(archived_entry,
+                                                    ensure_ascii=False) + '\n')
+        except OSError as os_error:
+            print_display(f'{line_number()} Warning: could not archive compacted mapping entries: [{os_error}]')
+
+    def compact_map(self,
+                    retention_days: int = None,
+                    force: bool = False) -> dict:
+        """Remove entries whose dates fell before DAY_PAST + retention_days.
+
+        Occurrence dates come from the Google instance ID suffix (or the
+        Outlook date ID), single events from single_events_date.  Recurrent
+        masters are kept even when all their occurrences are gone, since the
+        copy phases would otherwise insert the series again.  Runs at most
+        once per UTC day unless force is set.
+        """
+        if retention_days is None:
+            retention_days = constants.MAP_RETENTION_DAYS
+        compact_report = {
+                'single_events'  : 0,
+                'occurrences'    : 0,
+                'bytes_reclaimed': 0,
+                'skipped'        : False}
+        with self._lock:
+            metadata = self.event_map['metadata']
+            time_now = datetime.now(timezone.utc)
+            if not force and metadata.get('last_compaction', '')[:10] == time_now.date().isoformat():
+                compact_report['skipped'] = True
+                return compact_report
+            cutoff = time_now - timedelta(days=constants.DAY_PAST + retention_days)
+            archived_entries = list()
+
+            single_events = self.event_map['single_events']
+            single_events_meta = self.event_map['single_events_meta']
+            single_events_date = self.event_map['single_events_date']
+            for ms_outlook_id, end_date in list(single_events_date.items()):
+                end_date_utc = to_utc_datetime(end_date)
+                if end_date_utc is None or end_date_utc >= cutoff:
+                    continue
+                archived_entries.append({
+                        'section'      : 'single_events',
+                        'ms_outlook_id': ms_outlook_id,
+                        'g_calendar_id': single_events.pop(ms_outlook_id,
+                                                           None),
+                        'instance_name': single_events_meta.pop(ms_outlook_id,
+                                                                None),
+                        'end_date'     : single_events_date.pop(ms_outlook_id)})
+                self.event_map['fingerprints'].pop(ms_outlook_id,
+                                                   None)
+                compact_report['single_events'] += 1
+
+            for ms_outlook_master_id, ms_outlook_data in self.event_map['recurrent_events'].items():
+                ms_outlook_instances = ms_outlook_data['instances']
+                for ms_outlook_instance_id, g_calendar_instance_id in list(ms_outlook_instances.items()):
+                    instance_date = extract_date_id(g_calendar_instance_id) or extract_date_id(ms_outlook_instance_id)
+                    if instance_date is None or instance_date >= cutoff:
+                        continue
+                    del ms_outlook_instances[ms_outlook_instance_id]
+                    archived_entries.append({
+                            'section'             : 'recurrent_events',
+                            'ms_outlook_master_id': ms_outlook_master_id,
+                            'ms_outlook_id'       : ms_outlook_instance_id,
+                            'g_calendar_id'       : g_calendar_instance_id})
+                    compact_report['occurrences'] += 1
+
+            metadata['last_compaction'] = time_now.replace(tzinfo=None).isoformat()
+            if archived_entries:
+                compact_report['bytes_reclaimed'] = sum(len(json.dumps(archived_entry,
+                                                                       ensure_ascii=False)) for archived_entry in archived_entries)
+                if constants.MAP_ARCHIVE_ENABLED:
+                    self._archive_entries(archived_entries)
+            self._save_map()
+        print_box(f'{line_number()} [EVENT MAPPING] compaction before [{cutoff.date()}]: single events [{compact_report["single_events"]}] occurrences [{compact_report["occurrences"]}] reclaimed [~{compact_report["bytes_reclaimed"]:,} bytes]')
+        return compact_report
@@ -1,6 +1,7 @@
 import os
 import socket
 import ssl
+import threading
 import time
 from datetime import datetime
 from functools import wraps
@@ -13,7 +14,10 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+import system.constants as constants
 from connector.event_mapping import EventMapping
+from system.recurrence_rule import RecurrenceRule
+from system.sync_window import SyncWindow
 from system.tools import convert_object_to_string
 from system.tools import get_master_id
 from system.tools import line_number
@@ -40,6 +44,33 @@ _MAX_RETRIES = 10
 _RETRY_BASE_DELAY = 2.0
 
 
+class _RequestThrottle:
+    """Spaces Google API requests across all threads to stay under the per-user quota.
+
+    The rate is read from G_CALENDAR_REQUESTS_PER_SECOND on every request, so
+    a value loaded from the settings after this module was imported applies.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        requests_per_second = constants.G_CALENDAR_REQUESTS_PER_SECOND
+        if requests_per_second <= 0:
+            return
+        with self._lock:
+            time_now = time.monotonic()
+            time_slot = max(time_now,
+                            self._next_slot)
+            self._next_slot = time_slot + 1.0 / requests_per_second
+        if time_slot > time_now:
+            time.sleep(time_slot - time_now)
+
+
+_g_calendar_throttle = _RequestThrottle()
+
+
 def _google_api_retry(func):
     @wraps(func)
     def wrapper(*args,
@@ -47,6 +78,7 @@ def _google_api_retry(func):
         delay = _RETRY_BASE_DELAY
         for attempt in range(1,
                              _MAX_RETRIES + 1):
+            _g_calendar_throttle.wait()
             try:
                 return func(*args,
                             **kwargs)
@@ -78,13 +110,30 @@ class GoogleCalendarHelper:
         self.g_calendar_token = str(credentials_dir / 'token.json')
         self.g_calendar_credentials = str(credentials_dir / 'credentials.json')
         self.g_calendar_scopes = ['https://www.googleapis.com/auth/calendar']
-        self.g_calendar_service = self.get_google_service()
+        # httplib2 is not thread-safe: credentials are shared, the service object is built per thread
+        self.g_calendar_oauth_credentials = self.get_google_credentials()
+        self._g_calendar_local = threading.local()
 
         # self.g_calendar_token = f'{credentials_dir}/token.json'
 
         # self.g_calendar_credentials = f'{credentials_dir}/credentials.json'
 
+    @property
+    def g_calendar_service(self):
+        g_calendar_service = getattr(self._g_calendar_local,
+                                     'service',
+                                     None)
+        if g_calendar_service is None:
+            g_calendar_service = self.get_google_service()
+            self._g_calendar_local.service = g_calendar_service
+        return g_calendar_service
+
     def get_google_service(self):
+        return build('calendar',
+                     'v3',
+                     credentials=self.g_calendar_oauth_credentials)
+
+    def get_google_credentials(self):
         g_calendar_credentials = None
         if os.path.exists(self.g_calendar_token):
             g_calendar_credentials = Credentials.from_authorized_user_file(self.g_calendar_token,
@@ -104,25 +153,68 @@ class GoogleCalendarHelper:
             with open(self.g_calendar_token,
                       self.g_calendar_write) as g_calendar_token_local:
                 g_calendar_token_local.write(g_calendar_credentials.to_json())
-        return build('calendar',
-                     'v3',
-                     credentials=g_calendar_credentials)
-
-    @_google_api_retry
-    def g_calendar_get_all_instances(self):
-        return self.g_calendar_service.events().list(calendarId=self.g_calendar_id,
-                                                     timeMin=time_min(),
-                                                     timeMax=time_max(),
-                                                     maxResults=2500,
-                                                     singleEvents=False).execute()
+        return g_calendar_credentials
 
     @_google_api_retry
-    def g_calendar_get_all_sub_instances(self):
+    def _g_calendar_list_page(self,
+                              **list_arguments):
         return self.g_calendar_service.events().list(calendarId=self.g_calendar_id,
-                                                     timeMin=time_min(),
-                                                     timeMax=time_max(),
-                                                     maxResults=2500,
-                                                     singleEvents=True).execute()
+                                                     **list_arguments).execute()
+
+    def g_calendar_list_all_pages(self,
+                                  **list_arguments):
+        # a single list call stops at maxResults; follow nextPageToken so
+        # a snapshot is never silently truncated
+        g_calendar_items = list()
+        g_calendar_page = self._g_calendar_list_page(**list_arguments)
+        g_calendar_items.extend(g_calendar_page.get('items',
+                                                    []))
+        while g_calendar_page.get('nextPageToken'):
+            g_calendar_page = self._g_calendar_list_page(pageToken=g_calendar_page['nextPageToken'],
+                                                         **list_arguments)
+            g_calendar_items.extend(g_calendar_page.get('items',
+                                                        []))
+        g_calendar_page['items'] = g_calendar_items
+        return g_calendar_page
+
+    def g_calendar_get_all_instances(self,
+                                     show_deleted=False,
+                                     sync_window: SyncWindow = None):
+        return self.g_calendar_list_all_pages(timeMin=sync_window.time_min() if sync_window else time_min(),
+                                              timeMax=sync_window.time_max() if sync_window else time_max(),
+                                              maxResults=2500,
+                                              singleEvents=False,
+                                              showDeleted=show_deleted)
+
+    def g_calendar_get_all_sub_instances(self,
+                                         show_deleted=False,
+                                         sync_window: SyncWindow = None):
+        # with singleEvents and showDeleted, cancelled occurrences of a series
+        # come back in the same listing with status 'cancelled'
+        return self.g_calendar_list_all_pages(timeMin=sync_window.time_min() if sync_window else time_min(),
+                                              timeMax=sync_window.time_max() if sync_window else time_max(),
+                                              maxResults=2500,
+                                              singleEvents=True,
+                                              showDeleted=show_deleted)
+
+    def g_calendar_get_changed_instances(self,
+                                         updated_min: str):
+        # no time bounds: an event moved out of the window comes back too;
+        # deleted events are always included once updatedMin is set
+        return self.g_calendar_list_all_pages(updatedMin=updated_min,
+                                              maxResults=2500,
+                                              singleEvents=False,
+                                              showDeleted=True)
+
+    def g_calendar_has_changes(self,
+                               updated_min: str) -> bool:
+        # one item, ids only: whether anything at all changed or went since updated_min
+        g_calendar_page = self._g_calendar_list_page(updatedMin=updated_min,
+                                                     maxResults=1,
+                                                     singleEvents=False,
+                                                     showDeleted=True,
+                                                     fields='items(id)')
+        return bool(g_calendar_page.get('items'))
 
     @_google_api_retry
     def g_calendar_get_single_instance(self,
@@ -190,6 +282,38 @@ class GoogleCalendarHelper:
                                                        eventId=g_calendar_instance_id,
                                                        body=convert_object_to_string(g_calendar_instance_body)).execute()
 
+    @_google_api_retry
+    def patch_instance_g_calendar(self,
+                                  g_calendar_instance_id,
+                                  g_calendar_instance_body):
+        return self.g_calendar_service.events().patch(calendarId=self.g_calendar_id,
+                                                      eventId=g_calendar_instance_id,
+                                                      body=convert_object_to_string(g_calendar_instance_body)).execute()
+
+    @_google_api_retry
+    def g_calendar_watch(self,
+                         channel_id: str,
+                         channel_address: str,
+                         channel_token: str,
+                         channel_ttl: int):
+        # push notifications for the whole calendar; the response carries resourceId and expiration (ms)
+        return self.g_calendar_service.events().watch(calendarId=self.g_calendar_id,
+                                                      body={
+                                                              'id'     : channel_id,
+                                                              'type'   : 'web_hook',
+                                                              'address': channel_address,
+                                                              'token'  : channel_token,
+                                                              'params' : {
+                                                                      'ttl': str(channel_ttl)}}).execute()
+
+    @_google_api_retry
+    def g_calendar_stop_channel(self,
+                                channel_id: str,
+                                resource_id: str):
+        return self.g_calendar_service.channels().stop(body={
+                'id'        : channel_id,
+                'resourceId': resource_id}).execute()
+
     @_google_api_retry
     def delete_instance_g_calendar(self,
                                    g_calendar_instance_id):
@@ -229,9 +353,11 @@ class GoogleCalendarConnector:
             g_calendar_all_events[g_calendar_instance_id] = g_calendar_single_item
             if 'recurrence' in g_calendar_single_item:
                 for g_calendar_rule in g_calendar_single_item['recurrence']:
-                    if 'UNTIL=' in g_calendar_rule:
-                        g_calendar_rule_match = g_calendar_rule.split('UNTIL=')[1].split(';')[0].split('T')[0]
-                        g_calendar_instance_end_dates[g_calendar_instance_id] = g_calendar_rule_match
+                    if not g_calendar_rule.upper().startswith('RRULE'):
+                        continue
+                    g_calendar_rule_until = RecurrenceRule.parse(g_calendar_rule).until
+                    if g_calendar_rule_until:
+                        g_calendar_instance_end_dates[g_calendar_instance_id] = g_calendar_rule_until.split('T')[0]
                 g_calendar_instance_list = self.g_calendar_service.g_calendar_get_all_single_instances_inside_recurrence(g_calendar_instance_id)
                 for g_calendar_instance_list_item in g_calendar_instance_list.get('items',
                                                                                   []):
@@ -240,8 +366,33 @@ class GoogleCalendarConnector:
         self.g_calendar_event_end_dates = g_calendar_instance_end_dates
         return self.g_calendar_events
 
-    def get_all_sub_instances_g_calendar(self):
-        g_calendar_all_instances = self.g_calendar_service.g_calendar_get_all_sub_instances()
+    def get_all_masters_g_calendar(self,
+                                   include_cancelled=False,
+                                   sync_window: SyncWindow = None):
+        # singleEvents=False listing only: masters and single events, without
+        # the per-master instances() expansion done by get_all_instances_g_calendar;
+        # modified and (with include_cancelled) cancelled occurrences come back as exceptions
+        g_calendar_all_instances = self.g_calendar_service.g_calendar_get_all_instances(include_cancelled,
+                                                                                        sync_window)
+        return {g_calendar_single_item['id']: g_calendar_single_item for g_calendar_single_item in g_calendar_all_instances.get('items',
+                                                                                                                               [])}
+
+    def get_changed_g_calendar(self,
+                               updated_min: str) -> dict:
+        """Singles, masters and exceptions modified or deleted since updated_min, by id."""
+        g_calendar_changed_instances = self.g_calendar_service.g_calendar_get_changed_instances(updated_min)
+        return {g_calendar_single_item['id']: g_calendar_single_item for g_calendar_single_item in g_calendar_changed_instances.get('items',
+                                                                                                                                   [])}
+
+    def has_changes_g_calendar(self,
+                               updated_min: str) -> bool:
+        return self.g_calendar_service.g_calendar_has_changes(updated_min)
+
+    def get_all_sub_instances_g_calendar(self,
+                                         include_cancelled=False,
+                                         sync_window: SyncWindow = None):
+        g_calendar_all_instances = self.g_calendar_service.g_calendar_get_all_sub_instances(include_cancelled,
+                                                                                            sync_window)
         g_calendar_all_instances_items = g_calendar_all_instances.get('items',
                                                                       [])
         g_calendar_all_events = dict()
@@ -337,6 +488,13 @@ class GoogleCalendarConnector:
         return self.g_calendar_service.update_instance_g_calendar(g_calendar_instance_id,
                                                                   convert_object_to_string(g_calendar_instance_body))
 
+    def g_calendar_patch_instance(self,
+                                  g_calendar_instance_id,
+                                  g_calendar_instance_body):
+        print_display(f'{line_number()} [Google Calendar] PATCH [{trim_id(g_calendar_instance_id)}]')
+        return self.g_calendar_service.patch_instance_g_calendar(g_calendar_instance_id,
+                                                                 g_calendar_instance_body)
+
     def g_calendar_delete_instance(self,
                                    g_calendar_instance_id):
         print_display(f'{line_number()} [Google Calendar] DELETE [{trim_id(g_calendar_instance_id)}]')
@@ -12,15 +12,19 @@ import pywintypes
 import win32com.client
 
 import system.constants as constants
+from system.dirty_queue import ms_outlook_dirty_queue
+from system.sync_window import SyncWindow
 from system.tools import convert_com_object_to_dictionary
 from system.tools import create_date_id
 from system.tools import line_number
+from system.tools import outlook_local_to_utc
 from system.tools import print_box
 from system.tools import print_display
 from system.tools import print_overline
 from system.tools import print_underline
 from system.tools import release_com_object_memory
 from system.tools import trim_id
+from system.tools import utc_to_outlook_local
 
 # FIX: declare the known Outlook appointment property names once.
 # The original code called dir(item) on every COM object on every cycle,
@@ -37,6 +41,7 @@ _APPOINTMENT_PROPERTIES = (
     'GlobalAppointmentID',
     'IsOnlineMeeting',
     'IsRecurring',
+    'LastModificationTime',
     'Location',
     'MeetingStatus',
     'Mileage',
@@ -74,7 +79,16 @@ class MicrosoftOutlookConnector:
         self.ms_outlook_cache_file = str(database_dir / 'cache_time.json')
         self.ms_outlook_data = MicrosoftOutlookHelper()
         self.ms_outlook_cache = None
+        # masters are cached apart from instances: both listings used to share
+        # ms_outlook_cache, so whichever ran second got the other's result
+        self.ms_outlook_recurrence_cache = None
         self.ms_outlook_cache_time = 0
+        # full-window listings answered from the cache or read, and items a delta listing reused or read
+        self.cache_statistics = {
+                'listing_hits'  : 0,
+                'listing_misses': 0,
+                'items_reused'  : 0,
+                'items_read'    : 0}
         self.load_cache()
 
     def set_cache(self):
@@ -114,14 +128,34 @@ class MicrosoftOutlookConnector:
         so the next read fetches fresh data instead of returning stale results
         that are missing the just-written change."""
         self.ms_outlook_cache = None
+        self.ms_outlook_recurrence_cache = None
         self.ms_outlook_cache_time = 0
 
+    def invalidate_cache(self):
+        """Drop the cached listings, for a cycle started because Outlook itself changed."""
+        self._invalidate_cache()
+
+    def _use_cache(self,
+                   ms_outlook_cache,
+                   sync_window: SyncWindow = None) -> bool:
+        # only the full window is cached; a narrower tier is read fresh, that is its purpose
+        if sync_window is not None and not sync_window.full:
+            return False
+        use_cache = ms_outlook_cache is not None and self.ms_outlook_cache_time != 0 and time.monotonic() < self.ms_outlook_cache_time + constants.INTERVAL_SYNC_JOB
+        self.cache_statistics['listing_hits' if use_cache else 'listing_misses'] += 1
+        return use_cache
+
     def get_restriction(self,
                         ms_outlook_all_instances,
-                        include_recurrences=True):
-        time_now = datetime.now()
-        time_begin = time_now - timedelta(days=constants.DAY_PAST)
-        time_end = time_now + timedelta(days=constants.DAY_NEXT)
+                        include_recurrences=True,
+                        sync_window: SyncWindow = None):
+        if sync_window is not None:
+            time_begin = sync_window.ms_outlook_begin()
+            time_end = sync_window.ms_outlook_end()
+        else:
+            time_now = datetime.now()
+            time_begin = time_now - timedelta(days=constants.DAY_PAST)
+            time_end = time_now + timedelta(days=constants.DAY_NEXT)
         ms_outlook_all_instances.IncludeRecurrences = include_recurrences
         ms_outlook_all_instances.Sort('[Start]')
         restriction_string = "([Start] >= '{}' OR [End] >= '{}') AND [End] <= '{}'"
@@ -134,6 +168,37 @@ class MicrosoftOutlookConnector:
                             ms_outlook_instance_id):
         return convert_com_object_to_dictionary(self.ms_outlook_data.ms_outlook_get_item(ms_outlook_instance_id))
 
+    def item_exists_ms_outlook(self,
+                               ms_outlook_instance_id) -> bool:
+        """True when the item can still be opened and is not in a deleted items folder."""
+        ms_outlook_instance = None
+        try:
+            ms_outlook_instance = self.ms_outlook_data.ms_outlook_get_item(ms_outlook_instance_id)
+            return ms_outlook_instance.Parent.Name.lower() not in {'deleted items',
+                                                                   'itens excluídos',
+                                                                   'recoverable items',
+                                                                   'trash'}
+        except (pywintypes.com_error,
+                AttributeError):
+            return False
+        finally:
+            if ms_outlook_instance is not None:
+                release_com_object_memory(ms_outlook_instance)
+
+    def get_change_marker_ms_outlook(self) -> tuple[int, str]:
+        """(item count, latest LastModificationTime) of the calendar folder.
+
+        Adding or changing an item moves the time, deleting one the count, so an
+        unchanged marker means nothing in the calendar changed."""
+        ms_outlook_all_instances = self.ms_outlook_data.ms_outlook_get_all_instances()
+        ms_outlook_count = ms_outlook_all_instances.Count
+        ms_outlook_all_instances.Sort('[LastModificationTime]',
+                                      True)
+        ms_outlook_latest = ms_outlook_all_instances.GetFirst()
+        ms_outlook_latest_time = str(ms_outlook_latest.LastModificationTime) if ms_outlook_latest is not None else ''
+        release_com_object_memory(ms_outlook_all_instances)
+        return ms_outlook_count, ms_outlook_latest_time
+
     def get_occurrence_ms_outlook(self,
                                   ms_outlook_instance_id,
                                   ms_outlook_start_date):
@@ -245,13 +310,48 @@ class MicrosoftOutlookConnector:
                 continue
         return ms_outlook_instance_data
 
-    def get_all_instances_ms_outlook(self):
-        if self.ms_outlook_cache is not None and self.ms_outlook_cache_time != 0 and time.monotonic() < self.ms_outlook_cache_time + constants.INTERVAL_SYNC_JOB:
+    def read_instance_ms_outlook(self,
+                                 ms_outlook_instance):
+        # Same property set as the full listing, so fingerprints computed
+        # from a single re-read match the ones computed from a listing.
+        return self.get_instance_data_ms_outlook(ms_outlook_instance,
+                                                 _APPOINTMENT_PROPERTIES)
+
+    @staticmethod
+    def _reuse_known_instance(ms_outlook_instance,
+                              ms_outlook_known: dict) -> tuple[str, dict] | None:
+        # three property reads instead of the whole _APPOINTMENT_PROPERTIES set
+        try:
+            ms_outlook_entry_id = create_date_id(ms_outlook_instance.EntryID,
+                                                 ms_outlook_instance.StartUTC)
+            ms_outlook_known_data = ms_outlook_known.get(ms_outlook_entry_id)
+            if not ms_outlook_known_data or 'LastModificationTime' not in ms_outlook_known_data:
+                return None
+            if str(ms_outlook_known_data['LastModificationTime']) != str(ms_outlook_instance.LastModificationTime):
+                return None
+            return ms_outlook_entry_id, ms_outlook_known_data
+        except (pywintypes.com_error,
+                AttributeError):
+            return None
+
+    def get_all_instances_ms_outlook(self,
+                                     sync_window: SyncWindow = None,
+                                     ms_outlook_known: dict = None):
+        """Every item of the window, occurrences expanded, by date ID.
+
+        With ms_outlook_known (the previous listing), an item whose
+        LastModificationTime did not change is taken from it instead of being
+        read property by property; new, changed and newly entered items are read.
+        """
+        if self._use_cache(self.ms_outlook_cache,
+                           sync_window):
             print_box(f'{line_number()} [Microsoft Outlook] USING CACHE...')
             return self.ms_outlook_cache
         ms_outlook_all_instances = self.ms_outlook_data.ms_outlook_get_all_instances()
-        ms_outlook_selected_instances = self.get_restriction(ms_outlook_all_instances)
+        ms_outlook_selected_instances = self.get_restriction(ms_outlook_all_instances,
+                                                             sync_window=sync_window)
         ms_outlook_instances = dict()
+        ms_outlook_reused = 0
         print_display(f'{line_number()} [Microsoft Outlook] Getting instances...')
         for ms_outlook_index, ms_outlook_instance in enumerate(ms_outlook_selected_instances):
             ms_outlook_counter = f'{ms_outlook_index:,}'
@@ -267,6 +367,14 @@ class MicrosoftOutlookConnector:
                     continue
             except Exception:
                 pass
+            if ms_outlook_known:
+                ms_outlook_known_instance = self._reuse_known_instance(ms_outlook_instance,
+                                                                       ms_outlook_known)
+                if ms_outlook_known_instance is not None:
+                    ms_outlook_instances[ms_outlook_known_instance[0]] = ms_outlook_known_instance[1]
+                    ms_outlook_reused += 1
+                    release_com_object_memory(ms_outlook_instance)
+                    continue
             try:
                 # FIX: use the fixed property tuple instead of dir() to avoid
                 # expensive COM type-library interrogation on every item.
@@ -319,17 +427,25 @@ class MicrosoftOutlookConnector:
         # collected promptly.  The original comment-out caused wrappers to
         # accumulate across every sync cycle, gradually consuming memory.
         gc.collect()
-        self.ms_outlook_cache = ms_outlook_instances
-        self.set_cache()
+        if ms_outlook_known:
+            print_display(f'{line_number()} [Microsoft Outlook] unchanged since the last listing: [{ms_outlook_reused}] / read: [{len(ms_outlook_instances) - ms_outlook_reused}]')
+            self.cache_statistics['items_reused'] += ms_outlook_reused
+            self.cache_statistics['items_read'] += len(ms_outlook_instances) - ms_outlook_reused
+        if sync_window is None or sync_window.full:
+            self.ms_outlook_cache = ms_outlook_instances
+            self.set_cache()
         return ms_outlook_instances
 
-    def get_all_recurrences_ms_outlook(self):
-        if self.ms_outlook_cache is not None and self.ms_outlook_cache_time != 0 and time.monotonic() < self.ms_outlook_cache_time + constants.INTERVAL_SYNC_JOB:
+    def get_all_recurrences_ms_outlook(self,
+                                       sync_window: SyncWindow = None):
+        if self._use_cache(self.ms_outlook_recurrence_cache,
+                           sync_window):
             print_box(f'{line_number()} [Microsoft Outlook] USING CACHE...')
-            return self.ms_outlook_cache
+            return self.ms_outlook_recurrence_cache
         ms_outlook_all_instances = self.ms_outlook_data.ms_outlook_get_all_instances()
         ms_outlook_selected_instances = self.get_restriction(ms_outlook_all_instances,
-                                                             False)
+                                                             False,
+                                                             sync_window)
         ms_outlook_instances = dict()
         print_display(f'{line_number()} [Microsoft Outlook] Getting recurrences...')
         for ms_outlook_index, ms_outlook_instance in enumerate(ms_outlook_selected_instances):
@@ -369,8 +485,9 @@ class MicrosoftOutlookConnector:
             release_com_object_memory(ms_outlook_instance)
         # FIX: re-enable gc.collect() (same reason as get_all_instances)
         gc.collect()
-        self.ms_outlook_cache = ms_outlook_instances
-        self.set_cache()
+        if sync_window is None or sync_window.full:
+            self.ms_outlook_recurrence_cache = ms_outlook_instances
+            self.set_cache()
         return ms_outlook_instances
 
     def get_master_by_g_calendar_id(self,
@@ -444,6 +561,7 @@ class MicrosoftOutlookConnector:
                 ms_outlook_appointment.UserProperties['GCalendarMasterID'].Value = g_calendar_master_id
                 print_display(f'{line_number()} 05) GCalendarMasterID set successfully for [Microsoft Outlook] master [{trim_id(ms_outlook_master_id)}]')
                 ms_outlook_appointment.Save()
+                ms_outlook_dirty_queue.expect(ms_outlook_appointment.EntryID)
         except Exception as exception:
             print_display(f'{line_number()} 06) Error setting GCalendarMasterID [{trim_id(ms_outlook_master_id)}][{trim_id(g_calendar_master_id)}] for [Microsoft Outlook] item: [{exception}]')
 
@@ -612,6 +730,7 @@ class MicrosoftOutlookConnector:
                         print_display(f'{line_number()} [Microsoft Outlook] OSError when setting recurrence end date: [{os_error}]')
                         print_overline()
             ms_outlook_appointment.Save()
+            ms_outlook_dirty_queue.expect(ms_outlook_appointment.EntryID)
             print_display(f'{line_number()} [Microsoft Outlook] INSERT SUCCESS: Event [{ms_outlook_appointment.Subject}] created with ID: [{trim_id(ms_outlook_appointment.EntryID)}]')
             sleep(1)
             return ms_outlook_appointment
@@ -715,6 +834,7 @@ class MicrosoftOutlookConnector:
                     appointment.Recipients.ResolveAll()
             '''
             ms_outlook_appointment.Save()
+            ms_outlook_dirty_queue.expect(ms_outlook_appointment.EntryID)
             print_display(f'{line_number()} [Microsoft Outlook] UPDATE SUCCESS: Event [{ms_outlook_appointment.Subject}] updated')
             return ms_outlook_appointment
         except Exception as exception:
@@ -731,6 +851,7 @@ class MicrosoftOutlookConnector:
             print_display(f'{line_number()} DELETE <<==')
             ms_outlook_instance = self.ms_outlook_data.ms_outlook_get_item(ms_outlook_instance_id)
             ms_outlook_instance_subject = ms_outlook_instance.Subject
+            ms_outlook_dirty_queue.expect_removal()
             ms_outlook_instance.Delete()
             print_display(f'{line_number()} [Microsoft Outlook] DELETE SUCCESS: Event [{ms_outlook_instance_subject}] deleted')
             return True
@@ -754,6 +875,8 @@ class MicrosoftOutlookConnector:
             recurrence = appointment.GetRecurrencePattern()
             occurrence = recurrence.GetOccurrence(datetime.strptime(ms_outlook_instance_body,
                                                                     '%Y-%m-%d'))
+            # deleting an occurrence changes its master
+            ms_outlook_dirty_queue.expect(appointment.EntryID)
             occurrence.Delete()
             return True
         except Exception as exception:
@@ -785,6 +908,7 @@ class MicrosoftOutlookConnector:
         print_display(f'{line_number()} [Microsoft Outlook] recurrence {recurrence}')
         try:
             occurrence = recurrence.GetOccurrence(local_dt)
+            ms_outlook_dirty_queue.expect(master.EntryID)
             occurrence.Delete()
             return True
         except Exception as value_error:
@@ -805,11 +929,76 @@ class MicrosoftOutlookConnector:
         recurrence = master.GetRecurrencePattern()
         try:
             occurrence = recurrence.GetOccurrence(local_dt)
+            ms_outlook_dirty_queue.expect(master.EntryID)
             occurrence.Delete()
             return True
         except Exception as exception:
             raise ValueError(f'[Microsoft Outlook] Occurrence not found: [{exception}]')
 
+    def get_recurrence_exceptions(self,
+                                  ms_outlook_master_id: str) -> list[dict]:
+        """Exceptions of a series, one COM pattern read per master: the original
+        start of each, and the occurrence data when it was modified rather than deleted."""
+        ms_outlook_master = self.ms_outlook_data.ms_outlook_get_item(ms_outlook_master_id)
+        if not ms_outlook_master or not ms_outlook_master.IsRecurring:
+            release_com_object_memory(ms_outlook_master)
+            return []
+        ms_outlook_recurrence = ms_outlook_master.GetRecurrencePattern()
+        ms_outlook_exceptions = list()
+        try:
+            for exception_index in range(1,
+                                         ms_outlook_recurrence.Exceptions.Count + 1):
+                exception_item = ms_outlook_recurrence.Exceptions.Item(exception_index)
+                original_date = exception_item.OriginalDate.replace(tzinfo=None)
+                ms_outlook_exception = {
+                        'original_start_utc': outlook_local_to_utc(original_date),
+                        'original_date'     : original_date.strftime('%Y%m%d'),
+                        'deleted'           : bool(exception_item.Deleted),
+                        'event'             : None}
+                if not exception_item.Deleted:
+                    ms_outlook_exception['event'] = self.get_instance_data_ms_outlook(exception_item.AppointmentItem,
+                                                                                      _APPOINTMENT_PROPERTIES)
+                ms_outlook_exceptions.append(ms_outlook_exception)
+                release_com_object_memory(exception_item)
+        except (pywintypes.com_error,
+                AttributeError) as com_error_type:
+            print_display(f'{line_number()} [Microsoft Outlook] Exceptions not read for [{trim_id(ms_outlook_master_id)}]: [{com_error_type}]')
+        finally:
+            release_com_object_memory(ms_outlook_recurrence)
+            release_com_object_memory(ms_outlook_master)
+        return ms_outlook_exceptions
+
+    def delete_occurrence_by_master_and_start_utc(self,
+                                                  ms_outlook_master_id: str,
+                                                  start_utc: datetime,
+                                                  all_day: bool = False):
+        """Delete one occurrence of a known master; unlike the GCalendarMasterID
+        variants this opens the master by EntryID instead of scanning the calendar.
+        Returns False when the occurrence no longer exists."""
+        self._invalidate_cache()
+        ms_outlook_master = self.ms_outlook_data.ms_outlook_get_item(ms_outlook_master_id)
+        if not ms_outlook_master or not ms_outlook_master.IsRecurring:
+            raise ValueError('[Microsoft Outlook] Item is not recurring')
+        if all_day:
+            # all-day occurrences are keyed by their local date, there is no offset to apply
+            ms_outlook_local_date = datetime.combine(start_utc.date(),
+                                                     ms_outlook_master.Start.replace(tzinfo=None).time())
+        else:
+            # the offset of the occurrence's own date, not the master's, in case DST changed in between
+            ms_outlook_local_date = utc_to_outlook_local(start_utc)
+        ms_outlook_recurrence = ms_outlook_master.GetRecurrencePattern()
+        try:
+            ms_outlook_occurrence = ms_outlook_recurrence.GetOccurrence(ms_outlook_local_date)
+        except (pywintypes.com_error,
+                AttributeError) as com_error_type:
+            print_display(f'{line_number()} [Microsoft Outlook] Occurrence not found: [{com_error_type}]')
+            return False
+        finally:
+            release_com_object_memory(ms_outlook_recurrence)
+        ms_outlook_dirty_queue.expect(ms_outlook_master.EntryID)
+        ms_outlook_occurrence.Delete()
+        return True
+
     def get_all_recurring_masters_ms_outlook(self):
         """
         Fetches all recurring masters with no time restriction.
@@ -0,0 +1,95 @@
+import threading
+
+import pythoncom
+import pywintypes
+import win32com.client
+
+from system.dirty_queue import DirtyQueue
+from system.dirty_queue import ms_outlook_dirty_queue
+from system.tools import line_number
+from system.tools import print_display
+from system.tools import to_utc_datetime
+
+
+class MicrosoftOutlookItemEvents:
+    """Handlers for the ItemAdd / ItemChange / ItemRemove events of the calendar Items.
+
+    win32com mixes this class into the COM event class; it can also be driven
+    directly with any object that has EntryID, StartUTC, EndUTC and IsRecurring.
+    """
+
+    dirty_queue: DirtyQueue = ms_outlook_dirty_queue
+
+    @staticmethod
+    def _appointment(ms_outlook_item):
+        # COM passes a bare IDispatch; wrap it so the properties can be read
+        if hasattr(ms_outlook_item,
+                   'EntryID'):
+            return ms_outlook_item
+        return win32com.client.Dispatch(ms_outlook_item)
+
+    def _mark(self,
+              ms_outlook_item):
+        try:
+            ms_outlook_appointment = self._appointment(ms_outlook_item)
+            self.dirty_queue.mark(ms_outlook_appointment.EntryID,
+                                  to_utc_datetime(ms_outlook_appointment.StartUTC),
+                                  to_utc_datetime(ms_outlook_appointment.EndUTC),
+                                  bool(ms_outlook_appointment.IsRecurring))
+        except (pywintypes.com_error,
+                AttributeError) as com_error_type:
+            # not an appointment, or already gone: let a wide sync sort it out
+            print_display(f'{line_number()} [Microsoft Outlook] event item not readable: [{com_error_type}]')
+            self.dirty_queue.mark_removed()
+
+    def OnItemAdd(self,
+                  ms_outlook_item):
+        self._mark(ms_outlook_item)
+
+    def OnItemChange(self,
+                     ms_outlook_item):
+        self._mark(ms_outlook_item)
+
+    def OnItemRemove(self):
+        self.dirty_queue.mark_removed()
+
+
+class MicrosoftOutlookEventWatcher:
+    """Owns an Outlook connection of its own and pumps its calendar events into a DirtyQueue.
+
+    run() blocks until stop_event is set; call it on a dedicated thread.  The
+    event source and the binder are injectable so a fake can stand in for Outlook.
+    """
+
+    def __init__(self,
+                 dirty_queue: DirtyQueue = None,
+                 event_source_factory=None,
+                 bind_events=None):
+        # an empty queue is falsy, hence the explicit None check
+        self.dirty_queue = dirty_queue if dirty_queue is not None else ms_outlook_dirty_queue
+        self.event_source_factory = event_source_factory or self._ms_outlook_calendar_items
+        self.bind_events = bind_events or win32com.client.WithEvents
+
+    @staticmethod
+    def _ms_outlook_calendar_items():
+        ms_outlook_client = win32com.client.Dispatch('Outlook.Application')
+        return ms_outlook_client.GetNamespace('MAPI').GetDefaultFolder(9).Items
+
+    def run(self,
+            stop_event: threading.Event,
+            poll_seconds: float = 0.5):
+        pythoncom.CoInitialize()
+        try:
+            # the Items collection has to stay referenced, or Outlook stops raising its events
+            ms_outlook_items = self.event_source_factory()
+            ms_outlook_events = self.bind_events(ms_outlook_items,
+                                                 MicrosoftOutlookItemEvents)
+            ms_outlook_events.dirty_queue = self.dirty_queue
+            print_display(f'{line_number()} [Microsoft Outlook] listening to calendar events')
+            while not stop_event.is_set():
+                pythoncom.PumpWaitingMessages()
+                stop_event.wait(poll_seconds)
+        except pywintypes.com_error as com_error_type:
+            print_display(f'{line_number()} [Microsoft Outlook] calendar events unavailable, polling only: [{com_error_type}]')
+        finally:
+            pythoncom.CoUninitialize()
@@ -81,6 +81,8 @@ DEBUG_MODE = True
 TEXT_DEBUG_MESSAGE_END = 'DEBUG MESSAGE END'
 TEXT_DEBUG_MESSAGE_START = 'DEBUG MESSAGE START'
 RUN_GUI = False
+RUN_HEADLESS = False
+STARTUP_REPORT_ENABLED = False  # log the slowest imports of the tray app's startup as well as its milestones; also --startup-report
 SYMBOL_EMPTY = ''
 SYMBOL_BLANK = ' '
 
@@ -88,3 +90,48 @@ DAY_PAST = 18
 DAY_NEXT = 180
 INTERVAL_OBSERVER = 280  # 4.66 minutes in seconds
 INTERVAL_SYNC_JOB = 60 * 60 * 2  # 60 sec * 60 min * 2 hours
+INTERVAL_CHANGE_WATCH = 1  # seconds between two looks at the Outlook events and Google notifications waiting for a sync
+SCHEDULER_WORKERS = 3  # persistent worker threads of the job scheduler
+SYNC_JOB_JITTER = 15  # up to this many seconds are added to or taken from every sync job interval
+MAP_RETENTION_DAYS = 7  # days kept in event_map.json after an entry leaves the DAY_PAST window
+MAP_ARCHIVE_ENABLED = True  # append compacted entries to event_map_archive.jsonl instead of dropping them
+SYNC_DRY_RUN = False  # plan the cycle and report it (with estimated API calls) without writing anything
+G_CALENDAR_REQUESTS_PER_SECOND = 8  # shared by every thread; keeps parallel writes under the Google per-user quota
+SYNC_G_CALENDAR_WORKERS = 4  # concurrent Google Calendar operations while executing a sync plan
+RECURRENCE_MODE_OCCURRENCE = 'occurrence'  # every occurrence is listed, paired and stored in the event map
+RECURRENCE_MODE_MASTER = 'master'  # RRULE on the master, deletions as EXDATE / Outlook exceptions, only modified occurrences stored
+RECURRENCE_SYNC_MODE = RECURRENCE_MODE_OCCURRENCE
+RETRY_BACKOFF_BASE = 60 * 60  # first wait after a failed operation, doubled on every further failure
+RETRY_BACKOFF_MAX = 60 * 60 * 24 * 2  # longest wait between two attempts of the same operation
+RETRY_POISON_ATTEMPTS = 3  # permanent failures (bad data, 4xx) before the operation is quarantined
+RETRY_MAX_ATTEMPTS = 8  # failures of any kind before the operation is quarantined
+RETRY_QUARANTINE_DAYS = 14  # a quarantined operation gets one more attempt after this many days
+SYNC_CYCLE_BUDGET = 60 * 20  # seconds a sync cycle may spend executing its plan before the rest waits for the next cycle; 0 = no limit
+SYNC_TIERS_ENABLED = True  # read the near future often and the whole DAY_PAST/DAY_NEXT window rarely; False = whole window every INTERVAL_SYNC_JOB
+SYNC_TIER_HOT_HOURS = 48  # hot tier: from now to this many hours ahead
+SYNC_TIER_HOT_INTERVAL = 60 * 5  # seconds between two hot tier cycles
+SYNC_TIER_NEAR_DAYS = 30  # near tier: from now to this many days ahead
+SYNC_TIER_NEAR_INTERVAL = 60 * 60  # seconds between two near tier cycles
+SYNC_TIER_FULL_INTERVAL = 60 * 60 * 24  # seconds between two cycles over the whole DAY_PAST/DAY_NEXT window
+SNAPSHOT_DELTA_ENABLED = True  # full-window snapshots read only the edges that entered the window and what changed in between
+SNAPSHOT_DELTA_MAX_AGE = 60 * 60 * 24 * 3  # seconds after which the remembered listing is dropped and both calendars are read in full
+SYNC_ADAPTIVE_ENABLED = True  # wake the sync job sooner after a cycle that found changes and later after quiet ones
+SYNC_INTERVAL_MIN = 60 * 2  # shortest wait between two sync cycles, right after one that found changes
+SYNC_INTERVAL_MAX = 60 * 60  # longest wait between two sync cycles once the calendars have been quiet for a while
+SYNC_INTERVAL_BACKOFF = 2  # the wait is multiplied by this after every cycle that found nothing to do
+SYNC_PROBE_ENABLED = True  # before a hot or near tier cycle, ask both calendars whether anything changed and skip it if not
+SYNC_EVENTS_ENABLED = True  # listen to Outlook calendar events and sync the items they name within seconds
+SYNC_EVENT_DEBOUNCE = 5  # seconds without a new Outlook event before the collected items are synced
+SYNC_EVENT_MAX_DELAY = 60  # seconds after the first collected event by which they are synced even if events keep coming
+SYNC_EVENT_ECHO_SECONDS = 120  # Outlook events for items the sync itself wrote within this many seconds are ignored
+G_CALENDAR_PUSH_ENABLED = False  # receive Google Calendar push notifications; needs a public HTTPS tunnel or relay to the local receiver
+G_CALENDAR_PUSH_ADDRESS = ''  # public HTTPS URL Google posts notifications to, forwarded to G_CALENDAR_PUSH_HOST:G_CALENDAR_PUSH_PORT
+G_CALENDAR_PUSH_HOST = '127.0.0.1'  # interface the local notification receiver listens on
+G_CALENDAR_PUSH_PORT = 8765  # port the local notification receiver listens on
+G_CALENDAR_PUSH_TTL = 60 * 60 * 24 * 7  # channel lifetime asked of Google, in seconds; Google may grant less
+G_CALENDAR_PUSH_RENEW_BEFORE = 60 * 60  # seconds before a channel expires that a new one is opened
+G_CALENDAR_PUSH_RETRY = 60 * 10  # seconds between attempts to open a channel after one failed
+SYNC_INTERVAL_MAX_PUSH = 60 * 60 * 4  # longest wait between two sync cycles while a push channel reports Google changes
+CONTROL_ENABLED = True  # the tray app answers status, pause, resume, sync and cancel on the control socket too
+CONTROL_HOST = '127.0.0.1'  # loopback address the control socket of a running sync process listens on
+CONTROL_PORT = 8766  # port of the control socket
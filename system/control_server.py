@@ -0,0 +1,101 @@
+import ipaddress
+import json
+import socket
+import socketserver
+import threading
+from typing import Callable
+
+import system.constants as constants
+from system.tools import line_number
+from system.tools import print_display
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    # set on the subclass built by ControlServer.start()
+    control: 'ControlServer' = None
+
+    def handle(self):
+        # one JSON object per line each way: {"command": "status"} => {"ok": true, ...}
+        for request_line in self.rfile:
+            try:
+                request = json.loads(request_line)
+                response = self.control.dispatch(str(request.get('command',
+                                                                 '')))
+            except (ValueError,
+                    AttributeError) as request_error:
+                response = {
+                        'ok'   : False,
+                        'error': f'bad request: {request_error}'}
+            self.wfile.write(json.dumps(response,
+                                        default=str).encode('utf-8') + b'\n')
+
+
+class ControlServer:
+    """Loopback-only command socket of a running sync process.
+
+    Each command is a name mapped to a callable returning a JSON-ready
+    value; the reply is {"ok": true, "result": value}, or {"ok": false,
+    "error": ...} for an unknown command or one that raised.
+    """
+
+    def __init__(self,
+                 commands: dict[str, Callable[[], object]],
+                 host: str = None,
+                 port: int = None):
+        self.commands = commands
+        self.host = host or constants.CONTROL_HOST
+        self.port = constants.CONTROL_PORT if port is None else port
+        self._server: socketserver.ThreadingTCPServer | None = None
+
+    def start(self) -> int:
+        """Listen on its own thread; returns the port."""
+        if not ipaddress.ip_address(socket.gethostbyname(self.host)).is_loopback:
+            raise ValueError(f'control socket must listen on a loopback address, not [{self.host}]')
+        handler = type('ControlHandler',
+                       (_ControlHandler,),
+                       {
+                               'control': self})
+        self._server = socketserver.ThreadingTCPServer((self.host,
+                                                        self.port),
+                                                       handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+        print_display(f'{line_number()} [CONTROL] listening on [{self.host}:{self._server.server_address[1]}]')
+        return self._server.server_address[1]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def dispatch(self,
+                 command: str) -> dict:
+        function = self.commands.get(command)
+        if function is None:
+            return {
+                    'ok'   : False,
+                    'error': f'unknown command [{command}], expected one of [{", ".join(self.commands)}]'}
+        try:
+            return {
+                    'ok'    : True,
+                    'result': function()}
+        except Exception as exception:
+            return {
+                    'ok'   : False,
+                    'error': str(exception)}
+
+
+def send_command(command: str,
+                 host: str = None,
+                 port: int = None,
+                 timeout: float = 10.0) -> dict:
+    """Send one command to a running process and return its reply."""
+    with socket.create_connection((host or constants.CONTROL_HOST,
+                                   constants.CONTROL_PORT if port is None else port),
+                                  timeout=timeout) as connection:
+        connection.sendall(json.dumps({
+                'command': command}).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as reply:
+            return json.loads(reply.readline())
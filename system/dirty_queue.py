@@ -0,0 +1,137 @@
+import time
+from datetime import datetime
+from threading import Lock
+
+import system.constants as constants
+
+from system.tools import line_number
+from system.tools import print_display
+from system.tools import trim_id
+
+
+class DirtyQueue:
+    """Outlook items the event sink reported changed, waiting for a targeted sync.
+
+    Marks collect until SYNC_EVENT_DEBOUNCE seconds pass without a new one, or
+    the oldest is SYNC_EVENT_MAX_DELAY old; take() then hands them out as one
+    batch.  The sync announces its own Outlook writes with expect(), and the
+    events they raise are dropped instead of starting another sync.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # EntryID => {'start': UTC datetime or None, 'end': ..., 'recurring': bool}
+        self._items: dict[str, dict] = dict()
+        # ItemRemove does not say which item went
+        self._removed = 0
+        self._first_mark: float | None = None
+        self._last_mark: float | None = None
+        # EntryID => time.monotonic() until which its events are the sync's own
+        self._expected: dict[str, float] = dict()
+        # time.monotonic() expiry of each removal the sync made itself
+        self._expected_removals: list[float] = list()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items) + self._removed
+
+    def _touch(self):
+        time_now = time.monotonic()
+        if self._first_mark is None:
+            self._first_mark = time_now
+        self._last_mark = time_now
+
+    # ---- event sink side --------------------------------------------------
+
+    def mark(self,
+             entry_id: str,
+             start: datetime = None,
+             end: datetime = None,
+             recurring: bool = False):
+        with self._lock:
+            self._items[entry_id] = {
+                    'start'    : start,
+                    'end'      : end,
+                    'recurring': recurring}
+            self._touch()
+
+    def mark_removed(self):
+        with self._lock:
+            self._removed += 1
+            self._touch()
+
+    # ---- sync side --------------------------------------------------------
+
+    def expect(self,
+               entry_id: str):
+        if not entry_id:
+            return
+        with self._lock:
+            self._expected[entry_id] = time.monotonic() + constants.SYNC_EVENT_ECHO_SECONDS
+
+    def expect_removal(self):
+        with self._lock:
+            self._expected_removals.append(time.monotonic() + constants.SYNC_EVENT_ECHO_SECONDS)
+
+    def _settled(self,
+                 time_now: float) -> bool:
+        if self._last_mark is None:
+            return False
+        return time_now - self._last_mark >= constants.SYNC_EVENT_DEBOUNCE or time_now - self._first_mark >= constants.SYNC_EVENT_MAX_DELAY
+
+    def _drop_echoes(self,
+                     time_now: float) -> int:
+        """Drop the marks raised by the sync's own writes; how many there were."""
+        self._expected = {entry_id: until for entry_id, until in self._expected.items() if until > time_now}
+        self._expected_removals = [until for until in self._expected_removals if until > time_now]
+        echoes = [entry_id for entry_id in self._items if entry_id in self._expected]
+        for entry_id in echoes:
+            del self._items[entry_id]
+        removed_echoes = 0
+        while self._removed and self._expected_removals:
+            self._expected_removals.pop(0)
+            self._removed -= 1
+            removed_echoes += 1
+        if not self._items and not self._removed:
+            self._first_mark = None
+            self._last_mark = None
+        return len(echoes) + removed_echoes
+
+    def ready(self) -> bool:
+        """Whether take() would hand out a batch now; a batch of echoes only is dropped here."""
+        time_now = time.monotonic()
+        with self._lock:
+            if not self._settled(time_now):
+                return False
+            echoes = self._drop_echoes(time_now)
+            ready = bool(self._items or self._removed)
+        if echoes:
+            print_display(f'{line_number()} [DIRTY QUEUE] ignored [{echoes}] events raised by the sync itself')
+        return ready
+
+    def take(self) -> dict | None:
+        """The settled batch, {'items': {EntryID: mark}, 'removed': count}, or None
+        while events are still coming in or all of them were the sync's own."""
+        time_now = time.monotonic()
+        with self._lock:
+            if not self._settled(time_now):
+                return None
+            echoes = self._drop_echoes(time_now)
+            items = self._items
+            removed = self._removed
+            self._items = dict()
+            self._removed = 0
+            self._first_mark = None
+            self._last_mark = None
+        if echoes:
+            print_display(f'{line_number()} [DIRTY QUEUE] ignored [{echoes}] events raised by the sync itself')
+        if not items and not removed:
+            return None
+        print_display(f'{line_number()} [DIRTY QUEUE] changed [{", ".join(trim_id(entry_id) for entry_id in items)}] removed [{removed}]')
+        return {
+                'items'  : items,
+                'removed': removed}
+
+
+# one queue per process: the event sink thread fills it, the scheduler empties it
+ms_outlook_dirty_queue = DirtyQueue()
@@ -0,0 +1,231 @@
+import secrets
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import TYPE_CHECKING
+
+import system.constants as constants
+from system.tools import line_number
+from system.tools import print_box
+from system.tools import print_display
+from system.tools import trim_id
+
+if TYPE_CHECKING:
+    from connector.g_calendar import GoogleCalendarHelper
+
+# X-Goog-Resource-State values that mean the calendar changed; 'sync' only confirms a new channel
+_CHANGE_STATES = ('exists',
+                  'not_exists')
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    # set on the subclass built by GoogleCalendarPush.start()
+    push: 'GoogleCalendarPush' = None
+
+    def do_POST(self):
+        # answer at once: Google retries slow or failed deliveries
+        self.send_response(200 if self.push.notify(self.headers.get('X-Goog-Channel-ID'),
+                                                   self.headers.get('X-Goog-Channel-Token'),
+                                                   self.headers.get('X-Goog-Resource-State')) else 403)
+        self.send_header('Content-Length',
+                         '0')
+        self.end_headers()
+
+    def log_message(self,
+                    format,
+                    *args):
+        pass
+
+
+class GoogleCalendarPush:
+    """Google Calendar push notifications: the local receiver and the events.watch channels feeding it.
+
+    A channel is opened on the primary calendar with G_CALENDAR_PUSH_ADDRESS as
+    its webhook, a tunnel or relay forwards the posts to the local receiver,
+    and a notification of a known channel with the right token becomes a
+    signal that take() hands out once it settles.  maintain() opens a new
+    channel before the current one expires; while none is live the sync
+    job polls at its usual pace.
+    """
+
+    def __init__(self,
+                 g_calendar_helper: 'GoogleCalendarHelper' = None):
+        self._lock = threading.Lock()
+        # created on first use: it reads the OAuth token, and the Google client libraries are slow to import
+        self._g_calendar_helper = g_calendar_helper
+        self._server: ThreadingHTTPServer | None = None
+        # channel id => {'token', 'resource_id', 'expiration' (epoch seconds)}
+        self._channels: dict[str, dict] = dict()
+        self._retry_at = 0.0
+        self._first_signal: float | None = None
+        self._last_signal: float | None = None
+
+    @property
+    def g_calendar_helper(self) -> 'GoogleCalendarHelper':
+        if self._g_calendar_helper is None:
+            from connector.g_calendar import GoogleCalendarHelper
+            self._g_calendar_helper = GoogleCalendarHelper()
+        return self._g_calendar_helper
+
+    # ---- receiver ---------------------------------------------------------
+
+    def start(self) -> int:
+        """Start the receiver on its own thread; returns the port it listens on."""
+        handler = type('NotificationHandler',
+                       (_NotificationHandler,),
+                       {
+                               'push': self})
+        self._server = ThreadingHTTPServer((constants.G_CALENDAR_PUSH_HOST,
+                                            constants.G_CALENDAR_PUSH_PORT),
+                                           handler)
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+        print_display(f'{line_number()} [Google Calendar] push receiver listening on [{constants.G_CALENDAR_PUSH_HOST}:{self._server.server_port}]')
+        return self._server.server_port
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for channel_id in list(self._channels):
+            self._stop_channel(channel_id)
+
+    def notify(self,
+               channel_id: str,
+               channel_token: str,
+               resource_state: str) -> bool:
+        """False for a channel this process did not open or a wrong token."""
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None or not secrets.compare_digest(channel['token'],
+                                                             channel_token or ''):
+                return False
+            if resource_state in _CHANGE_STATES:
+                time_now = time.monotonic()
+                if self._first_signal is None:
+                    self._first_signal = time_now
+                self._last_signal = time_now
+        return True
+
+    def _settled(self,
+                 time_now: float) -> bool:
+        if self._last_signal is None:
+            return False
+        return time_now - self._last_signal >= constants.SYNC_EVENT_DEBOUNCE or time_now - self._first_signal >= constants.SYNC_EVENT_MAX_DELAY
+
+    def ready(self) -> bool:
+        with self._lock:
+            return self._settled(time.monotonic())
+
+    def take(self) -> bool:
+        """True once per burst of notifications, after SYNC_EVENT_DEBOUNCE quiet seconds."""
+        time_now = time.monotonic()
+        with self._lock:
+            if not self._settled(time_now):
+                return False
+            self._first_signal = None
+            self._last_signal = None
+        print_display(f'{line_number()} [Google Calendar] push notification: calendar changed')
+        return True
+
+    # ---- channels ---------------------------------------------------------
+
+    @property
+    def live(self) -> bool:
+        time_now = time.time()
+        with self._lock:
+            return any(channel['expiration'] > time_now for channel in self._channels.values())
+
+    def maintain(self) -> bool:
+        """Open a channel when none is live or the newest expires soon, drop expired ones.
+        Returns whether a channel is live afterwards."""
+        time_now = time.time()
+        with self._lock:
+            for channel_id in [channel_id for channel_id, channel in self._channels.items() if channel['expiration'] <= time_now]:
+                print_display(f'{line_number()} [Google Calendar] push channel expired: [{trim_id(channel_id)}]')
+                del self._channels[channel_id]
+            newest_expiration = max((channel['expiration'] for channel in self._channels.values()),
+                                    default=0)
+            previous_channels = list(self._channels)
+        if newest_expiration - time_now > constants.G_CALENDAR_PUSH_RENEW_BEFORE or time_now < self._retry_at:
+            return self.live
+        if self._open_channel():
+            # the new channel already reports; the old ones can go
+            for channel_id in previous_channels:
+                self._stop_channel(channel_id)
+        else:
+            self._retry_at = time_now + constants.G_CALENDAR_PUSH_RETRY
+        return self.live
+
+    def _open_channel(self) -> bool:
+        channel_id = uuid.uuid4().hex
+        channel_token = secrets.token_urlsafe(24)
+        # registered first: Google posts the 'sync' notification before watch() returns
+        with self._lock:
+            self._channels[channel_id] = {
+                    'token'      : channel_token,
+                    'resource_id': None,
+                    'expiration' : 0}
+        try:
+            g_calendar_channel = self.g_calendar_helper.g_calendar_watch(channel_id,
+                                                                         constants.G_CALENDAR_PUSH_ADDRESS,
+                                                                         channel_token,
+                                                                         constants.G_CALENDAR_PUSH_TTL)
+        except Exception as exception:
+            with self._lock:
+                del self._channels[channel_id]
+            print_box(f'{line_number()} [Google Calendar] push channel not opened, polling only: [{exception}]')
+            return False
+        expiration = int(g_calendar_channel.get('expiration',
+                                                0)) / 1000 or time.time() + constants.G_CALENDAR_PUSH_TTL
+        with self._lock:
+            self._channels[channel_id]['resource_id'] = g_calendar_channel.get('resourceId')
+            self._channels[channel_id]['expiration'] = expiration
+        print_display(f'{line_number()} [Google Calendar] push channel opened: [{trim_id(channel_id)}] until [{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(expiration))}]')
+        return True
+
+    def _stop_channel(self,
+                      channel_id: str):
+        with self._lock:
+            channel = self._channels.pop(channel_id,
+                                         None)
+        if not channel or not channel['resource_id']:
+            return
+        try:
+            self.g_calendar_helper.g_calendar_stop_channel(channel_id,
+                                                           channel['resource_id'])
+        except Exception as exception:
+            # it expires on its own; its notifications are refused meanwhile
+            print_display(f'{line_number()} [Google Calendar] push channel not stopped: [{trim_id(channel_id)}]: [{exception}]')
+
+
+def simulate_notification(port: int,
+                          channel_id: str,
+                          channel_token: str,
+                          resource_state: str = 'exists',
+                          host: str = '127.0.0.1') -> int:
+    """Post what Google would post for a change, to a local receiver; returns the HTTP status."""
+    # only used to test a receiver: not worth loading at startup
+    import urllib.error
+    import urllib.request
+    notification = urllib.request.Request(f'http://{host}:{port}/',
+                                          data=b'',
+                                          method='POST',
+                                          headers={
+                                                  'X-Goog-Channel-ID'    : channel_id,
+                                                  'X-Goog-Channel-Token' : channel_token,
+                                                  'X-Goog-Resource-State': resource_state,
+                                                  'X-Goog-Resource-ID'   : 'simulated'})
+    try:
+        with urllib.request.urlopen(notification,
+                                    timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as http_error:
+        return http_error.code
+
+
+# one receiver per process, like the Outlook dirty queue
+g_calendar_push = GoogleCalendarPush()
@@ -0,0 +1,289 @@
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+import traceback
+from typing import Callable
+
+from system.tools import line_number
+from system.tools import print_display
+
+# what happens to a run requested while the job is still running
+OVERLAP_SKIP = 'skip'  # dropped
+OVERLAP_QUEUE = 'queue'  # every request runs, one after the other
+OVERLAP_COALESCE = 'coalesce'  # all of them become a single run once the current one ends, with the latest arguments
+
+
+class ScheduledJob:
+    """One job of the scheduler: what to call, how often, and what it is doing now."""
+
+    def __init__(self,
+                 name: str,
+                 function: Callable,
+                 interval: float | Callable[[], float] | None,
+                 jitter: float = 0.0,
+                 overlap: str = OVERLAP_SKIP):
+        self.name = name
+        self.function = function
+        # seconds, or a callable asked again after every run; None = only on run_now()
+        self.interval = interval
+        # up to this many seconds are added to or taken from every interval
+        self.jitter = jitter
+        self.overlap = overlap
+        self.running = False
+        self.cancelled = False
+        # (args, kwargs) of the runs waiting for the current one to end
+        self.pending: list[tuple[tuple, dict]] = list()
+        # due time of the interval timer; run_now() requests do not move it
+        self.next_run: float | None = None
+        self.last_started: float | None = None
+        self.last_finished: float | None = None
+        self.last_error: str | None = None
+        self.runs = 0
+
+    def next_interval(self) -> float | None:
+        interval = self.interval() if callable(self.interval) else self.interval
+        if interval is None:
+            return None
+        if self.jitter:
+            interval += random.uniform(-self.jitter,
+                                       self.jitter)
+        return max(interval,
+                   0.0)
+
+
+class JobScheduler:
+    """Timer heap plus a fixed pool of worker threads.
+
+    One dispatcher thread sleeps until the earliest job is due, or until
+    wake() is called for a run_now(), a pause, a resume or a stop, and hands
+    the job to an idle worker.  Nothing is dispatched while `paused` is
+    cleared; every job still due then runs once on resume.  Setting
+    `stop_event` (and calling wake()) ends the dispatcher and the workers;
+    a job that is running is expected to watch stop_event itself.
+    """
+
+    def __init__(self,
+                 stop_event: threading.Event,
+                 paused: threading.Event = None,
+                 workers: int = 2):
+        self.stop_event = stop_event
+        # set = running, cleared = paused, like the tray's flag
+        self.paused = paused
+        self.workers = workers
+        self._jobs: dict[str, ScheduledJob] = dict()
+        # (due time, sequence, job name, args, kwargs, interval timer); sequence keeps equal times in order
+        self._heap: list[tuple[float, int, str, tuple, dict, bool]] = list()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._work: queue.Queue = queue.Queue()
+        self._threads: list[threading.Thread] = list()
+
+    # ---- jobs -------------------------------------------------------------
+
+    def add_job(self,
+                name: str,
+                function: Callable,
+                interval: float | Callable[[], float] | None,
+                jitter: float = 0.0,
+                overlap: str = OVERLAP_SKIP,
+                first_run: float = 0.0) -> ScheduledJob:
+        """Register a job; its first run is first_run seconds from now, None for none until run_now()."""
+        job = ScheduledJob(name,
+                           function,
+                           interval,
+                           jitter,
+                           overlap)
+        with self._condition:
+            self._jobs[name] = job
+            if first_run is not None:
+                self._push_timer(job,
+                                 time.monotonic() + first_run)
+            self._condition.notify()
+        return job
+
+    def cancel_job(self,
+                   name: str):
+        with self._condition:
+            job = self._jobs.pop(name,
+                                 None)
+            if job is not None:
+                job.cancelled = True
+                job.pending = list()
+                job.next_run = None
+
+    def run_now(self,
+                name: str,
+                *args,
+                **kwargs) -> bool:
+        """Run the job as soon as a worker is free; False when the overlap policy dropped the request."""
+        with self._condition:
+            job = self._jobs.get(name)
+            if job is None:
+                return False
+            if job.running:
+                return self._overlap(job,
+                                     args,
+                                     kwargs)
+            self._push(job.name,
+                       time.monotonic(),
+                       args,
+                       kwargs)
+            self._condition.notify()
+        return True
+
+    def jobs(self) -> dict[str, ScheduledJob]:
+        with self._condition:
+            return dict(self._jobs)
+
+    def is_running(self,
+                   name: str) -> bool:
+        job = self._jobs.get(name)
+        return bool(job and job.running)
+
+    def _push(self,
+              name: str,
+              due: float,
+              args: tuple = (),
+              kwargs: dict = None,
+              timer: bool = False):
+        heapq.heappush(self._heap,
+                       (due,
+                        next(self._sequence),
+                        name,
+                        args,
+                        kwargs or dict(),
+                        timer))
+
+    def _push_timer(self,
+                    job: ScheduledJob,
+                    due: float):
+        # a job has one interval timer: a newer one replaces it, the stale heap entry is skipped when popped
+        job.next_run = due
+        self._push(job.name,
+                   due,
+                   timer=True)
+
+    def _overlap(self,
+                 job: ScheduledJob,
+                 args: tuple,
+                 kwargs: dict) -> bool:
+        if job.overlap == OVERLAP_QUEUE:
+            job.pending.append((args,
+                                kwargs))
+            return True
+        if job.overlap == OVERLAP_COALESCE:
+            job.pending = [(args,
+                            kwargs)]
+            return True
+        return False
+
+    # ---- threads ----------------------------------------------------------
+
+    def start(self):
+        for worker_index in range(self.workers):
+            worker = threading.Thread(target=self._worker,
+                                      name=f'scheduler-worker-{worker_index}',
+                                      daemon=True)
+            worker.start()
+            self._threads.append(worker)
+        dispatcher = threading.Thread(target=self._dispatcher,
+                                      name='scheduler-dispatcher',
+                                      daemon=True)
+        dispatcher.start()
+        self._threads.append(dispatcher)
+
+    def wake(self):
+        """Re-check pause, stop and due times now instead of at the next timer."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake()
+        for _ in range(self.workers):
+            self._work.put(None)
+
+    def _is_paused(self) -> bool:
+        return self.paused is not None and not self.paused.is_set()
+
+    def _dispatcher(self):
+        with self._condition:
+            while not self.stop_event.is_set():
+                if self._is_paused():
+                    # wake() on resume; the timeout only guards against a missed one
+                    self._condition.wait(1.0)
+                    continue
+                time_now = time.monotonic()
+                while self._heap and self._heap[0][0] <= time_now:
+                    due, _, name, args, kwargs, timer = heapq.heappop(self._heap)
+                    job = self._jobs.get(name)
+                    if job is None or job.cancelled or (timer and job.next_run != due):
+                        continue
+                    if timer:
+                        # set again when the run ends, from the interval it asks for then
+                        job.next_run = None
+                    if job.running:
+                        self._overlap(job,
+                                      args,
+                                      kwargs)
+                        continue
+                    job.running = True
+                    self._work.put((job,
+                                    args,
+                                    kwargs))
+                timeout = self._heap[0][0] - time_now if self._heap else None
+                self._condition.wait(timeout)
+
+    def _worker(self):
+        while True:
+            work = self._work.get()
+            if work is None or self.stop_event.is_set():
+                return
+            job, args, kwargs = work
+            self._run(job,
+                      args,
+                      kwargs)
+
+    def _run(self,
+             job: ScheduledJob,
+             args: tuple,
+             kwargs: dict):
+        started = time.monotonic()
+        job.last_started = started
+        try:
+            job.function(*args,
+                         **kwargs)
+            job.last_error = None
+        except Exception as exception:
+            job.last_error = str(exception)
+            print_display(f'{line_number()} [SCHEDULER] job [{job.name}] failed: [{exception}]')
+            traceback.print_exc()
+        finally:
+            self._finished(job,
+                           started)
+
+    def _finished(self,
+                  job: ScheduledJob,
+                  started: float):
+        # the interval is asked after the run, so a job that paces itself is heard at once
+        next_interval = None if job.cancelled else job.next_interval()
+        with self._condition:
+            job.running = False
+            job.runs += 1
+            job.last_finished = time.monotonic()
+            if job.cancelled:
+                return
+            if job.pending:
+                args, kwargs = job.pending.pop(0)
+                self._push(job.name,
+                           job.last_finished,
+                           args,
+                           kwargs)
+            if next_interval is not None and job.next_run is None:
+                self._push_timer(job,
+                                 max(started + next_interval,
+                                     job.last_finished))
+            self._condition.notify()
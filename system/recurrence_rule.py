@@ -0,0 +1,256 @@
+import logging
+from datetime import datetime
+from functools import lru_cache
+
+# Outlook RecurrenceType => iCalendar FREQ
+# (type 6, olRecursYearNth, shares YEARLY with type 5)
+_OL_RECURRENCE_TYPE_TO_FREQ = {
+        0: 'DAILY',
+        1: 'WEEKLY',
+        2: 'MONTHLY',
+        3: 'MONTHLY',
+        5: 'YEARLY',
+        6: 'YEARLY'}
+
+# Outlook DayOfWeekMask bit values => iCalendar BYDAY abbreviations
+_OL_DAY_MASK_TO_BYDAY = {
+        1 : 'SU',
+        2 : 'MO',
+        4 : 'TU',
+        8 : 'WE',
+        16: 'TH',
+        32: 'FR',
+        64: 'SA'}
+
+# iCalendar BYDAY abbreviations => Outlook DayOfWeekMask bit values
+_BYDAY_TO_OL_DAY_MASK = {v: k for k, v in _OL_DAY_MASK_TO_BYDAY.items()}
+
+# Outlook Instance values (1-5) => iCalendar BYSETPOS values.
+# Outlook uses 5 to mean "last"; iCalendar uses -1.
+_OL_INSTANCE_TO_BYSETPOS = {
+        1: 1,
+        2: 2,
+        3: 3,
+        4: 4,
+        5: -1}
+
+# iCalendar BYSETPOS values => Outlook Instance values
+_BYSETPOS_TO_OL_INSTANCE = {v: k for k, v in _OL_INSTANCE_TO_BYSETPOS.items()}
+
+# BYDAY is kept in DayOfWeekMask bit order so both sides serialize the same way
+_BYDAY_ORDER = {day: index for index, day in enumerate(_OL_DAY_MASK_TO_BYDAY.values())}
+
+# not system.tools: it imports this module
+logger = logging.getLogger('CalendarSync Logger')
+
+
+def _day_mask_to_byday(mask: int) -> tuple:
+    return tuple(day for bit, day in _OL_DAY_MASK_TO_BYDAY.items() if mask & bit)
+
+
+def _byday_to_day_mask(byday: tuple) -> int:
+    total = 0
+    for day in byday:
+        total |= _BYDAY_TO_OL_DAY_MASK.get(day, 0)
+    return total
+
+
+class RecurrenceRule:
+    """Parsed RRULE shared by CalendarInstance, tools.compare_rule and the connectors.
+
+    Instances are immutable and hashable; equality is on the canonical form,
+    so 'FREQ=WEEKLY;BYDAY=MO,WE' equals 'RRULE:INTERVAL=1;BYDAY=WE,MO;FREQ=WEEKLY'.
+    Use RecurrenceRule.parse() rather than the constructor: it is memoized.
+    """
+    __slots__ = ('freq',
+                 'interval',
+                 'byday',
+                 'bysetpos',
+                 'bymonth',
+                 'until',
+                 'count',
+                 'extra',
+                 '_key')
+
+    def __init__(self,
+                 freq: str,
+                 interval: int = 1,
+                 byday: tuple = (),
+                 bysetpos: int = None,
+                 bymonth: int = None,
+                 until: str = None,
+                 count: int = None,
+                 extra: tuple = ()):
+        object.__setattr__(self, 'freq', freq)
+        object.__setattr__(self, 'interval', interval)
+        object.__setattr__(self, 'byday', tuple(sorted(byday, key=lambda day: _BYDAY_ORDER.get(day, len(_BYDAY_ORDER)))))
+        object.__setattr__(self, 'bysetpos', bysetpos)
+        object.__setattr__(self, 'bymonth', bymonth)
+        object.__setattr__(self, 'until', until)
+        object.__setattr__(self, 'count', count)
+        object.__setattr__(self, 'extra', tuple(sorted(extra)))
+        object.__setattr__(self, '_key', (self.freq, self.interval, self.byday, self.bysetpos, self.bymonth, self.until, self.count, self.extra))
+
+    def __setattr__(self,
+                    name,
+                    value):
+        raise AttributeError(f'RecurrenceRule is immutable: cannot set [{name}]')
+
+    def __eq__(self,
+               other):
+        if not isinstance(other,
+                          RecurrenceRule):
+            return False
+        return self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __repr__(self) -> str:
+        return f'RecurrenceRule({self.to_rrule()!r})'
+
+    __str__ = __repr__
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def parse(rule_text: str) -> 'RecurrenceRule | None':
+        if not rule_text:
+            return None
+        if ':' in rule_text:
+            rule_text = rule_text.split(':',
+                                        1)[1]
+        rule_parts = dict()
+        for rule_part in rule_text.split(';'):
+            if '=' not in rule_part:
+                continue
+            rule_key, rule_value = rule_part.split('=',
+                                                   1)
+            rule_parts[rule_key.strip().upper()] = rule_value.strip()
+        byday = tuple(day.strip().upper() for day in rule_parts.pop('BYDAY', '').split(',') if day.strip())
+        bysetpos = rule_parts.pop('BYSETPOS', None)
+        bysetpos = int(bysetpos) if bysetpos else None
+        # 'BYDAY=3TH' is the same rule as 'BYDAY=TH;BYSETPOS=3'
+        if len(byday) == 1 and bysetpos is None and byday[0][:-2].lstrip('+-').isdigit():
+            bysetpos = int(byday[0][:-2])
+            byday = (byday[0][-2:],)
+        if any(len(day) > 2 for day in byday):
+            # 'BYDAY=1MO,3MO' has no DayOfWeekMask / Instance form: kept as written, Outlook gets no days
+            logger.warning(f'[RECURRENCE RULE] [BYDAY={",".join(byday)}] cannot be expressed in Microsoft Outlook')
+            rule_parts['BYDAY'] = ','.join(byday)
+            byday = ()
+        bymonth = rule_parts.pop('BYMONTH', None)
+        count = rule_parts.pop('COUNT', None)
+        until = rule_parts.pop('UNTIL', None)
+        return RecurrenceRule(freq=rule_parts.pop('FREQ', 'DAILY').upper(),
+                              interval=int(rule_parts.pop('INTERVAL', None) or 1),
+                              byday=byday,
+                              bysetpos=bysetpos,
+                              bymonth=int(bymonth) if bymonth else None,
+                              until=until.upper() if until else None,
+                              count=int(count) if count else None,
+                              extra=tuple(rule_parts.items()))
+
+    @classmethod
+    def from_ms_outlook(cls,
+                        ms_outlook_event: dict) -> 'RecurrenceRule':
+        """Build the rule from the recurrence_* fields read by MicrosoftOutlookConnector."""
+        recurrence_type = ms_outlook_event.get('recurrence_type', 0)
+        freq = _OL_RECURRENCE_TYPE_TO_FREQ.get(recurrence_type, 'DAILY')
+        day_mask = ms_outlook_event.get('recurrence_day_of_week_mask', 0) or 0
+        recurrence_instance = ms_outlook_event.get('recurrence_instance', 0)
+        byday = ()
+        bysetpos = None
+        bymonth = None
+        if freq == 'WEEKLY':
+            # weekly needs BYDAY, otherwise a Mon-Fri pattern repeats on the start weekday only
+            byday = _day_mask_to_byday(day_mask)
+        elif recurrence_type in (3, 6):
+            # monthly-nth / yearly-nth: "3rd Thursday" is BYDAY=TH;BYSETPOS=3
+            byday = _day_mask_to_byday(day_mask)
+            if byday:
+                bysetpos = _OL_INSTANCE_TO_BYSETPOS.get(recurrence_instance, recurrence_instance)
+        if freq == 'YEARLY':
+            bymonth = ms_outlook_event.get('recurrence_month_of_year') or None
+        until = None
+        recurrence_end = ms_outlook_event.get('recurrence_end')
+        if recurrence_end:
+            try:
+                until = datetime.strptime(recurrence_end,
+                                          '%Y-%m-%d').strftime('%Y%m%dT235959Z')
+            except ValueError:
+                until = recurrence_end.replace('-',
+                                               '') + 'T235959Z'
+        return cls(freq=freq,
+                   interval=int(ms_outlook_event.get('recurrence_interval', 1) or 1),
+                   byday=byday,
+                   bysetpos=bysetpos,
+                   bymonth=bymonth,
+                   until=until)
+
+    @property
+    def until_date(self) -> str | None:
+        """UNTIL as 'YYYY-MM-DD' (the recurrence_end format used on the Outlook side)."""
+        if not self.until or len(self.until) < 8:
+            return None
+        return f'{self.until[0:4]}-{self.until[4:6]}-{self.until[6:8]}'
+
+    def to_ms_outlook(self) -> dict:
+        """Outlook RecurrencePattern fields, as consumed by insert_instance_ms_outlook."""
+        nth = bool(self.byday) and self.bysetpos is not None
+        if self.freq == 'WEEKLY':
+            recurrence_type = 1
+        elif self.freq == 'MONTHLY':
+            recurrence_type = 3 if nth else 2
+        elif self.freq == 'YEARLY':
+            recurrence_type = 6 if nth else 5
+        else:
+            recurrence_type = 0
+        ms_outlook_pattern = {
+                'recurrence_type'    : recurrence_type,
+                'recurrence_interval': self.interval}
+        if self.until_date:
+            ms_outlook_pattern['recurrence_end'] = self.until_date
+        day_mask = _byday_to_day_mask(self.byday)
+        if day_mask:
+            ms_outlook_pattern['recurrence_day_of_week_mask'] = day_mask
+        if self.bysetpos is not None:
+            ms_outlook_pattern['recurrence_instance'] = _BYSETPOS_TO_OL_INSTANCE.get(self.bysetpos, self.bysetpos)
+        if self.bymonth:
+            ms_outlook_pattern['recurrence_month_of_year'] = self.bymonth
+        return ms_outlook_pattern
+
+    def to_dict(self) -> dict:
+        """Lower-case key/value view in the shape tools.parse_rule has always returned."""
+        rule_parts = {
+                'freq'    : self.freq,
+                'interval': str(self.interval)}
+        if self.byday:
+            rule_parts['byday'] = ','.join(self.byday)
+        if self.bysetpos is not None:
+            rule_parts['bysetpos'] = str(self.bysetpos)
+        if self.bymonth:
+            rule_parts['bymonth'] = str(self.bymonth)
+        if self.count:
+            rule_parts['count'] = str(self.count)
+        if self.until:
+            rule_parts['until'] = self.until
+        for extra_key, extra_value in self.extra:
+            rule_parts[extra_key.lower()] = extra_value
+        return dict(sorted(rule_parts.items()))
+
+    @lru_cache(maxsize=1024)
+    def to_rrule(self) -> str:
+        rule_parts = [f'FREQ={self.freq}',
+                      f'INTERVAL={self.interval}']
+        if self.bymonth:
+            rule_parts.append(f'BYMONTH={self.bymonth}')
+        if self.byday:
+            rule_parts.append(f'BYDAY={",".join(self.byday)}')
+        if self.bysetpos is not None:
+            rule_parts.append(f'BYSETPOS={self.bysetpos}')
+        if self.count:
+            rule_parts.append(f'COUNT={self.count}')
+        if self.until:
+            rule_parts.append(f'UNTIL={self.until}')
+        rule_parts.extend(f'{extra_key}={extra_value}' for extra_key, extra_value in self.extra)
+        return 'RRULE:' + ';'.join(rule_parts)
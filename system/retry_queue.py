@@ -0,0 +1,191 @@
+import json
+import os
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+
+from googleapiclient.errors import HttpError
+
+import system.constants as constants
+
+from system.sync_plan import SyncOperation
+from system.sync_plan import SyncPlan
+from system.tools import line_number
+from system.tools import print_box
+from system.tools import print_display
+from system.tools import utc_now
+
+# failure classes
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+POISON = 'poison'
+
+# Google answers worth waiting out: rate limits and server side trouble
+_TRANSIENT_STATUS_CODES = (408,
+                           429,
+                           500,
+                           502,
+                           503,
+                           504)
+_RATE_LIMIT_REASONS = ('rateLimitExceeded',
+                       'userRateLimitExceeded',
+                       'quotaExceeded')
+
+
+def classify_failure(error) -> str:
+    """TRANSIENT is retried soon; PERMANENT will fail the same way until the event changes."""
+    if isinstance(error,
+                  HttpError):
+        if error.status_code in _TRANSIENT_STATUS_CODES:
+            return TRANSIENT
+        if error.status_code == 403 and any(reason in str(error.error_details) for reason in _RATE_LIMIT_REASONS):
+            return TRANSIENT
+        return PERMANENT
+    # conversion or payload problems: retrying the same data cannot help
+    if isinstance(error,
+                  (ValueError,
+                   KeyError,
+                   TypeError)):
+        return PERMANENT
+    # COM and network errors, Outlook busy or gone
+    return TRANSIENT
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+class RetryQueue:
+    """Failed sync operations, with their next allowed attempt.
+
+    A failed operation waits RETRY_BACKOFF_BASE, doubled on every further
+    failure up to RETRY_BACKOFF_MAX, before the planner may plan it again.
+    One that keeps failing (RETRY_POISON_ATTEMPTS permanent failures, or
+    RETRY_MAX_ATTEMPTS in all) is quarantined: skipped until
+    RETRY_QUARANTINE_DAYS have passed or release() is called.
+    """
+
+    def __init__(self,
+                 queue_file: str = None):
+        base_dir = Path(__file__).resolve().parent.parent
+        database_dir = (base_dir / 'resources' / 'database').resolve()
+        self.queue_file = queue_file or str(database_dir / 'retry_queue.json')
+        self._dirty = False
+        self.items: dict[str, dict] = self._load()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.queue_file):
+            return dict()
+        try:
+            with open(self.queue_file,
+                      'r',
+                      encoding='utf-8') as queue_reader:
+                return json.load(queue_reader).get('items',
+                                                   dict())
+        except (json.JSONDecodeError,
+                IOError,
+                AttributeError) as errors:
+            print_display(f'{line_number()} [RETRY QUEUE] unreadable, starting empty: [{errors}]')
+            return dict()
+
+    def save(self):
+        if not self._dirty:
+            return
+        temp_file = f'{self.queue_file}.tmp'
+        with open(temp_file,
+                  'w',
+                  encoding='utf-8') as queue_writer:
+            json.dump({
+                    'items': self.items},
+                    queue_writer,
+                    indent=4,
+                    ensure_ascii=False)
+        os.replace(temp_file,
+                   self.queue_file)
+        self._dirty = False
+
+    # ---- planner side -----------------------------------------------------
+
+    def is_held(self,
+                key: str,
+                now: datetime = None) -> bool:
+        """True while the operation is backing off or quarantined."""
+        item = self.items.get(key)
+        if not item:
+            return False
+        now = now or _parse_time(utc_now())
+        return now < _parse_time(item['next_attempt'])
+
+    def hold_back(self,
+                  plan: SyncPlan,
+                  forget_unplanned: bool = True) -> list[SyncOperation]:
+        """Drop held operations from the plan and forget items the planner no longer produces.
+
+        forget_unplanned is off for a narrow sync window, which plans only part of the calendars."""
+        now = _parse_time(utc_now())
+        planned_keys = {operation.key for operation in plan}
+        held = [operation for operation in plan if self.is_held(operation.key,
+                                                                now)]
+        if held:
+            held_keys = {operation.key for operation in held}
+            plan.operations = [operation for operation in plan if operation.key not in held_keys]
+        # gone from the plan: the event was fixed, deleted or synced some other way
+        if forget_unplanned:
+            for key in [key for key in self.items if key not in planned_keys and not self.is_held(key,
+                                                                                                 now)]:
+                del self.items[key]
+                self._dirty = True
+        waiting = [item for key, item in self.items.items() if self.is_held(key,
+                                                                          now)]
+        if waiting:
+            quarantined = sum(1 for item in waiting if item['classification'] == POISON)
+            print_box(f'{line_number()} [RETRY QUEUE] held back [{len(waiting)}] operations: backing off [{len(waiting) - quarantined}] quarantined [{quarantined}]')
+        return held
+
+    # ---- executor side ----------------------------------------------------
+
+    def record_failure(self,
+                       operation: SyncOperation,
+                       error) -> dict:
+        now = _parse_time(utc_now())
+        classification = classify_failure(error)
+        item = self.items.get(operation.key) or {
+                'attempts'          : 0,
+                'permanent_attempts': 0,
+                'first_failure'     : now.isoformat(),
+                'description'       : repr(operation)}
+        item['attempts'] += 1
+        if classification == PERMANENT:
+            item['permanent_attempts'] += 1
+        item['last_failure'] = now.isoformat()
+        item['last_error'] = str(error)[:500]
+        if item['permanent_attempts'] >= constants.RETRY_POISON_ATTEMPTS or item['attempts'] >= constants.RETRY_MAX_ATTEMPTS:
+            classification = POISON
+            delay = timedelta(days=constants.RETRY_QUARANTINE_DAYS)
+            print_display(f'{line_number()} [RETRY QUEUE] QUARANTINED after [{item["attempts"]}] failures: [{operation}]: [{item["last_error"]}]')
+        else:
+            delay = timedelta(seconds=min(constants.RETRY_BACKOFF_BASE * 2 ** (item['attempts'] - 1),
+                                          constants.RETRY_BACKOFF_MAX))
+        item['classification'] = classification
+        item['next_attempt'] = (now + delay).isoformat()
+        self.items[operation.key] = item
+        self._dirty = True
+        return item
+
+    def record_success(self,
+                       operation: SyncOperation):
+        if self.items.pop(operation.key,
+                          None) is not None:
+            self._dirty = True
+
+    def release(self,
+                key: str = None):
+        """Let a quarantined operation (or every held one, without a key) run on the next cycle."""
+        for item_key in [key] if key else list(self.items):
+            if item_key in self.items:
+                del self.items[item_key]
+                self._dirty = True
+        self.save()
+
+    def quarantined(self) -> dict[str, dict]:
+        return {key: item for key, item in self.items.items() if item['classification'] == POISON}
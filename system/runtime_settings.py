@@ -0,0 +1,30 @@
+# system/runtime_settings.py
+import json
+import os
+from pathlib import Path
+
+import system.constants as constants
+
+SETTINGS_FILE = str((Path(__file__).resolve().parent.parent / 'resources' / 'database' / 'settings.json').resolve())
+
+
+def load_runtime_settings():
+    """Load persisted settings and apply them to constants at startup."""
+    if not os.path.exists(SETTINGS_FILE):
+        return
+    try:
+        with open(SETTINGS_FILE,
+                  'r') as f:
+            data = json.load(f)
+        if 'day_past' in data:
+            constants.DAY_PAST = int(data['day_past'])
+        if 'day_next' in data:
+            constants.DAY_NEXT = int(data['day_next'])
+        if 'interval_observer' in data:
+            constants.INTERVAL_OBSERVER = int(data['interval_observer'])
+        if 'interval_sync_job' in data:
+            constants.INTERVAL_SYNC_JOB = int(data['interval_sync_job'])
+        if 'map_retention_days' in data:
+            constants.MAP_RETENTION_DAYS = int(data['map_retention_days'])
+    except Exception:
+        pass
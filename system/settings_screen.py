@@ -2,47 +2,26 @@
 import json
 import os
 import tkinter as tk
-from pathlib import Path
 
 import system.constants as constants
-
-SETTINGS_FILE = str((Path(__file__).resolve().parent.parent / 'resources' / 'database' / 'settings.json').resolve())
+from system.runtime_settings import SETTINGS_FILE
 
 # Keys managed by this screen
 _SETTING_KEYS = ('day_past',
                  'day_next',
                  'interval_observer',
                  'interval_sync_job',
+                 'map_retention_days',
                  'settings_geom')
 
 _settings_win = None
 
-screen_size = '450x420'
+screen_size = '450x470'
 
 # ---------------------------------------------------------------------------
 # Persistence helpers
 # ---------------------------------------------------------------------------
 
-def load_runtime_settings():
-    """Load persisted settings and apply them to constants at startup."""
-    if not os.path.exists(SETTINGS_FILE):
-        return
-    try:
-        with open(SETTINGS_FILE,
-                  'r') as f:
-            data = json.load(f)
-        if 'day_past' in data:
-            constants.DAY_PAST = int(data['day_past'])
-        if 'day_next' in data:
-            constants.DAY_NEXT = int(data['day_next'])
-        if 'interval_observer' in data:
-            constants.INTERVAL_OBSERVER = int(data['interval_observer'])
-        if 'interval_sync_job' in data:
-            constants.INTERVAL_SYNC_JOB = int(data['interval_sync_job'])
-    except Exception:
-        pass
-
-
 def _save_runtime_settings(extra: dict | None = None):
     """Merge runtime settings into the shared settings.json file."""
     try:
@@ -54,10 +33,11 @@ def _save_runtime_settings(extra: dict | None = None):
                       'r') as f:
                 existing = json.load(f)
         existing.update({
-                'day_past'         : constants.DAY_PAST,
-                'day_next'         : constants.DAY_NEXT,
-                'interval_observer': constants.INTERVAL_OBSERVER,
-                'interval_sync_job': constants.INTERVAL_SYNC_JOB, })
+                'day_past'          : constants.DAY_PAST,
+                'day_next'          : constants.DAY_NEXT,
+                'interval_observer' : constants.INTERVAL_OBSERVER,
+                'interval_sync_job' : constants.INTERVAL_SYNC_JOB,
+                'map_retention_days': constants.MAP_RETENTION_DAYS, })
         if extra:
             existing.update(extra)
         with open(SETTINGS_FILE,
@@ -193,14 +173,19 @@ def _create_or_raise_settings(root: tk.Tk):
             ('interval_sync_job',
              'Sync Job Interval',
              'seconds',
-             lambda v: v >= 60), ]
+             lambda v: v >= 60),
+            ('map_retention_days',
+             'Map Retention',
+             'days',
+             lambda v: v >= 0), ]
 
     def _current_value(key1: str) -> int:
         return {
-                'day_past'         : constants.DAY_PAST,
-                'day_next'         : constants.DAY_NEXT,
-                'interval_observer': constants.INTERVAL_OBSERVER,
-                'interval_sync_job': constants.INTERVAL_SYNC_JOB}[key1]
+                'day_past'          : constants.DAY_PAST,
+                'day_next'          : constants.DAY_NEXT,
+                'interval_observer' : constants.INTERVAL_OBSERVER,
+                'interval_sync_job' : constants.INTERVAL_SYNC_JOB,
+                'map_retention_days': constants.MAP_RETENTION_DAYS}[key1]
 
     grid = tk.Frame(card_frame,
                     bg=card)
@@ -336,6 +321,7 @@ def _create_or_raise_settings(root: tk.Tk):
         constants.DAY_NEXT = new_vals['day_next']
         constants.INTERVAL_OBSERVER = new_vals['interval_observer']
         constants.INTERVAL_SYNC_JOB = new_vals['interval_sync_job']
+        constants.MAP_RETENTION_DAYS = new_vals['map_retention_days']
 
         _save_runtime_settings()
         hint_var.set('✓ Settings applied and saved.')
@@ -344,10 +330,11 @@ def _create_or_raise_settings(root: tk.Tk):
 
     def _reset():
         defaults = {
-                'day_past'         : 18,
-                'day_next'         : 180,
-                'interval_observer': 280,
-                'interval_sync_job': 60 * 60 * 2}
+                'day_past'          : 18,
+                'day_next'          : 180,
+                'interval_observer' : 280,
+                'interval_sync_job' : 60 * 60 * 2,
+                'map_retention_days': 7}
         for key3, ent3 in entries.items():
             ent3.delete(0,
                        tk.END)
@@ -0,0 +1,63 @@
+from datetime import datetime
+from datetime import timezone
+
+import system.constants as constants
+
+from system.sync_window import SyncWindow
+
+
+class SnapshotCache:
+    """Listings of the last full-window snapshot, with the window they covered.
+
+    The next full-window SyncSnapshot starts from them: the slices that
+    entered the window at either edge are read in full, whatever fell off is
+    dropped, and the middle is brought up to date from what changed since
+    fetched_at.  The dictionaries are the snapshot's own, so the executor's
+    writes land here too.
+    """
+
+    def __init__(self):
+        self.window: SyncWindow | None = None
+        # UTC time the remembered listings were started at
+        self.fetched_at: datetime | None = None
+        self.recurrence_mode: str | None = None
+        self.ms_outlook_instances: dict[str, dict] = dict()
+        self.g_calendar_events: dict[str, dict] = dict()
+        self.g_calendar_masters: dict[str, dict] = dict()
+        self.g_calendar_cancelled: dict[str, dict] = dict()
+        # full-window snapshots that started from these listings, and those read in full
+        self.delta_hits = 0
+        self.delta_misses = 0
+
+    def count(self,
+              delta: bool):
+        if delta:
+            self.delta_hits += 1
+        else:
+            self.delta_misses += 1
+
+    def usable(self,
+               sync_window: SyncWindow) -> bool:
+        if not constants.SNAPSHOT_DELTA_ENABLED or not sync_window.full or self.window is None:
+            return False
+        # the listings are shaped differently in each recurrence mode
+        if self.recurrence_mode != constants.RECURRENCE_SYNC_MODE:
+            return False
+        if (datetime.now(timezone.utc) - self.fetched_at).total_seconds() > constants.SNAPSHOT_DELTA_MAX_AGE:
+            return False
+        return sync_window.begin < self.window.end and self.window.begin < sync_window.end
+
+    def store(self,
+              snapshot,
+              fetched_at: datetime):
+        self.window = snapshot.window
+        self.fetched_at = fetched_at
+        self.recurrence_mode = constants.RECURRENCE_SYNC_MODE
+        self.ms_outlook_instances = snapshot.ms_outlook_instances
+        self.g_calendar_events = snapshot.g_calendar_events
+        self.g_calendar_masters = snapshot.g_calendar_masters
+        self.g_calendar_cancelled = snapshot.g_calendar_cancelled
+
+    def clear(self):
+        self.window = None
+        self.fetched_at = None
@@ -0,0 +1,98 @@
+import builtins
+import sys
+import threading
+import time
+
+
+class StartupReport:
+    """Where the time between launch and a usable app goes.
+
+    The entry point creates it first thing; step() records named
+    milestones.  trace_imports() also times every module imported by the
+    thread that called it, like `python -X importtime`: cumulative time
+    includes the modules it imported in turn, self time does not.  Keep this
+    module free of other imports from the repo so it can be loaded before
+    anything it should measure.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # (milestone, seconds since started)
+        self.steps: list[tuple[str, float]] = list()
+        # module name => (cumulative seconds, self seconds)
+        self.imports: dict[str, tuple[float, float]] = dict()
+        self._original_import = None
+        self._thread_id: int | None = None
+        # time spent in nested imports, one entry per import in progress
+        self._children: list[float] = list()
+
+    def step(self,
+             name: str):
+        self.steps.append((name,
+                           time.perf_counter() - self.started))
+
+    def elapsed(self,
+                name: str) -> float | None:
+        return next((seconds for step_name, seconds in self.steps if step_name == name),
+                    None)
+
+    # ---- import tracing ---------------------------------------------------
+
+    def trace_imports(self):
+        if self._original_import is not None:
+            return
+        self._original_import = builtins.__import__
+        self._thread_id = threading.get_ident()
+        builtins.__import__ = self._import
+
+    def stop_tracing(self):
+        if self._original_import is None:
+            return
+        builtins.__import__ = self._original_import
+        self._original_import = None
+
+    def _import(self,
+                name,
+                globals=None,
+                locals=None,
+                fromlist=(),
+                level=0):
+        original_import = self._original_import
+        # other threads, relative imports and modules already loaded are not timed
+        if original_import is None or threading.get_ident() != self._thread_id or level or name in sys.modules:
+            return (original_import or builtins.__import__)(name,
+                                                            globals,
+                                                            locals,
+                                                            fromlist,
+                                                            level)
+        time_start = time.perf_counter()
+        self._children.append(0.0)
+        try:
+            return original_import(name,
+                                   globals,
+                                   locals,
+                                   fromlist,
+                                   level)
+        finally:
+            cumulative = time.perf_counter() - time_start
+            children = self._children.pop()
+            self.imports[name] = (cumulative,
+                                  cumulative - children)
+            if self._children:
+                self._children[-1] += cumulative
+
+    # ---- report -----------------------------------------------------------
+
+    def report(self,
+               top: int = 15) -> str:
+        lines = ['STARTUP REPORT: milestones since launch']
+        for name, seconds in self.steps:
+            lines.append(f'    {seconds * 1000:9.1f} ms  {name}')
+        if self.imports:
+            lines.append(f'STARTUP REPORT: slowest {min(top, len(self.imports))} of {len(self.imports)} imports (self ms | cumulative ms | module)')
+            slowest = sorted(self.imports.items(),
+                             key=lambda item: item[1][0],
+                             reverse=True)[:top]
+            for name, (cumulative, own) in slowest:
+                lines.append(f'    {own * 1000:9.1f} | {cumulative * 1000:9.1f} | {name}')
+        return '\n'.join(lines)
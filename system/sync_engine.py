@@ -0,0 +1,185 @@
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import system.constants as constants
+
+from system.dirty_queue import ms_outlook_dirty_queue
+from system.g_calendar_push import g_calendar_push
+from system.snapshot_cache import SnapshotCache
+from system.sync_pacer import sync_pacer
+from system.sync_plan import SyncPlan
+from system.sync_window import SyncWindow
+from system.tools import line_number
+from system.tools import print_display
+from system.tools import utc_now
+
+if TYPE_CHECKING:
+    from system.sync_tasks import SyncTask
+
+# what asked for a sync cycle
+TRIGGER_SCHEDULE = 'schedule'
+TRIGGER_OUTLOOK = 'outlook events'
+TRIGGER_GOOGLE = 'google push'
+TRIGGER_USER = 'user'
+
+# no cycle running
+PHASE_IDLE = 'idle'
+# the first cycle is loading the connectors and building its SyncTask
+PHASE_STARTING = 'starting'
+
+
+def _hit_rate(hits: int,
+              misses: int) -> float | None:
+    return round(hits / (hits + misses),
+                 3) if hits + misses else None
+
+
+class SyncEngine:
+    """Process-lifetime owner of the sync state, one cycle at a time.
+
+    The SyncTask behind run_cycle() is built on the first cycle and kept
+    (the connectors and their Google / Outlook libraries are imported then,
+    not when the app starts):
+    the EventMapping stays loaded, the Google service and credentials stay
+    built, and the Outlook connector, snapshot cache and retry queue keep
+    what they learnt.  Each cycle only re-checks the Outlook connection and
+    whether event_map.json was rewritten by another process.
+    """
+
+    def __init__(self,
+                 stop_event: threading.Event = None):
+        self.stop_event = stop_event
+        self.snapshot_cache = SnapshotCache()
+        self._lock = threading.Lock()
+        self._sync_task: 'SyncTask | None' = None
+        # set by cancel(), cleared when the next cycle starts
+        self._cancel_event = threading.Event()
+        # set by stop(): the SyncTask is closed as soon as no cycle uses it
+        self._stopping = False
+        self.cycles = 0
+        # trigger, window, operations, executor counts, elapsed seconds and end time of the last cycle
+        self.last_cycle: dict = dict()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    @property
+    def phase(self) -> str:
+        sync_task = self._sync_task
+        if not self.busy:
+            return PHASE_IDLE
+        return sync_task.phase if sync_task is not None else PHASE_STARTING
+
+    def cancel(self) -> bool:
+        """Give up the running cycle at its next step; False when none is running."""
+        if not self.busy:
+            return False
+        self._cancel_event.set()
+        print_display(f'{line_number()} [SYNC ENGINE] cancel requested during [{self.phase}]')
+        return True
+
+    def stop(self):
+        """Shut the Google worker pool down now, or when the running cycle returns."""
+        self._stopping = True
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._close()
+        finally:
+            self._lock.release()
+
+    def _close(self):
+        if self._sync_task is not None:
+            self._sync_task.close()
+            self._sync_task = None
+
+    def _prepare(self) -> 'SyncTask':
+        if self._sync_task is None:
+            time_start = time.monotonic()
+            from system.sync_tasks import SyncTask
+            self._sync_task = SyncTask(stop_event=self.stop_event,
+                                       snapshot_cache=self.snapshot_cache,
+                                       cancel_event=self._cancel_event)
+            print_display(f'{line_number()} [SYNC ENGINE] started in [{time.monotonic() - time_start:.2f}]s')
+            return self._sync_task
+        self._sync_task.refresh_connections()
+        if self._sync_task.event_mapping.reload_if_changed():
+            # the remembered listings were paired against the old map
+            self.snapshot_cache.clear()
+        return self._sync_task
+
+    def run_cycle(self,
+                  trigger: str = TRIGGER_SCHEDULE,
+                  dry_run: bool = constants.SYNC_DRY_RUN) -> SyncPlan | None:
+        """One sync cycle for the trigger; None when the trigger had nothing left to sync."""
+        with self._lock:
+            time_start = time.monotonic()
+            self._cancel_event.clear()
+            sync_task = self._prepare()
+            sync_plan = None
+            try:
+                if trigger == TRIGGER_OUTLOOK:
+                    # taken here: a request dropped while a cycle ran leaves the batch queued
+                    dirty_batch = ms_outlook_dirty_queue.take()
+                    if dirty_batch:
+                        sync_plan = sync_task.sync_dirty(dirty_batch,
+                                                         dry_run)
+                elif trigger == TRIGGER_GOOGLE:
+                    if g_calendar_push.take():
+                        # the cached Outlook listing may be up to INTERVAL_SYNC_JOB old
+                        sync_task.ms_outlook_connection.invalidate_cache()
+                        sync_plan = sync_task.sync_task(dry_run,
+                                                        SyncWindow())
+                elif trigger == TRIGGER_USER:
+                    # asked for by hand: the whole window, whatever tier is due, as Outlook has it now
+                    sync_task.ms_outlook_connection.invalidate_cache()
+                    sync_plan = sync_task.sync_task(dry_run,
+                                                    SyncWindow(),
+                                                    probe=False)
+                else:
+                    sync_plan = sync_task.sync_task(dry_run)
+            except Exception:
+                # start over from what is on disk; the mapping was saved when its batch ended
+                self._close()
+                raise
+            finally:
+                if self._stopping:
+                    self._close()
+            self.cycles += 1
+            self.last_cycle = {
+                    'trigger'    : trigger,
+                    'window'     : sync_task.last_window.name if sync_plan is not None and sync_task.last_window else None,
+                    'operations' : len(sync_plan) if sync_plan is not None else 0,
+                    'statistics' : sync_task.statistics if sync_plan is not None else None,
+                    'cancelled'  : self._cancel_event.is_set(),
+                    'elapsed'    : round(time.monotonic() - time_start,
+                                         2),
+                    'finished_at': utc_now()}
+            return sync_plan
+
+    def statistics(self) -> dict:
+        """Phase, what is waiting, the last cycle and the cache hit rates, for the control socket."""
+        sync_task = self._sync_task
+        retry_queue = sync_task.retry_queue if sync_task is not None else None
+        ms_outlook_cache = sync_task.ms_outlook_connection.cache_statistics if sync_task is not None else None
+        return {
+                'phase'     : self.phase,
+                'cycles'    : self.cycles,
+                'last_cycle': self.last_cycle,
+                'queues'    : {
+                        'outlook_events'     : len(ms_outlook_dirty_queue),
+                        'google_push_pending': g_calendar_push.ready(),
+                        'retry_waiting'      : len(retry_queue.items) if retry_queue is not None else None,
+                        'retry_quarantined'  : len(retry_queue.quarantined()) if retry_queue is not None else None},
+                'caches'    : {
+                        'snapshot_delta' : _hit_rate(self.snapshot_cache.delta_hits,
+                                                     self.snapshot_cache.delta_misses),
+                        'outlook_listing': _hit_rate(ms_outlook_cache['listing_hits'],
+                                                     ms_outlook_cache['listing_misses']) if ms_outlook_cache else None,
+                        'outlook_items'  : _hit_rate(ms_outlook_cache['items_reused'],
+                                                     ms_outlook_cache['items_read']) if ms_outlook_cache else None,
+                        'probe_skips'    : _hit_rate(sync_pacer.probe_skips,
+                                                     sync_pacer.probes - sync_pacer.probe_skips)},
+                'interval'  : sync_pacer.interval()}
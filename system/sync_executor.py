@@ -0,0 +1,674 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from contextlib import nullcontext
+
+from googleapiclient.errors import HttpError
+
+import system.constants as constants
+
+from connector.calendar_instance import CalendarInstance
+from connector.event_mapping import EventSide
+from connector.g_calendar import GoogleCalendarConnector
+from connector.ms_outlook import MicrosoftOutlookConnector
+from system.retry_queue import RetryQueue
+from system.sync_plan import SyncAction
+from system.sync_plan import SyncKind
+from system.sync_plan import SyncOperation
+from system.sync_plan import SyncPlan
+from system.sync_journal import STEP_COMPLETED
+from system.sync_journal import STEP_EXECUTED
+from system.sync_journal import STEP_FAILED
+from system.sync_journal import STEP_STARTED
+from system.sync_journal import SyncJournal
+from system.sync_snapshot import SyncSnapshot
+from system.tools import create_date_id
+from system.tools import extract_date_id
+from system.tools import g_calendar_start_key
+from system.tools import get_master_id
+from system.tools import line_number
+from system.tools import local_date_key
+from system.tools import print_box
+from system.tools import print_display
+from system.tools import strip_symbols
+from system.tools import trim_id
+from system.tools import utc_key
+
+# SyncOperation.result values shared by the handlers
+_DELETED = 'deleted'
+_MISSING = 'missing'
+_SKIPPED = 'skipped'
+# SyncOperation.error of an operation not started because a stop was requested,
+# or because the cycle ran out of time; both are also the statistics keys
+_STOPPED = 'stopped'
+_DEFERRED = 'deferred'
+
+
+def _master_mode() -> bool:
+    return constants.RECURRENCE_SYNC_MODE == constants.RECURRENCE_MODE_MASTER
+
+
+def _journal_outcome(operation: SyncOperation) -> dict:
+    """What SyncJournal needs to replay the mapping side of an executed operation."""
+    result = operation.result[0] if isinstance(operation.result,
+                                               tuple) else operation.result
+    body = operation.payload.get('body',
+                                 dict())
+    outcome = {
+            'applied'               : result != _SKIPPED,
+            'instance_name'         : body.get('summary') or body.get('Subject'),
+            'instance_end'          : operation.payload.get('instance_end'),
+            'ms_outlook_instance_id': operation.payload.get('ms_outlook_instance_id')}
+    if isinstance(result,
+                  dict):
+        if 'EntryID' in result:
+            outcome['ms_outlook_id'] = result['EntryID']
+        elif 'id' in result:
+            outcome['g_calendar_id'] = result['id']
+    return outcome
+
+
+def _join_occurrences(ms_outlook_instances: list[dict],
+                      g_calendar_instances: list[dict]) -> tuple[list[tuple[dict, dict]], list[dict], list[dict]]:
+    """Hash join of both occurrence lists on UTC start (local date for all-day).
+
+    Returns the matched (Outlook, Google) pairs plus whatever was left on each side.
+    """
+    ms_outlook_by_start = dict()
+    for ms_outlook_instance in ms_outlook_instances:
+        ms_outlook_start_key = utc_key(ms_outlook_instance.get('StartUTC'))
+        if ms_outlook_start_key:
+            ms_outlook_by_start.setdefault(ms_outlook_start_key,
+                                           ms_outlook_instance)
+        ms_outlook_date_key = local_date_key(ms_outlook_instance.get('Start'))
+        if ms_outlook_date_key:
+            ms_outlook_by_start.setdefault(ms_outlook_date_key,
+                                           ms_outlook_instance)
+    matched = list()
+    matched_ms_outlook = set()
+    g_calendar_unmatched = list()
+    for g_calendar_instance in g_calendar_instances:
+        ms_outlook_instance = ms_outlook_by_start.get(g_calendar_start_key(g_calendar_instance))
+        if ms_outlook_instance is None or id(ms_outlook_instance) in matched_ms_outlook:
+            g_calendar_unmatched.append(g_calendar_instance)
+            continue
+        matched_ms_outlook.add(id(ms_outlook_instance))
+        matched.append((ms_outlook_instance,
+                        g_calendar_instance))
+    ms_outlook_unmatched = [ms_outlook_instance for ms_outlook_instance in ms_outlook_instances if id(ms_outlook_instance) not in matched_ms_outlook]
+    return matched, ms_outlook_unmatched, g_calendar_unmatched
+
+
+def _report_unmatched_occurrences(ms_outlook_master_id: str,
+                                  ms_outlook_unmatched: list[dict],
+                                  g_calendar_unmatched: list[dict]):
+    for ms_outlook_instance in ms_outlook_unmatched:
+        print_display(f'{line_number()} [Microsoft Outlook] UNMATCHED OCCURRENCE [{trim_id(ms_outlook_master_id)}] start [{ms_outlook_instance.get("StartUTC")}]')
+    for g_calendar_instance in g_calendar_unmatched:
+        print_display(f'{line_number()} [Google Calendar] UNMATCHED OCCURRENCE [{trim_id(g_calendar_instance.get("id"))}] start [{g_calendar_start_key(g_calendar_instance)}]')
+
+
+class SyncExecutor:
+    """Applies a SyncPlan.
+
+    Every handler is split in two: `_execute_*` does the remote calls and
+    returns their result, `_complete_*` records that result in the snapshot
+    and the EventMapping.  Only the complete step touches shared state, and
+    it always runs on the calling (sync) thread.
+    """
+
+    def __init__(self,
+                 snapshot: SyncSnapshot,
+                 ms_outlook_connection: MicrosoftOutlookConnector,
+                 g_calendar_connection: GoogleCalendarConnector,
+                 g_calendar_workers: int = constants.SYNC_G_CALENDAR_WORKERS,
+                 sync_journal: SyncJournal = None,
+                 stop_event: threading.Event = None,
+                 retry_queue: RetryQueue = None,
+                 deadline: float = None,
+                 cancel_event: threading.Event = None,
+                 g_calendar_pool: ThreadPoolExecutor = None):
+        self.snapshot = snapshot
+        self.ms_outlook_connection = ms_outlook_connection
+        self.g_calendar_connection = g_calendar_connection
+        # intent journal of the cycle (see SyncJournal) and the app's stop request, both optional
+        self.sync_journal = sync_journal
+        self.stop_event = stop_event
+        # a cancel from the control socket: like a stop, but for this cycle only
+        self.cancel_event = cancel_event
+        # failures are recorded there so the planner backs off instead of retrying every cycle
+        self.retry_queue = retry_queue
+        # time.monotonic() after which no operation is started; the rest carries over to the next cycle
+        self.deadline = deadline
+        self.g_calendar_workers = max(1,
+                                      g_calendar_workers)
+        # a pool kept by the caller across cycles, so its threads keep their Google services; one per execute() otherwise
+        self.g_calendar_pool = g_calendar_pool
+        # (action, kind, target) => (execute step, complete step, lane the execute step runs on)
+        self._handlers = {
+                (SyncAction.DELETE, SyncKind.SINGLE, EventSide.G_CALENDAR)               : (self._execute_delete_single_g_calendar,
+                                                                                            self._complete_delete_single_g_calendar,
+                                                                                            EventSide.G_CALENDAR),
+                (SyncAction.DELETE, SyncKind.SINGLE, EventSide.MS_OUTLOOK)               : (self._execute_delete_single_ms_outlook,
+                                                                                            self._complete_delete_single_ms_outlook,
+                                                                                            EventSide.MS_OUTLOOK),
+                (SyncAction.DELETE_OCCURRENCE, SyncKind.OCCURRENCE, EventSide.G_CALENDAR): (self._execute_delete_occurrence_g_calendar,
+                                                                                            self._complete_delete_occurrence,
+                                                                                            EventSide.G_CALENDAR),
+                (SyncAction.DELETE_OCCURRENCE, SyncKind.OCCURRENCE, EventSide.MS_OUTLOOK): (self._execute_delete_occurrence_ms_outlook,
+                                                                                            self._complete_delete_occurrence,
+                                                                                            EventSide.MS_OUTLOOK),
+                (SyncAction.DELETE, SyncKind.RECURRENT, EventSide.G_CALENDAR)            : (self._execute_delete_recurrent_g_calendar,
+                                                                                            self._complete_delete_recurrent_g_calendar,
+                                                                                            EventSide.G_CALENDAR),
+                (SyncAction.DELETE, SyncKind.RECURRENT, EventSide.MS_OUTLOOK)            : (self._execute_delete_recurrent_ms_outlook,
+                                                                                            self._complete_delete_recurrent_ms_outlook,
+                                                                                            EventSide.MS_OUTLOOK),
+                (SyncAction.INSERT, SyncKind.SINGLE, EventSide.G_CALENDAR)               : (self._execute_insert_single_g_calendar,
+                                                                                            self._complete_insert_single_g_calendar,
+                                                                                            EventSide.G_CALENDAR),
+                (SyncAction.INSERT, SyncKind.SINGLE, EventSide.MS_OUTLOOK)               : (self._execute_insert_single_ms_outlook,
+                                                                                            self._complete_insert_single_ms_outlook,
+                                                                                            EventSide.MS_OUTLOOK),
+                (SyncAction.INSERT, SyncKind.RECURRENT, EventSide.G_CALENDAR)            : (self._execute_insert_recurrent_g_calendar,
+                                                                                            self._complete_insert_recurrent_g_calendar,
+                                                                                            EventSide.G_CALENDAR),
+                (SyncAction.INSERT, SyncKind.RECURRENT, EventSide.MS_OUTLOOK)            : (self._execute_insert_recurrent_ms_outlook,
+                                                                                            self._complete_insert_recurrent_ms_outlook,
+                                                                                            EventSide.MS_OUTLOOK),
+                (SyncAction.UPDATE, SyncKind.SINGLE, EventSide.G_CALENDAR)               : (self._execute_update_single_g_calendar,
+                                                                                            self._complete_update_single_g_calendar,
+                                                                                            EventSide.G_CALENDAR),
+                (SyncAction.UPDATE, SyncKind.SINGLE, EventSide.MS_OUTLOOK)               : (self._execute_update_single_ms_outlook,
+                                                                                            self._complete_update_single_ms_outlook,
+                                                                                            EventSide.MS_OUTLOOK),
+                (SyncAction.UPDATE, SyncKind.RECURRENT, EventSide.G_CALENDAR)            : (self._execute_patch_g_calendar,
+                                                                                            self._complete_update_recurrent_g_calendar,
+                                                                                            EventSide.G_CALENDAR),
+                (SyncAction.UPDATE, SyncKind.OCCURRENCE, EventSide.G_CALENDAR)           : (self._execute_patch_g_calendar,
+                                                                                            self._complete_update_occurrence_g_calendar,
+                                                                                            EventSide.G_CALENDAR),
+                (SyncAction.REPAIR_MAPPING, SyncKind.SINGLE, None)                       : (None,
+                                                                                            self._complete_repair_fingerprint,
+                                                                                            None),
+                (SyncAction.REPAIR_MAPPING, SyncKind.OCCURRENCE, None)                   : (None,
+                                                                                            self._complete_repair_occurrence,
+                                                                                            None)}
+
+    def execute(self,
+                plan: SyncPlan) -> dict:
+        """Google operations run on a worker pool; Outlook operations stay on
+        this thread, which owns the COM connection.  Every complete step runs
+        here too, inside one EventMapping.batch(), so the map is saved once."""
+        statistics = {
+                'done'    : 0,
+                'failed'  : 0,
+                'stopped' : 0,
+                'deferred': 0,
+                'elapsed' : 0.0}
+        time_start = time.monotonic()
+        g_calendar_operations = list()
+        ms_outlook_operations = list()
+        mapping_operations = list()
+        for operation in plan:
+            lane = self.lane(operation)
+            if lane == EventSide.G_CALENDAR:
+                g_calendar_operations.append(operation)
+            elif lane == EventSide.MS_OUTLOOK:
+                ms_outlook_operations.append(operation)
+            else:
+                mapping_operations.append(operation)
+        print_box(f'{line_number()} SYNC PLAN EXECUTING: [Google Calendar] [{len(g_calendar_operations)}] x{self.g_calendar_workers} / [Microsoft Outlook] [{len(ms_outlook_operations)}] x1 / [EVENT MAPPING] [{len(mapping_operations)}]')
+        with self.snapshot.event_mapping.batch():
+            with self._g_calendar_pool() as g_calendar_pool:
+                g_calendar_futures = dict()
+                for operation in g_calendar_operations:
+                    g_calendar_futures[g_calendar_pool.submit(self._execute_step,
+                                                              operation)] = operation
+                for operation in ms_outlook_operations:
+                    self._count(statistics,
+                                self.run_operation(operation))
+                    # fold in whatever Google finished meanwhile, so the snapshot keeps up
+                    for g_calendar_future in [g_calendar_future for g_calendar_future in g_calendar_futures if g_calendar_future.done()]:
+                        self._count(statistics,
+                                    self._complete_step(g_calendar_futures.pop(g_calendar_future)))
+                for g_calendar_future in as_completed(list(g_calendar_futures)):
+                    self._count(statistics,
+                                self._complete_step(g_calendar_futures.pop(g_calendar_future)))
+            for operation in mapping_operations:
+                self._count(statistics,
+                            self.run_operation(operation))
+        statistics['elapsed'] = round(time.monotonic() - time_start,
+                                      3)
+        print_box(f'{line_number()} SYNC PLAN EXECUTED: done [{statistics["done"]}] failed [{statistics["failed"]}] stopped [{statistics["stopped"]}] deferred [{statistics["deferred"]}] in [{statistics["elapsed"]}]s')
+        if statistics['deferred']:
+            self._report_deferred(plan)
+        return statistics
+
+    def _g_calendar_pool(self):
+        if self.g_calendar_pool is not None:
+            # not shut down here: its owner does that
+            return nullcontext(self.g_calendar_pool)
+        return ThreadPoolExecutor(max_workers=self.g_calendar_workers,
+                                  thread_name_prefix='GoogleCalendarLane')
+
+    @staticmethod
+    def _report_deferred(plan: SyncPlan):
+        deferred = [operation for operation in plan if operation.error is _DEFERRED]
+        starts = [operation.start for operation in deferred if operation.start]
+        nearest = f', nearest event starts [{min(starts).isoformat()}]' if starts else ''
+        print_box(f'{line_number()} SYNC CYCLE BUDGET SPENT: [{len(deferred)}] operations carried over to the next cycle{nearest}')
+        for operation in deferred:
+            print_display(f'{line_number()} DEFERRED: [{operation}]')
+
+    @staticmethod
+    def _count(statistics: dict,
+               succeeded: bool | str):
+        if succeeded in (_STOPPED,
+                         _DEFERRED):
+            statistics[succeeded] += 1
+            return
+        statistics['done' if succeeded else 'failed'] += 1
+
+    def _journal(self,
+                 operation: SyncOperation,
+                 step: str,
+                 outcome: dict = None):
+        if self.sync_journal is not None:
+            self.sync_journal.record(operation,
+                                     step,
+                                     outcome)
+
+    def lane(self,
+             operation: SyncOperation) -> EventSide | None:
+        """Backend the execute step talks to; None for mapping-only operations."""
+        handler = self._handlers.get((operation.action, operation.kind, operation.target))
+        return handler[2] if handler else None
+
+    def _stopped(self) -> bool:
+        return any(event is not None and event.is_set() for event in (self.stop_event,
+                                                                      self.cancel_event))
+
+    def _execute_step(self,
+                      operation: SyncOperation):
+        # worker thread: remote calls only, no snapshot or mapping access
+        execute_step = self._handlers[(operation.action, operation.kind, operation.target)][0]
+        # not started: left in the journal as planned, the next cycle plans it again
+        if self._stopped():
+            operation.error = _STOPPED
+            return
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            operation.error = _DEFERRED
+            return
+        print_display(f'{line_number()} SYNC PLAN: [{operation}]')
+        self._journal(operation,
+                      STEP_STARTED)
+        try:
+            operation.result = execute_step(operation)
+        except Exception as exception:
+            operation.error = exception
+            print_display(f'{line_number()} SYNC PLAN - ERROR: [{operation}]: [{exception}]')
+            self._journal(operation,
+                          STEP_FAILED)
+            return
+        self._journal(operation,
+                      STEP_EXECUTED,
+                      _journal_outcome(operation))
+
+    def _complete_step(self,
+                       operation: SyncOperation) -> bool | str:
+        if operation.error in (_STOPPED,
+                               _DEFERRED):
+            # not a failure: nothing was attempted
+            return operation.error
+        if operation.error is not None:
+            self._retry_later(operation)
+            return False
+        try:
+            self._handlers[(operation.action, operation.kind, operation.target)][1](operation)
+        except Exception as exception:
+            operation.error = exception
+            print_display(f'{line_number()} SYNC PLAN - ERROR: [{operation}]: [{exception}]')
+            self._journal(operation,
+                          STEP_FAILED)
+            self._retry_later(operation)
+            return False
+        self._journal(operation,
+                      STEP_COMPLETED)
+        if self.retry_queue is not None:
+            self.retry_queue.record_success(operation)
+        return True
+
+    def _retry_later(self,
+                     operation: SyncOperation):
+        if self.retry_queue is not None:
+            self.retry_queue.record_failure(operation,
+                                            operation.error)
+
+    def run_operation(self,
+                      operation: SyncOperation) -> bool | str:
+        """Execute and complete one operation on the calling thread.
+
+        Returns True or False, or _STOPPED / _DEFERRED when it was never started."""
+        handler = self._handlers.get((operation.action, operation.kind, operation.target))
+        if not handler:
+            operation.error = 'no handler'
+            print_display(f'{line_number()} SYNC PLAN - NO HANDLER FOR: [{operation}]')
+            return False
+        if handler[0]:
+            self._execute_step(operation)
+        return self._complete_step(operation)
+
+    def _g_calendar_read(self,
+                         g_calendar_id: str) -> dict | None:
+        try:
+            return self.g_calendar_connection.get_single_instance_g_calendar(g_calendar_id)
+        except HttpError as http_error:
+            if http_error.status_code in (404,
+                                          410):
+                return None
+            raise
+
+    # ---- single events -----------------------------------------------------
+
+    def _execute_delete_single_g_calendar(self,
+                                          operation: SyncOperation):
+        if operation.verify:
+            g_calendar_event = self._g_calendar_read(operation.g_calendar_id)
+            if not g_calendar_event or g_calendar_event.get('status') == 'cancelled':
+                return _MISSING
+            if 'recurrence' in g_calendar_event or 'recurringEventId' in g_calendar_event:
+                return _SKIPPED
+        self.g_calendar_connection.g_calendar_delete_instance(operation.g_calendar_id)
+        return _DELETED
+
+    def _complete_delete_single_g_calendar(self,
+                                           operation: SyncOperation):
+        if operation.result == _SKIPPED:
+            return
+        self.snapshot.remove_g_calendar_event(operation.g_calendar_id)
+        self.snapshot.remove_instance(operation.ms_outlook_id)
+
+    def _execute_delete_single_ms_outlook(self,
+                                          operation: SyncOperation):
+        if operation.verify:
+            ms_outlook_event = self.ms_outlook_connection.get_item_ms_outlook(operation.ms_outlook_id)
+            if not ms_outlook_event:
+                return _MISSING
+            if ms_outlook_event.get('IsRecurring',
+                                    False):
+                return _SKIPPED
+        self.ms_outlook_connection.delete_instance_ms_outlook(operation.ms_outlook_id)
+        return _DELETED
+
+    def _complete_delete_single_ms_outlook(self,
+                                           operation: SyncOperation):
+        if operation.result == _SKIPPED:
+            return
+        self.snapshot.remove_ms_outlook_event(operation.ms_outlook_id)
+        self.snapshot.remove_instance(operation.g_calendar_id)
+
+    def _execute_insert_single_g_calendar(self,
+                                          operation: SyncOperation):
+        return self.g_calendar_connection.g_calendar_insert_instance(operation.payload['body'])
+
+    def _complete_insert_single_g_calendar(self,
+                                           operation: SyncOperation):
+        g_calendar_inserted_appointment = operation.result
+        if not g_calendar_inserted_appointment:
+            raise ValueError('NO APPOINTMENT CREATED')
+        operation.g_calendar_id = g_calendar_inserted_appointment.get('id')
+        self.snapshot.add_g_calendar_event(g_calendar_inserted_appointment)
+        self.snapshot.insert_instance(operation.ms_outlook_id,
+                                      operation.g_calendar_id,
+                                      operation.payload['body'].get('summary'),
+                                      operation.payload.get('instance_end'))
+        g_calendar_inserted_event = CalendarInstance()
+        g_calendar_inserted_event.import_g_calendar(g_calendar_inserted_appointment)
+        self.snapshot.set_fingerprint(operation.ms_outlook_id,
+                                      operation.payload['source'].fingerprint(),
+                                      g_calendar_inserted_event.fingerprint())
+
+    def _execute_insert_single_ms_outlook(self,
+                                          operation: SyncOperation):
+        ms_outlook_inserted_appointment = self.ms_outlook_connection.insert_instance_ms_outlook(operation.payload['body'])
+        if not ms_outlook_inserted_appointment:
+            return None
+        return self.ms_outlook_connection.read_instance_ms_outlook(ms_outlook_inserted_appointment)
+
+    def _complete_insert_single_ms_outlook(self,
+                                           operation: SyncOperation):
+        ms_outlook_inserted_event = operation.result
+        if not ms_outlook_inserted_event:
+            raise ValueError('NO APPOINTMENT CREATED')
+        operation.ms_outlook_id = ms_outlook_inserted_event['EntryID']
+        self.snapshot.add_ms_outlook_event(ms_outlook_inserted_event)
+        self.snapshot.insert_instance(operation.ms_outlook_id,
+                                      operation.g_calendar_id,
+                                      operation.payload['body'].get('Subject'),
+                                      operation.payload.get('instance_end'))
+        # the Outlook side is fingerprinted on the next cycle from its listing
+        self.snapshot.set_fingerprint(operation.ms_outlook_id,
+                                      g_calendar_fingerprint=operation.payload['source'].fingerprint())
+
+    def _execute_update_single_g_calendar(self,
+                                          operation: SyncOperation):
+        return self.g_calendar_connection.g_calendar_update_instance(operation.g_calendar_id,
+                                                                     operation.payload['body'])
+
+    def _complete_update_single_g_calendar(self,
+                                           operation: SyncOperation):
+        g_calendar_updated_event = operation.result
+        self.snapshot.add_g_calendar_event(g_calendar_updated_event)
+        g_calendar_updated_instance = CalendarInstance()
+        g_calendar_updated_instance.import_g_calendar(g_calendar_updated_event)
+        self.snapshot.set_fingerprint(operation.ms_outlook_id,
+                                      operation.payload['fingerprints'][EventSide.MS_OUTLOOK.value],
+                                      g_calendar_updated_instance.fingerprint())
+
+    def _execute_update_single_ms_outlook(self,
+                                          operation: SyncOperation):
+        ms_outlook_updated_appointment = self.ms_outlook_connection.update_instance_ms_outlook(operation.ms_outlook_id,
+                                                                                               operation.payload['body'])
+        if not ms_outlook_updated_appointment:
+            return None
+        return self.ms_outlook_connection.read_instance_ms_outlook(ms_outlook_updated_appointment)
+
+    def _complete_update_single_ms_outlook(self,
+                                           operation: SyncOperation):
+        ms_outlook_updated_event = operation.result
+        if not ms_outlook_updated_event:
+            raise ValueError('NO APPOINTMENT UPDATED')
+        self.snapshot.remove_ms_outlook_event(operation.ms_outlook_id)
+        self.snapshot.add_ms_outlook_event(ms_outlook_updated_event)
+        ms_outlook_updated_instance = CalendarInstance()
+        ms_outlook_updated_instance.import_ms_outlook(ms_outlook_updated_event)
+        self.snapshot.set_fingerprint(operation.ms_outlook_id,
+                                      ms_outlook_updated_instance.fingerprint(),
+                                      operation.payload['fingerprints'][EventSide.G_CALENDAR.value])
+
+    def _complete_repair_fingerprint(self,
+                                     operation: SyncOperation):
+        self.snapshot.set_fingerprint(operation.ms_outlook_id,
+                                      operation.payload['fingerprints'][EventSide.MS_OUTLOOK.value],
+                                      operation.payload['fingerprints'][EventSide.G_CALENDAR.value])
+
+    # ---- occurrences -------------------------------------------------------
+
+    def _execute_delete_occurrence_g_calendar(self,
+                                              operation: SyncOperation):
+        if not operation.payload.get('g_calendar_listed',
+                                     True):
+            # already cancelled or gone on Google Calendar: only the mapping is left
+            return _MISSING
+        if self.g_calendar_connection.g_calendar_delete_instance(operation.g_calendar_id) == 'Failed':
+            return _MISSING
+        return _DELETED
+
+    def _execute_delete_occurrence_ms_outlook(self,
+                                              operation: SyncOperation):
+        g_calendar_start_utc = operation.payload.get('start_utc') or extract_date_id(operation.g_calendar_id)
+        if not g_calendar_start_utc:
+            raise ValueError(f'no start date in [{operation.g_calendar_id}]')
+        if not self.ms_outlook_connection.delete_occurrence_by_master_and_start_utc(operation.ms_outlook_id,
+                                                                                   g_calendar_start_utc,
+                                                                                   operation.payload.get('all_day',
+                                                                                                         False)):
+            return _MISSING
+        return _DELETED
+
+    def _complete_delete_occurrence(self,
+                                    operation: SyncOperation):
+        if operation.result not in (_DELETED,
+                                    _MISSING):
+            return
+        if operation.target == EventSide.G_CALENDAR:
+            self.snapshot.remove_g_calendar_event(operation.g_calendar_id)
+        self.snapshot.remove_generic_occurrence(operation.g_calendar_id,
+                                                keep_master=_master_mode())
+
+    # ---- master-level recurrence mode --------------------------------------
+
+    def _execute_patch_g_calendar(self,
+                                  operation: SyncOperation):
+        return self.g_calendar_connection.g_calendar_patch_instance(operation.g_calendar_id,
+                                                                    operation.payload['body'])
+
+    def _complete_update_recurrent_g_calendar(self,
+                                              operation: SyncOperation):
+        if not operation.result:
+            raise ValueError('SERIES NOT PATCHED')
+        self.snapshot.add_g_calendar_event(operation.result)
+
+    def _complete_update_occurrence_g_calendar(self,
+                                               operation: SyncOperation):
+        if not operation.result:
+            raise ValueError('OCCURRENCE NOT PATCHED')
+        self.snapshot.add_g_calendar_event(operation.result)
+        self._complete_repair_occurrence(operation)
+
+    def _complete_repair_occurrence(self,
+                                    operation: SyncOperation):
+        # only modified occurrences are materialized in the mapping
+        if operation.g_calendar_id in self.snapshot.occurrence_by_g_calendar:
+            return
+        self.snapshot.insert_occurrence(operation.ms_outlook_id,
+                                        operation.payload['ms_outlook_instance_id'],
+                                        operation.g_calendar_id)
+
+    # ---- recurrent events --------------------------------------------------
+
+    def _execute_delete_recurrent_g_calendar(self,
+                                             operation: SyncOperation):
+        if operation.verify:
+            g_calendar_event = self._g_calendar_read(operation.g_calendar_id)
+            if not g_calendar_event or g_calendar_event.get('status') == 'cancelled':
+                return _MISSING
+        self.g_calendar_connection.g_calendar_delete_instance(operation.g_calendar_id)
+        return _DELETED
+
+    def _complete_delete_recurrent_g_calendar(self,
+                                              operation: SyncOperation):
+        self.snapshot.remove_g_calendar_event(operation.g_calendar_id)
+        self.snapshot.remove_g_calendar_recurrence(get_master_id(operation.g_calendar_id))
+
+    def _execute_delete_recurrent_ms_outlook(self,
+                                             operation: SyncOperation):
+        # the series is not listed: cancelled, or only outside the window
+        g_calendar_event = self._g_calendar_read(operation.g_calendar_id)
+        if g_calendar_event and g_calendar_event.get('status') != 'cancelled':
+            return _SKIPPED
+        self.ms_outlook_connection.delete_instance_ms_outlook(operation.ms_outlook_id)
+        return _DELETED
+
+    def _complete_delete_recurrent_ms_outlook(self,
+                                              operation: SyncOperation):
+        if operation.result != _DELETED:
+            return
+        self.snapshot.remove_ms_outlook_event(operation.ms_outlook_id)
+        self.snapshot.remove_ms_outlook_recurrence(operation.ms_outlook_id)
+
+    def _execute_insert_recurrent_g_calendar(self,
+                                             operation: SyncOperation):
+        g_calendar_inserted_appointment = self.g_calendar_connection.g_calendar_insert_instance(operation.payload['body'])
+        if not g_calendar_inserted_appointment:
+            return None
+        if _master_mode():
+            return g_calendar_inserted_appointment, []
+        g_calendar_instances = self.g_calendar_connection.get_all_single_instances_inside_recurrence_g_calendar(g_calendar_inserted_appointment.get('id')).get('items',
+                                                                                                                                                                [])
+        return g_calendar_inserted_appointment, g_calendar_instances
+
+    def _complete_insert_recurrent_g_calendar(self,
+                                              operation: SyncOperation):
+        if not operation.result:
+            raise ValueError('NO APPOINTMENT CREATED')
+        g_calendar_inserted_appointment, g_calendar_instances = operation.result
+        g_calendar_id = g_calendar_inserted_appointment.get('id')
+        operation.g_calendar_id = g_calendar_id
+        ms_outlook_master_id = operation.ms_outlook_id
+        self.snapshot.add_g_calendar_event(g_calendar_inserted_appointment)
+        self.snapshot.insert_recurrence(ms_outlook_master_id,
+                                        g_calendar_id,
+                                        operation.payload['body'].get('summary'))
+        # Outlook follow-ups stay here, on the thread that owns the COM connection
+        self.ms_outlook_connection.set_recurrence_id(ms_outlook_master_id,
+                                                     get_master_id(g_calendar_id))
+        if _master_mode():
+            # exceptions follow on the next cycle through plan_recurrence_exceptions
+            return
+        ms_outlook_instances = self.ms_outlook_connection.get_recurrence_instances(operation.payload['ms_outlook_key'])
+        matched, ms_outlook_unmatched, g_calendar_unmatched = _join_occurrences(ms_outlook_instances,
+                                                                                g_calendar_instances)
+        _report_unmatched_occurrences(ms_outlook_master_id,
+                                      ms_outlook_unmatched,
+                                      g_calendar_unmatched)
+        for ms_outlook_instance, g_calendar_instance in matched:
+            ms_outlook_instance_string = create_date_id(ms_outlook_instance['EntryID'],
+                                                        ms_outlook_instance['StartUTC'])
+            print_display(f'{line_number()} [Microsoft Outlook] COPY TO [Google Calendar] RECURRENT [{trim_id(ms_outlook_master_id)}] => [{trim_id(g_calendar_id)}] / [{trim_id(ms_outlook_instance_string)}] <=> [{trim_id(g_calendar_instance["id"])}]')
+            self.snapshot.add_g_calendar_event(g_calendar_instance)
+            self.snapshot.insert_occurrence(ms_outlook_master_id,
+                                            ms_outlook_instance_string,
+                                            g_calendar_instance['id'])
+
+    def _execute_insert_recurrent_ms_outlook(self,
+                                             operation: SyncOperation):
+        ms_outlook_inserted_appointment = self.ms_outlook_connection.insert_instance_ms_outlook(operation.payload['body'])
+        if not ms_outlook_inserted_appointment:
+            return None
+        ms_outlook_inserted_event = self.ms_outlook_connection.read_instance_ms_outlook(ms_outlook_inserted_appointment)
+        ms_outlook_entry_id = ms_outlook_inserted_event['EntryID']
+        self.ms_outlook_connection.set_recurrence_id(ms_outlook_entry_id,
+                                                     operation.g_calendar_id)
+        if _master_mode():
+            return ms_outlook_inserted_event, [], []
+        g_calendar_instances = self.g_calendar_connection.get_all_single_instances_inside_recurrence_g_calendar(operation.g_calendar_id).get('items',
+                                                                                                                                             [])
+        ms_outlook_instances = self.ms_outlook_connection.get_recurrence_instances(ms_outlook_entry_id)
+        return ms_outlook_inserted_event, ms_outlook_instances, g_calendar_instances
+
+    def _complete_insert_recurrent_ms_outlook(self,
+                                              operation: SyncOperation):
+        if not operation.result:
+            raise ValueError('NO APPOINTMENT CREATED')
+        ms_outlook_inserted_event, ms_outlook_instances, g_calendar_instances = operation.result
+        ms_outlook_entry_id = ms_outlook_inserted_event['EntryID']
+        operation.ms_outlook_id = ms_outlook_entry_id
+        self.snapshot.add_ms_outlook_event(ms_outlook_inserted_event)
+        self.snapshot.insert_recurrence(ms_outlook_entry_id,
+                                        operation.g_calendar_id,
+                                        operation.payload['body'].get('Subject'))
+        matched, ms_outlook_unmatched, g_calendar_unmatched = _join_occurrences(ms_outlook_instances,
+                                                                                g_calendar_instances)
+        _report_unmatched_occurrences(ms_outlook_entry_id,
+                                      ms_outlook_unmatched,
+                                      g_calendar_unmatched)
+        for ms_outlook_instance, g_calendar_instance in matched:
+            print_display(f'{line_number()} [Google Calendar] COPY TO [Microsoft Outlook] RECURRENT [{trim_id(ms_outlook_entry_id)}] [{trim_id(g_calendar_instance["id"])}] <=> [{trim_id(ms_outlook_instance["EntryID"])}]')
+            ms_outlook_start = strip_symbols(ms_outlook_instance['StartUTC'])
+            ms_outlook_end = strip_symbols(ms_outlook_instance['EndUTC'])
+            self.snapshot.insert_occurrence(ms_outlook_entry_id,
+                                            f'{ms_outlook_instance["EntryID"]}{ms_outlook_start}{ms_outlook_end}',
+                                            g_calendar_instance['id'])
@@ -0,0 +1,221 @@
+import json
+import os
+import uuid
+from pathlib import Path
+from threading import Lock
+
+import system.constants as constants
+
+from connector.event_mapping import EventMapping
+from connector.event_mapping import EventSide
+from system.sync_plan import SyncAction
+from system.sync_plan import SyncKind
+from system.sync_plan import SyncOperation
+from system.sync_plan import SyncPlan
+from system.tools import get_master_id
+from system.tools import line_number
+from system.tools import print_box
+from system.tools import print_display
+from system.tools import utc_now
+
+# journal steps, in the order an operation goes through them
+STEP_PLANNED = 'planned'
+STEP_STARTED = 'started'
+STEP_EXECUTED = 'executed'
+STEP_FAILED = 'failed'
+STEP_COMPLETED = 'completed'
+STEP_CLOSED = 'closed'
+
+
+class SyncJournal:
+    """Append-only intent journal of the sync cycle in progress.
+
+    Every planned operation is written before the plan runs, then marked
+    started, executed (with the IDs it created) and completed.  A cycle that
+    finished is closed and the file emptied; one that did not (crash, Outlook
+    gone) is replayed by reconcile() on the next start, so remote writes that
+    never reached the saved EventMapping are mapped instead of repeated.
+    """
+
+    def __init__(self,
+                 journal_file: str = None):
+        base_dir = Path(__file__).resolve().parent.parent
+        database_dir = (base_dir / 'resources' / 'database').resolve()
+        self.journal_file = journal_file or str(database_dir / 'sync_journal.jsonl')
+        self._lock = Lock()
+        self.cycle_id: str | None = None
+        # id(operation) => index in the plan of the open cycle
+        self._operation_index: dict[int, int] = dict()
+
+    def _append(self,
+                entries: list[dict]):
+        with self._lock:
+            with open(self.journal_file,
+                      'a',
+                      encoding='utf-8') as journal_writer:
+                for entry in entries:
+                    journal_writer.write(json.dumps(entry,
+                                                    ensure_ascii=False,
+                                                    default=str) + '\n')
+                journal_writer.flush()
+
+    def _read(self) -> list[dict]:
+        if not os.path.exists(self.journal_file):
+            return []
+        entries = list()
+        with open(self.journal_file,
+                  'r',
+                  encoding='utf-8') as journal_reader:
+            for journal_line in journal_reader:
+                try:
+                    entries.append(json.loads(journal_line))
+                except json.JSONDecodeError:
+                    # a crash can cut the last line short; everything before it is intact
+                    continue
+        return entries
+
+    def _truncate(self):
+        with self._lock:
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+
+    # ---- writing ----------------------------------------------------------
+
+    def open_cycle(self,
+                   plan: SyncPlan) -> str:
+        self.cycle_id = uuid.uuid4().hex[:12]
+        self._operation_index = dict()
+        entries = list()
+        for index, operation in enumerate(plan):
+            self._operation_index[id(operation)] = index
+            entries.append({
+                    'cycle'        : self.cycle_id,
+                    'step'         : STEP_PLANNED,
+                    'index'        : index,
+                    'time'         : utc_now(),
+                    'action'       : operation.action.value,
+                    'kind'         : operation.kind.value,
+                    'target'       : operation.target.value if operation.target else None,
+                    'ms_outlook_id': operation.ms_outlook_id,
+                    'g_calendar_id': operation.g_calendar_id,
+                    'description'  : operation.description})
+        self._append(entries)
+        return self.cycle_id
+
+    def record(self,
+               operation: SyncOperation,
+               step: str,
+               outcome: dict = None):
+        if self.cycle_id is None or id(operation) not in self._operation_index:
+            return
+        entry = {
+                'cycle': self.cycle_id,
+                'step' : step,
+                'index': self._operation_index[id(operation)]}
+        if outcome:
+            entry['outcome'] = outcome
+        self._append([entry])
+
+    def close_cycle(self):
+        # the EventMapping was saved when the plan's batch ended: nothing left to replay
+        if self.cycle_id is None:
+            return
+        self._append([{
+                'cycle': self.cycle_id,
+                'step' : STEP_CLOSED,
+                'time' : utc_now()}])
+        self.cycle_id = None
+        self._operation_index = dict()
+        self._truncate()
+
+    # ---- recovery ---------------------------------------------------------
+
+    def reconcile(self,
+                  event_mapping: EventMapping) -> dict:
+        """Replay the mapping effect of every executed operation of an unclosed cycle.
+
+        Operations that were only planned are left to the next plan; ones that
+        started without a recorded result are reported, their outcome is unknown.
+        """
+        reconcile_report = {
+                'replayed' : 0,
+                'pending'  : 0,
+                'uncertain': 0}
+        entries = self._read()
+        if not entries:
+            return reconcile_report
+        cycles = dict()
+        for entry in entries:
+            cycles.setdefault(entry.get('cycle'),
+                              list()).append(entry)
+        with event_mapping.batch():
+            for cycle_id, cycle_entries in cycles.items():
+                if any(entry['step'] == STEP_CLOSED for entry in cycle_entries):
+                    continue
+                operations = dict()
+                for entry in cycle_entries:
+                    operation_state = operations.setdefault(entry['index'],
+                                                            dict())
+                    if entry['step'] == STEP_PLANNED:
+                        operation_state['planned'] = entry
+                    else:
+                        operation_state['step'] = entry['step']
+                    if 'outcome' in entry:
+                        operation_state['outcome'] = entry['outcome']
+                for index, operation_state in sorted(operations.items()):
+                    planned = operation_state.get('planned')
+                    if not planned:
+                        continue
+                    if 'outcome' in operation_state and operation_state.get('step') != STEP_FAILED:
+                        self._replay(event_mapping,
+                                     planned,
+                                     operation_state['outcome'])
+                        reconcile_report['replayed'] += 1
+                    elif operation_state.get('step') == STEP_STARTED:
+                        print_display(f'{line_number()} [SYNC JOURNAL] UNCERTAIN [{cycle_id}] #{index}: {planned["action"]} {planned["kind"]} => [{planned["target"]}] [{planned["ms_outlook_id"]}] <=> [{planned["g_calendar_id"]}]')
+                        reconcile_report['uncertain'] += 1
+                    else:
+                        reconcile_report['pending'] += 1
+        self._truncate()
+        print_box(f'{line_number()} [SYNC JOURNAL] reconciled unfinished cycle: replayed [{reconcile_report["replayed"]}] pending [{reconcile_report["pending"]}] uncertain [{reconcile_report["uncertain"]}]')
+        return reconcile_report
+
+    @staticmethod
+    def _replay(event_mapping: EventMapping,
+                planned: dict,
+                outcome: dict):
+        # idempotent: every EventMapping call below is a no-op when the map already has it
+        if not outcome.get('applied',
+                           True):
+            return
+        action = SyncAction(planned['action'])
+        kind = SyncKind(planned['kind'])
+        target = EventSide(planned['target']) if planned['target'] else None
+        ms_outlook_id = outcome.get('ms_outlook_id') or planned['ms_outlook_id']
+        g_calendar_id = outcome.get('g_calendar_id') or planned['g_calendar_id']
+        if action == SyncAction.INSERT and not (ms_outlook_id and g_calendar_id):
+            # the insert returned nothing: there is nothing to map
+            return
+        if action == SyncAction.INSERT and kind == SyncKind.SINGLE:
+            event_mapping.insert_instance(ms_outlook_id,
+                                          g_calendar_id,
+                                          outcome.get('instance_name'),
+                                          outcome.get('instance_end'))
+        elif action == SyncAction.INSERT and kind == SyncKind.RECURRENT:
+            event_mapping.insert_recurrence(ms_outlook_id,
+                                            g_calendar_id,
+                                            outcome.get('instance_name'))
+        elif action == SyncAction.DELETE and kind == SyncKind.SINGLE:
+            event_mapping.remove_instance(ms_outlook_id if target == EventSide.G_CALENDAR else g_calendar_id)
+        elif action == SyncAction.DELETE and kind == SyncKind.RECURRENT:
+            if target == EventSide.G_CALENDAR:
+                event_mapping.remove_g_calendar_recurrence(get_master_id(g_calendar_id))
+            else:
+                event_mapping.remove_ms_outlook_recurrence(ms_outlook_id)
+        elif action == SyncAction.DELETE_OCCURRENCE:
+            event_mapping.remove_generic_occurrence(g_calendar_id,
+                                                    keep_master=constants.RECURRENCE_SYNC_MODE == constants.RECURRENCE_MODE_MASTER)
+        elif action == SyncAction.UPDATE and kind == SyncKind.OCCURRENCE and outcome.get('ms_outlook_instance_id'):
+            event_mapping.insert_occurrence(ms_outlook_id,
+                                            outcome['ms_outlook_instance_id'],
+                                            g_calendar_id)
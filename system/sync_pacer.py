@@ -0,0 +1,143 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from threading import Lock
+
+import system.constants as constants
+
+from system.sync_window import SyncWindow
+from system.sync_window import covered_tiers
+from system.sync_window import sync_window_schedule
+from system.tools import line_number
+from system.tools import print_box
+from system.tools import print_display
+
+
+class SyncPacer:
+    """How long the sync job waits between cycles, from what the last cycles found.
+
+    A cycle that planned anything brings the wait down to SYNC_INTERVAL_MIN;
+    every quiet one multiplies it by SYNC_INTERVAL_BACKOFF, up to
+    SYNC_INTERVAL_MAX.  probe() asks both calendars whether anything changed
+    since the last cycle over the same tier, so a narrow tier can be skipped
+    when nothing did.  What a probe read only becomes the tier's marker once
+    record_cycle() reports the cycle finished; a cycle that raised, was
+    cancelled or was a dry run leaves the previous marker in place.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # seconds until the next cycle; None until the first cycle ran
+        self._interval: float | None = None
+        # tier name => ((item count, latest LastModificationTime) of the Outlook calendar, UTC time)
+        # when the last cycle covering that tier started; each tier compares against its own
+        self._markers: dict[str, tuple[tuple[int, str] | None, datetime]] = dict()
+        # (tiers, marker, UTC time) read by the probe of the running cycle, saved when it finishes
+        self._pending: tuple[list[str], tuple[int, str] | None, datetime] | None = None
+        # the last cycle was stopped or ran out of time: its tier still has work
+        self._unfinished = False
+        # a Google push channel reports changes, so quiet periods may be polled less
+        self._push_live = False
+        # narrow tier cycles probed, and those the probe found nothing for
+        self.probes = 0
+        self.probe_skips = 0
+
+    def interval(self) -> int:
+        if not constants.SYNC_ADAPTIVE_ENABLED:
+            return sync_window_schedule.interval()
+        with self._lock:
+            if self._interval is None:
+                return sync_window_schedule.interval()
+            return int(self._interval)
+
+    def record_cycle(self,
+                     changes: int,
+                     finished: bool = True):
+        with self._lock:
+            self._unfinished = not finished
+            pending, self._pending = self._pending, None
+            if finished and pending is not None:
+                tier_names, ms_outlook_marker, checked_at = pending
+                for name in tier_names:
+                    self._markers[name] = (ms_outlook_marker,
+                                           checked_at)
+            if changes or not finished:
+                self._interval = constants.SYNC_INTERVAL_MIN
+            else:
+                self._interval = (self._interval or sync_window_schedule.interval()) * constants.SYNC_INTERVAL_BACKOFF
+            self._interval = max(constants.SYNC_INTERVAL_MIN,
+                                 min(self._interval,
+                                     self._interval_max()))
+            interval = int(self._interval)
+        if constants.SYNC_ADAPTIVE_ENABLED:
+            print_display(f'{line_number()} [SYNC PACER] cycle planned [{changes}] operations, next one in [{interval}]s')
+
+    def _interval_max(self) -> int:
+        # only with both sides reporting their own changes: Google by push, Outlook by its events
+        if self._push_live and constants.SYNC_EVENTS_ENABLED:
+            return constants.SYNC_INTERVAL_MAX_PUSH
+        return constants.SYNC_INTERVAL_MAX
+
+    def begin_cycle(self):
+        """Forget what the probe of a cycle that never reported back read."""
+        with self._lock:
+            self._pending = None
+
+    def set_push_live(self,
+                      push_live: bool):
+        """Without a live push channel the wait goes back under SYNC_INTERVAL_MAX at once."""
+        with self._lock:
+            if push_live == self._push_live:
+                return
+            self._push_live = push_live
+            if self._interval is not None:
+                self._interval = min(self._interval,
+                                     self._interval_max())
+        print_display(f'{line_number()} [SYNC PACER] Google push channel [{"live, polling less" if push_live else "down, polling"}]')
+
+    def probe(self,
+              sync_window: SyncWindow,
+              ms_outlook_connection,
+              g_calendar_connection,
+              retry_queue=None) -> bool:
+        """True when a cycle over sync_window has something to look at: either calendar
+        changed since the last cycle covering its tier, a failed operation is due again,
+        the last cycle did not finish or there is nothing to compare with yet.
+        Any error counts as a change."""
+        checked_at = datetime.now(timezone.utc)
+        self.probes += 1
+        try:
+            ms_outlook_marker = ms_outlook_connection.get_change_marker_ms_outlook()
+        except Exception as exception:
+            print_display(f'{line_number()} [SYNC PACER] [Microsoft Outlook] probe failed: [{exception}]')
+            ms_outlook_marker = None
+        with self._lock:
+            previous_marker, previous_checked_at = self._markers.get(sync_window.name,
+                                                                     (None, None))
+            unfinished = self._unfinished
+            self._pending = (covered_tiers(sync_window.name),
+                             ms_outlook_marker,
+                             checked_at)
+        if previous_checked_at is None or unfinished:
+            return True
+        if ms_outlook_marker is None or ms_outlook_marker != previous_marker:
+            return True
+        if retry_queue is not None and any(not retry_queue.is_held(key) for key in retry_queue.items):
+            return True
+        # a few minutes of overlap, in case this clock runs ahead of Google's
+        updated_min = (previous_checked_at - timedelta(minutes=5)).isoformat().replace('+00:00',
+                                                                                      'Z')
+        try:
+            return g_calendar_connection.has_changes_g_calendar(updated_min)
+        except Exception as exception:
+            print_display(f'{line_number()} [SYNC PACER] [Google Calendar] probe failed: [{exception}]')
+            return True
+
+    def report_skipped(self,
+                       sync_window):
+        self.probe_skips += 1
+        print_box(f'{line_number()} [SYNC PACER] nothing changed since the last cycle: [{sync_window}] skipped, next one in [{self.interval()}]s')
+
+
+# one pacer per process, like the sync window schedule
+sync_pacer = SyncPacer()
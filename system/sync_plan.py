@@ -0,0 +1,162 @@
+from enum import Enum
+
+from connector.event_mapping import EventSide
+from system.tools import trim_id
+
+
+class SyncAction(Enum):
+    INSERT = 'insert'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    DELETE_OCCURRENCE = 'delete_occurrence'
+    # mapping-only change: stale entry, fingerprint baseline
+    REPAIR_MAPPING = 'repair_mapping'
+
+
+class SyncKind(Enum):
+    SINGLE = 'single'
+    RECURRENT = 'recurrent'
+    OCCURRENCE = 'occurrence'
+
+
+# (action, kind) => remote calls on the target side; a verified operation
+# adds one read of the other side, see SyncOperation.api_calls
+_API_CALLS = {
+        (SyncAction.INSERT, SyncKind.SINGLE)                : 1,
+        (SyncAction.INSERT, SyncKind.RECURRENT)             : 3,
+        (SyncAction.UPDATE, SyncKind.SINGLE)                : 1,
+        (SyncAction.UPDATE, SyncKind.RECURRENT)             : 1,
+        (SyncAction.UPDATE, SyncKind.OCCURRENCE)            : 1,
+        (SyncAction.DELETE, SyncKind.SINGLE)                : 1,
+        (SyncAction.DELETE, SyncKind.RECURRENT)             : 1,
+        (SyncAction.DELETE_OCCURRENCE, SyncKind.OCCURRENCE) : 1,
+        (SyncAction.REPAIR_MAPPING, SyncKind.SINGLE)        : 0,
+        (SyncAction.REPAIR_MAPPING, SyncKind.RECURRENT)     : 0,
+        (SyncAction.REPAIR_MAPPING, SyncKind.OCCURRENCE)    : 0}
+
+def operation_key(action: SyncAction,
+                  kind: SyncKind,
+                  target: EventSide | None,
+                  ms_outlook_id: str = None,
+                  g_calendar_id: str = None) -> str:
+    """Stable identity of an operation across cycles, as the planner first builds it."""
+    return f'{action.value}/{kind.value}/{target.value if target else "mapping"}/{ms_outlook_id or ""}/{g_calendar_id or ""}'
+
+
+_SIDE_LABEL = {
+        EventSide.MS_OUTLOOK: 'Microsoft Outlook',
+        EventSide.G_CALENDAR: 'Google Calendar'}
+
+
+class SyncOperation:
+    """One change computed by SyncPlanner; `target` is the side that gets written."""
+    __slots__ = ('action',
+                 'kind',
+                 'target',
+                 'ms_outlook_id',
+                 'g_calendar_id',
+                 'payload',
+                 'verify',
+                 'description',
+                 'key',
+                 'start',
+                 'result',
+                 'error')
+
+    def __init__(self,
+                 action: SyncAction,
+                 kind: SyncKind,
+                 target: EventSide | None,
+                 ms_outlook_id: str = None,
+                 g_calendar_id: str = None,
+                 payload: dict = None,
+                 verify: bool = False,
+                 description: str = ''):
+        self.action = action
+        self.kind = kind
+        self.target = target
+        self.ms_outlook_id = ms_outlook_id
+        self.g_calendar_id = g_calendar_id
+        self.payload = payload or dict()
+        # the other side was not in the snapshot, so the executor reads it before acting
+        self.verify = verify
+        self.description = description
+        # fixed here: the complete step fills in the ID an insert created
+        self.key = operation_key(action,
+                                 kind,
+                                 target,
+                                 ms_outlook_id,
+                                 g_calendar_id)
+        # UTC start of the event written, set by the planner to order the plan nearest first
+        self.start = None
+        self.result = None
+        self.error = None
+
+    @property
+    def api_calls(self) -> int:
+        return _API_CALLS.get((self.action, self.kind), 1) + (1 if self.verify else 0)
+
+    def __repr__(self) -> str:
+        target = _SIDE_LABEL.get(self.target, 'EVENT MAPPING')
+        verify = ' (verify)' if self.verify else ''
+        return f'{self.action.value.upper()} {self.kind.value.upper()} => [{target}] [{trim_id(self.ms_outlook_id)}] <=> [{trim_id(self.g_calendar_id)}]{verify} {self.description}'.rstrip()
+
+
+class SyncPlan:
+    """Ordered list of SyncOperation; built deletes first, then inserts, then
+    updates, and finally ordered by SyncPlanner.prioritize() (nearest event first)."""
+
+    def __init__(self):
+        self.operations: list[SyncOperation] = list()
+
+    def add(self,
+            operation: SyncOperation) -> SyncOperation:
+        self.operations.append(operation)
+        return operation
+
+    def __iter__(self):
+        return iter(self.operations)
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+    def __bool__(self) -> bool:
+        return bool(self.operations)
+
+    def select(self,
+               action: SyncAction = None,
+               kind: SyncKind = None,
+               target: EventSide = None) -> list[SyncOperation]:
+        return [operation for operation in self.operations if (action is None or operation.action == action) and (kind is None or operation.kind == kind) and (target is None or operation.target == target)]
+
+    def estimate_api_calls(self) -> dict:
+        estimate = {
+                EventSide.MS_OUTLOOK.value: 0,
+                EventSide.G_CALENDAR.value: 0}
+        for operation in self.operations:
+            if operation.target is None:
+                continue
+            estimate[operation.target.value] += operation.api_calls
+        estimate['total'] = sum(estimate.values())
+        return estimate
+
+    def summary(self) -> dict:
+        counts = dict()
+        for operation in self.operations:
+            target = operation.target.value if operation.target else 'mapping'
+            key = f'{operation.action.value}/{operation.kind.value}/{target}'
+            counts[key] = counts.get(key, 0) + 1
+        return dict(sorted(counts.items()))
+
+    def report(self,
+               detailed: bool = False) -> str:
+        estimate = self.estimate_api_calls()
+        lines = [f'SYNC PLAN: [{len(self.operations)}] operations, estimated API calls: '
+                 f'[Google Calendar] [{estimate[EventSide.G_CALENDAR.value]}] '
+                 f'[Microsoft Outlook] [{estimate[EventSide.MS_OUTLOOK.value]}]']
+        for key, count in self.summary().items():
+            lines.append(f'    {key}: [{count}]')
+        if detailed:
+            for operation in self.operations:
+                lines.append(f'    - {operation}')
+        return '\n'.join(lines)
@@ -0,0 +1,589 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import system.constants as constants
+
+from connector.calendar_instance import CalendarInstance
+from connector.event_mapping import EventSide
+from system.recurrence_rule import RecurrenceRule
+from system.retry_queue import RetryQueue
+from system.sync_plan import SyncAction
+from system.sync_plan import SyncKind
+from system.sync_plan import SyncOperation
+from system.sync_plan import SyncPlan
+from system.sync_plan import operation_key
+from system.sync_snapshot import SyncSnapshot
+from system.tools import create_date_id
+from system.tools import format_exdate
+from system.tools import get_master_id
+from system.tools import recover_date_id
+from system.tools import to_utc_datetime
+from system.tools import utc_key
+from system.tools import utc_key_from_id
+
+
+def _exception_start_key(ms_outlook_exception: dict,
+                         all_day: bool) -> str:
+    if all_day:
+        return ms_outlook_exception['original_date']
+    return utc_key(ms_outlook_exception['original_start_utc'])
+
+
+def _start_from_key(start_key: str) -> datetime:
+    if len(start_key) == 8:
+        return datetime.strptime(start_key,
+                                 '%Y%m%d').replace(tzinfo=timezone.utc)
+    return datetime.strptime(start_key,
+                             '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+
+
+class SyncPlanner:
+    """Computes a SyncPlan from a SyncSnapshot with set operations only.
+
+    No remote calls are made here; anything the snapshot cannot settle is
+    planned as a verified operation and checked by the executor.
+    """
+
+    def __init__(self,
+                 snapshot: SyncSnapshot,
+                 retry_queue: RetryQueue = None):
+        self.snapshot = snapshot
+        # failed operations still backing off or quarantined are left out of the plan
+        self.retry_queue = retry_queue
+        self.plan = SyncPlan()
+        # pairs already claimed by an operation, so both directions never act on the same pair
+        self._claimed: set[str] = set()
+
+    def _claim(self,
+               *event_ids) -> bool:
+        if any(event_id in self._claimed for event_id in event_ids if event_id):
+            return False
+        self._claimed.update(event_id for event_id in event_ids if event_id)
+        return True
+
+    def _held(self,
+              action: SyncAction,
+              kind: SyncKind,
+              target: EventSide,
+              ms_outlook_id: str = None,
+              g_calendar_id: str = None) -> bool:
+        # checked before converting an event, so a failing insert costs nothing while it waits
+        return self.retry_queue is not None and self.retry_queue.is_held(operation_key(action,
+                                                                                       kind,
+                                                                                       target,
+                                                                                       ms_outlook_id,
+                                                                                       g_calendar_id))
+
+    def build(self,
+              ms_outlook_to_g_calendar: bool,
+              g_calendar_to_ms_outlook: bool) -> SyncPlan:
+        master_mode = constants.RECURRENCE_SYNC_MODE == constants.RECURRENCE_MODE_MASTER
+        # a narrow tier does not list every occurrence of a series: only the full window can tell a series is gone
+        full_window = self.snapshot.window.full
+        if ms_outlook_to_g_calendar:
+            self.plan_deletion_from_ms_outlook_to_g_calendar_single_event()
+            if not master_mode:
+                self.plan_deletion_of_single_event_from_ms_outlook_to_g_calendar_recurrent_event()
+            if full_window:
+                self.plan_deletion_from_ms_outlook_to_g_calendar_recurrent_event()
+        if g_calendar_to_ms_outlook:
+            self.plan_deletion_from_g_calendar_to_ms_outlook_single_event()
+            if not master_mode:
+                self.plan_deletion_of_single_event_from_g_calendar_to_ms_outlook_recurrent_event()
+            if full_window:
+                self.plan_deletion_from_g_calendar_to_ms_outlook_recurrent_event()
+        if master_mode:
+            self.plan_recurrence_exceptions(ms_outlook_to_g_calendar,
+                                            g_calendar_to_ms_outlook)
+        if ms_outlook_to_g_calendar:
+            self.plan_copy_ms_outlook_single_event_to_g_calendar()
+            self.plan_copy_ms_outlook_recurrent_event_to_g_calendar()
+        if g_calendar_to_ms_outlook:
+            self.plan_copy_g_calendar_single_event_to_ms_outlook()
+            self.plan_copy_g_calendar_recurrent_event_to_ms_outlook()
+        self.plan_changes_single_event(ms_outlook_to_g_calendar,
+                                       g_calendar_to_ms_outlook)
+        if self.retry_queue is not None:
+            self.retry_queue.hold_back(self.plan,
+                                       forget_unplanned=self.snapshot.window.full)
+        self.prioritize()
+        return self.plan
+
+    def prioritize(self):
+        """Upcoming events first, nearest first, then past ones, then those without a start.
+
+        The sort is stable, so the build order holds among equals; a cycle that
+        runs out of time (SYNC_CYCLE_BUDGET) leaves the farthest events for later.
+        """
+        now = datetime.now(timezone.utc)
+        for operation in self.plan:
+            operation.start = self._operation_start(operation,
+                                                    now)
+
+        def priority(operation: SyncOperation) -> tuple:
+            if operation.start is None:
+                return 2, 0.0
+            return (0 if operation.start >= now else 1), abs((operation.start - now).total_seconds())
+
+        self.plan.operations.sort(key=priority)
+
+    def _operation_start(self,
+                         operation: SyncOperation,
+                         now: datetime) -> datetime | None:
+        if operation.payload.get('start_utc'):
+            return to_utc_datetime(operation.payload['start_utc'])
+        if operation.kind == SyncKind.OCCURRENCE:
+            start_key = utc_key_from_id(operation.g_calendar_id)
+            return _start_from_key(start_key) if start_key else None
+        ms_outlook_id = recover_date_id(operation.ms_outlook_id) if operation.ms_outlook_id else None
+        if operation.kind == SyncKind.RECURRENT and ms_outlook_id:
+            # a series is as urgent as its next occurrence, not its first one
+            now_key = utc_key(now)
+            upcoming = [start_key for start_key in self.snapshot.ms_outlook_occurrence_starts.get(ms_outlook_id,
+                                                                                                  ()) if len(start_key) == len(now_key) and start_key >= now_key]
+            if upcoming:
+                return _start_from_key(min(upcoming))
+        ms_outlook_event = self.snapshot.ms_outlook_single_events.get(ms_outlook_id) if ms_outlook_id else None
+        if ms_outlook_event:
+            return to_utc_datetime(ms_outlook_event.get('StartUTC'))
+        g_calendar_event = self.snapshot.g_calendar_event(operation.g_calendar_id) if operation.g_calendar_id else None
+        body = operation.payload.get('body',
+                                     dict())
+        g_calendar_start = (g_calendar_event or body).get('start')
+        if isinstance(g_calendar_start,
+                      dict):
+            return to_utc_datetime(g_calendar_start.get('dateTime') or g_calendar_start.get('date'))
+        return to_utc_datetime(body.get('StartUTC'))
+
+    def plan_deletion_from_ms_outlook_to_g_calendar_single_event(self):
+        for ms_outlook_id in set(self.snapshot.mapping['single_events']) - self.snapshot.ms_outlook_entry_ids:
+            g_calendar_id = self.snapshot.mapping['single_events'][ms_outlook_id]
+            if not g_calendar_id or not self.snapshot.single_in_window(ms_outlook_id):
+                continue
+            g_calendar_event = self.snapshot.g_calendar_event(g_calendar_id)
+            if g_calendar_event and ('recurrence' in g_calendar_event or 'recurringEventId' in g_calendar_event):
+                continue
+            if not self._claim(ms_outlook_id,
+                               g_calendar_id):
+                continue
+            self.plan.add(SyncOperation(SyncAction.DELETE,
+                                        SyncKind.SINGLE,
+                                        EventSide.G_CALENDAR,
+                                        ms_outlook_id,
+                                        g_calendar_id,
+                                        verify=g_calendar_event is None,
+                                        description='deleted in [Microsoft Outlook]'))
+
+    def plan_deletion_from_g_calendar_to_ms_outlook_single_event(self):
+        for g_calendar_id, ms_outlook_id in self.snapshot.single_by_g_calendar.items():
+            if g_calendar_id in self.snapshot.g_calendar_events or g_calendar_id in self.snapshot.g_calendar_confirmed:
+                continue
+            if not self.snapshot.single_in_window(ms_outlook_id):
+                continue
+            ms_outlook_event = self.snapshot.ms_outlook_single_events.get(ms_outlook_id)
+            if not ms_outlook_event and self.snapshot.ms_outlook_exists(ms_outlook_id):
+                # listed, but as a recurring item: not a single event any more
+                continue
+            if not self._claim(ms_outlook_id,
+                               g_calendar_id):
+                continue
+            self.plan.add(SyncOperation(SyncAction.DELETE,
+                                        SyncKind.SINGLE,
+                                        EventSide.MS_OUTLOOK,
+                                        ms_outlook_id,
+                                        g_calendar_id,
+                                        verify=ms_outlook_event is None,
+                                        description='deleted in [Google Calendar]'))
+
+    def _occurrence_ends_in_window(self,
+                                   ms_outlook_master_id: str,
+                                   start_key: str) -> bool:
+        ms_outlook_master = self.snapshot.ms_outlook_recurrence(ms_outlook_master_id) or dict()
+        try:
+            duration = timedelta(minutes=int(ms_outlook_master['Duration']))
+        except (KeyError, TypeError, ValueError):
+            # unknown length: only the edge of the full window is far enough to risk it
+            return self.snapshot.window.full
+        return _start_from_key(start_key) + duration <= self.snapshot.window.end
+
+    def plan_deletion_of_single_event_from_ms_outlook_to_g_calendar_recurrent_event(self):
+        # checked against the occurrences expanded in the snapshot, keyed by UTC start
+        window_start = utc_key(self.snapshot.window.begin)
+        window_end = utc_key(self.snapshot.window.end)
+        for ms_outlook_master_id, master_data in self.snapshot.mapping['recurrent_events'].items():
+            for ms_outlook_instance_id, g_calendar_instance_id in master_data['instances'].items():
+                start_key = utc_key_from_id(g_calendar_instance_id)
+                if not start_key:
+                    continue
+                # outside the window Outlook did not expand the occurrence, so absence means nothing
+                if not window_start[:len(start_key)] <= start_key <= window_end[:len(start_key)]:
+                    continue
+                # the Outlook restriction also drops occurrences that end after the window
+                if not self._occurrence_ends_in_window(ms_outlook_master_id,
+                                                       start_key):
+                    continue
+                if self.snapshot.ms_outlook_occurrence_exists(ms_outlook_master_id,
+                                                              start_key) is not False:
+                    continue
+                self.plan.add(SyncOperation(SyncAction.DELETE_OCCURRENCE,
+                                            SyncKind.OCCURRENCE,
+                                            EventSide.G_CALENDAR,
+                                            ms_outlook_master_id,
+                                            g_calendar_instance_id,
+                                            payload={
+                                                    'ms_outlook_instance_id': ms_outlook_instance_id,
+                                                    # decided here: the execute step runs on a worker and must not read the snapshot
+                                                    'g_calendar_listed'     : g_calendar_instance_id in self.snapshot.g_calendar_events},
+                                            description='deleted in [Microsoft Outlook]'))
+
+    def plan_deletion_of_single_event_from_g_calendar_to_ms_outlook_recurrent_event(self):
+        # joined against the cancelled occurrences of the snapshot listing: no per-occurrence GET
+        for ms_outlook_master_id, master_data in self.snapshot.mapping['recurrent_events'].items():
+            for ms_outlook_instance_id, g_calendar_instance_id in master_data['instances'].items():
+                g_calendar_cancelled = self.snapshot.g_calendar_cancelled.get(g_calendar_instance_id)
+                if not g_calendar_cancelled:
+                    continue
+                original_start = g_calendar_cancelled.get('originalStartTime', dict())
+                self.plan.add(SyncOperation(SyncAction.DELETE_OCCURRENCE,
+                                            SyncKind.OCCURRENCE,
+                                            EventSide.MS_OUTLOOK,
+                                            ms_outlook_master_id,
+                                            g_calendar_instance_id,
+                                            payload={
+                                                    'ms_outlook_instance_id': ms_outlook_instance_id,
+                                                    'start_utc'             : to_utc_datetime(original_start.get('dateTime') or original_start.get('date')),
+                                                    'all_day'               : 'date' in original_start},
+                                            description='cancelled in [Google Calendar]'))
+
+    def plan_deletion_from_ms_outlook_to_g_calendar_recurrent_event(self):
+        for ms_outlook_master_id, master_data in self.snapshot.mapping['recurrent_events'].items():
+            # the master's EntryID is shared by its occurrences, so any of them in the window keeps it alive
+            if self.snapshot.ms_outlook_exists(ms_outlook_master_id):
+                continue
+            g_calendar_id = master_data['g_calendar_master_id']
+            g_calendar_event = self.snapshot.g_calendar_event(g_calendar_id)
+            if g_calendar_event and g_calendar_event.get('status') == 'cancelled':
+                continue
+            if not self._claim(ms_outlook_master_id,
+                               g_calendar_id):
+                continue
+            self.plan.add(SyncOperation(SyncAction.DELETE,
+                                        SyncKind.RECURRENT,
+                                        EventSide.G_CALENDAR,
+                                        ms_outlook_master_id,
+                                        g_calendar_id,
+                                        verify=g_calendar_event is None,
+                                        description='series deleted in [Microsoft Outlook]'))
+
+    def plan_deletion_from_g_calendar_to_ms_outlook_recurrent_event(self):
+        for ms_outlook_master_id, master_data in self.snapshot.mapping['recurrent_events'].items():
+            g_calendar_id = master_data['g_calendar_master_id']
+            # a listed series is alive; an unlisted one is cancelled or outside the window
+            if self.snapshot.g_calendar_event(g_calendar_id):
+                continue
+            if not self.snapshot.ms_outlook_exists(ms_outlook_master_id):
+                continue
+            if not self._claim(ms_outlook_master_id,
+                               g_calendar_id):
+                continue
+            self.plan.add(SyncOperation(SyncAction.DELETE,
+                                        SyncKind.RECURRENT,
+                                        EventSide.MS_OUTLOOK,
+                                        ms_outlook_master_id,
+                                        g_calendar_id,
+                                        verify=True,
+                                        description='series deleted in [Google Calendar]'))
+
+    def plan_recurrence_exceptions(self,
+                                   ms_outlook_to_g_calendar: bool,
+                                   g_calendar_to_ms_outlook: bool):
+        """Master-level recurrence mode: the RRULE and the deleted occurrences travel on the
+        series, and only modified occurrences are written (and mapped) one by one."""
+        for ms_outlook_master_id, master_data in self.snapshot.mapping['recurrent_events'].items():
+            g_calendar_master_id = master_data['g_calendar_master_id']
+            g_calendar_master = self.snapshot.g_calendar_masters.get(g_calendar_master_id)
+            ms_outlook_master = self.snapshot.ms_outlook_recurrence(ms_outlook_master_id)
+            ms_outlook_exceptions = self.snapshot.ms_outlook_exceptions.get(ms_outlook_master_id)
+            if not g_calendar_master or not ms_outlook_master or ms_outlook_exceptions is None:
+                continue
+            if ms_outlook_master_id in self._claimed or g_calendar_master_id in self._claimed:
+                continue
+            all_day = 'date' in g_calendar_master.get('start',
+                                                      dict())
+            ms_outlook_deleted = {_exception_start_key(ms_outlook_exception,
+                                                       all_day) for ms_outlook_exception in ms_outlook_exceptions if ms_outlook_exception['deleted']}
+            g_calendar_deleted, g_calendar_modified = self.snapshot.g_calendar_exceptions(g_calendar_master_id)
+            if ms_outlook_to_g_calendar:
+                self._plan_series_to_g_calendar(ms_outlook_master_id,
+                                                ms_outlook_master,
+                                                g_calendar_master,
+                                                sorted(ms_outlook_deleted - g_calendar_deleted))
+                self._plan_modified_occurrences_to_g_calendar(ms_outlook_master_id,
+                                                              g_calendar_master_id,
+                                                              ms_outlook_exceptions,
+                                                              g_calendar_modified,
+                                                              all_day)
+            if g_calendar_to_ms_outlook:
+                for start_key in sorted(g_calendar_deleted - ms_outlook_deleted):
+                    self.plan.add(SyncOperation(SyncAction.DELETE_OCCURRENCE,
+                                                SyncKind.OCCURRENCE,
+                                                EventSide.MS_OUTLOOK,
+                                                ms_outlook_master_id,
+                                                f'{g_calendar_master_id}_{start_key}',
+                                                payload={
+                                                        'start_utc': _start_from_key(start_key),
+                                                        'all_day'  : len(start_key) == 8},
+                                                description='excluded in [Google Calendar]'))
+
+    def _plan_series_to_g_calendar(self,
+                                   ms_outlook_master_id: str,
+                                   ms_outlook_master: dict,
+                                   g_calendar_master: dict,
+                                   exdates: list[str]):
+        g_calendar_recurrence = g_calendar_master.get('recurrence',
+                                                      [])
+        g_calendar_rules = [g_calendar_rule for g_calendar_rule in g_calendar_recurrence if g_calendar_rule.upper().startswith('RRULE')]
+        ms_outlook_rule = RecurrenceRule.from_ms_outlook(ms_outlook_master)
+        rule_changed = not g_calendar_rules or RecurrenceRule.parse(g_calendar_rules[0]) != ms_outlook_rule
+        if not rule_changed and not exdates:
+            return
+        # one PATCH per series, however many occurrences were deleted
+        g_calendar_recurrence = [ms_outlook_rule.to_rrule() if rule_changed else g_calendar_rules[0]] + [g_calendar_rule for g_calendar_rule in g_calendar_recurrence if not g_calendar_rule.upper().startswith('RRULE')] + [format_exdate(start_key) for start_key in exdates]
+        changes = (['RRULE'] if rule_changed else []) + ([f'[{len(exdates)}] EXDATE'] if exdates else [])
+        self.plan.add(SyncOperation(SyncAction.UPDATE,
+                                    SyncKind.RECURRENT,
+                                    EventSide.G_CALENDAR,
+                                    ms_outlook_master_id,
+                                    g_calendar_master['id'],
+                                    payload={
+                                            'body': {
+                                                    'recurrence': g_calendar_recurrence}},
+                                    description=' + '.join(changes)))
+
+    def _plan_modified_occurrences_to_g_calendar(self,
+                                                 ms_outlook_master_id: str,
+                                                 g_calendar_master_id: str,
+                                                 ms_outlook_exceptions: list[dict],
+                                                 g_calendar_modified: dict[str, dict],
+                                                 all_day: bool):
+        for ms_outlook_exception in ms_outlook_exceptions:
+            if ms_outlook_exception['deleted'] or not ms_outlook_exception['event']:
+                continue
+            start_key = _exception_start_key(ms_outlook_exception,
+                                             all_day)
+            g_calendar_instance_id = f'{g_calendar_master_id}_{start_key}'
+            ms_outlook_instance_id = create_date_id(ms_outlook_master_id,
+                                                    ms_outlook_exception['original_start_utc'])
+            calendar_event = CalendarInstance()
+            calendar_event.import_ms_outlook(ms_outlook_exception['event'])
+            # the occurrence carries its master's pattern; the Google instance does not
+            calendar_event.shared_recurrence = None
+            g_calendar_event = g_calendar_modified.get(start_key)
+            if g_calendar_event:
+                g_calendar_instance = CalendarInstance()
+                g_calendar_instance.import_g_calendar(g_calendar_event)
+                if g_calendar_instance.fingerprint() == calendar_event.fingerprint():
+                    if g_calendar_instance_id not in self.snapshot.occurrence_by_g_calendar:
+                        self.plan.add(SyncOperation(SyncAction.REPAIR_MAPPING,
+                                                    SyncKind.OCCURRENCE,
+                                                    None,
+                                                    ms_outlook_master_id,
+                                                    g_calendar_instance_id,
+                                                    payload={
+                                                            'ms_outlook_instance_id': ms_outlook_instance_id},
+                                                    description='modified occurrence already in step'))
+                    continue
+            g_calendar_body = {g_calendar_key: g_calendar_value for g_calendar_key, g_calendar_value in calendar_event.export_g_calendar().items() if g_calendar_key not in ('iCalUID',
+                                                                                                                                                          'recurrence')}
+            self.plan.add(SyncOperation(SyncAction.UPDATE,
+                                        SyncKind.OCCURRENCE,
+                                        EventSide.G_CALENDAR,
+                                        ms_outlook_master_id,
+                                        g_calendar_instance_id,
+                                        payload={
+                                                'body'                  : g_calendar_body,
+                                                'ms_outlook_instance_id': ms_outlook_instance_id},
+                                        description=f'modified occurrence [{g_calendar_body.get("summary")}]'))
+
+    def plan_copy_ms_outlook_single_event_to_g_calendar(self):
+        ms_outlook_pending_events = dict()
+        for ms_outlook_key, ms_outlook_event in self.snapshot.ms_outlook_instances.items():
+            if ms_outlook_event.get('IsRecurring',
+                                    False):
+                continue
+            if self.snapshot.get_instance_pair(recover_date_id(ms_outlook_key)):
+                continue
+            if self._held(SyncAction.INSERT,
+                          SyncKind.SINGLE,
+                          EventSide.G_CALENDAR,
+                          ms_outlook_id=recover_date_id(ms_outlook_key)):
+                continue
+            ms_outlook_pending_events[ms_outlook_key] = ms_outlook_event
+        # convert every unmapped event in one pass
+        calendar_events = CalendarInstance.import_many(ms_outlook_pending_events,
+                                                       EventSide.MS_OUTLOOK)
+        g_calendar_exported_events = CalendarInstance.export_many(calendar_events,
+                                                                  EventSide.G_CALENDAR)
+        for ms_outlook_key, g_calendar_exported_event in g_calendar_exported_events.items():
+            if not self._claim(recover_date_id(ms_outlook_key)):
+                continue
+            self.plan.add(SyncOperation(SyncAction.INSERT,
+                                        SyncKind.SINGLE,
+                                        EventSide.G_CALENDAR,
+                                        recover_date_id(ms_outlook_key),
+                                        payload={
+                                                'body'       : g_calendar_exported_event,
+                                                'source'     : calendar_events[ms_outlook_key],
+                                                'instance_end': ms_outlook_pending_events[ms_outlook_key].get('EndUTC')},
+                                        description=f'[{g_calendar_exported_event.get("summary")}]'))
+
+    def plan_copy_g_calendar_single_event_to_ms_outlook(self):
+        g_calendar_pending_events = dict()
+        for g_calendar_id, g_calendar_event in self.snapshot.g_calendar_single_events().items():
+            if self.snapshot.get_instance_pair(g_calendar_id):
+                continue
+            if self._held(SyncAction.INSERT,
+                          SyncKind.SINGLE,
+                          EventSide.MS_OUTLOOK,
+                          g_calendar_id=g_calendar_id):
+                continue
+            g_calendar_pending_events[g_calendar_id] = g_calendar_event
+        calendar_events = CalendarInstance.import_many(g_calendar_pending_events,
+                                                       EventSide.G_CALENDAR)
+        ms_outlook_exported_events = CalendarInstance.export_many(calendar_events,
+                                                                  EventSide.MS_OUTLOOK)
+        for g_calendar_id, ms_outlook_exported_event in ms_outlook_exported_events.items():
+            if not self._claim(g_calendar_id):
+                continue
+            # all-day events only carry a date: without it the row gets no single_events_date
+            g_calendar_end = g_calendar_pending_events[g_calendar_id].get('end',
+                                                                          {})
+            self.plan.add(SyncOperation(SyncAction.INSERT,
+                                        SyncKind.SINGLE,
+                                        EventSide.MS_OUTLOOK,
+                                        g_calendar_id=g_calendar_id,
+                                        payload={
+                                                'body'       : ms_outlook_exported_event,
+                                                'source'     : calendar_events[g_calendar_id],
+                                                'instance_end': g_calendar_end.get('dateTime') or g_calendar_end.get('date')},
+                                        description=f'[{ms_outlook_exported_event.get("Subject")}]'))
+
+    def plan_copy_ms_outlook_recurrent_event_to_g_calendar(self):
+        for ms_outlook_key, ms_outlook_event in self.snapshot.ms_outlook_recurrences.items():
+            if not ms_outlook_event.get('IsRecurring',
+                                        False):
+                continue
+            ms_outlook_master_id = recover_date_id(ms_outlook_key)
+            if self.snapshot.get_recurrent_pair(ms_outlook_master_id):
+                continue
+            if self._held(SyncAction.INSERT,
+                          SyncKind.RECURRENT,
+                          EventSide.G_CALENDAR,
+                          ms_outlook_id=ms_outlook_master_id):
+                continue
+            if not self._claim(ms_outlook_master_id):
+                continue
+            calendar_event = CalendarInstance()
+            calendar_event.import_ms_outlook(ms_outlook_event)
+            g_calendar_exported_event = calendar_event.export_g_calendar()
+            self.plan.add(SyncOperation(SyncAction.INSERT,
+                                        SyncKind.RECURRENT,
+                                        EventSide.G_CALENDAR,
+                                        ms_outlook_master_id,
+                                        payload={
+                                                'body'          : g_calendar_exported_event,
+                                                'ms_outlook_key': ms_outlook_key},
+                                        description=f'[{g_calendar_exported_event.get("summary")}]'))
+
+    def plan_copy_g_calendar_recurrent_event_to_ms_outlook(self):
+        g_calendar_series = self.snapshot.g_calendar_occurrences()
+        if constants.RECURRENCE_SYNC_MODE == constants.RECURRENCE_MODE_MASTER:
+            # occurrences are not expanded in this mode: walk the series themselves
+            g_calendar_series = {g_calendar_id: g_calendar_event for g_calendar_id, g_calendar_event in self.snapshot.g_calendar_masters.items() if 'recurrence' in g_calendar_event}
+        for g_calendar_id, g_calendar_event in g_calendar_series.items():
+            g_calendar_master_id = get_master_id(g_calendar_id)
+            if self.snapshot.get_recurrent_pair(g_calendar_master_id) or self.snapshot.get_recurrent_pair(g_calendar_id):
+                continue
+            if self._held(SyncAction.INSERT,
+                          SyncKind.RECURRENT,
+                          EventSide.MS_OUTLOOK,
+                          g_calendar_id=g_calendar_master_id):
+                continue
+            # one Outlook series per Google series, not one per listed occurrence
+            if not self._claim(g_calendar_master_id):
+                continue
+            calendar_event = CalendarInstance()
+            # the master carries the RRULE; an occurrence alone would be copied as a single event
+            calendar_event.import_g_calendar(self.snapshot.g_calendar_masters.get(g_calendar_master_id) or g_calendar_event)
+            ms_outlook_exported_event = calendar_event.export_ms_outlook()
+            self.plan.add(SyncOperation(SyncAction.INSERT,
+                                        SyncKind.RECURRENT,
+                                        EventSide.MS_OUTLOOK,
+                                        g_calendar_id=g_calendar_master_id,
+                                        payload={
+                                                'body': ms_outlook_exported_event},
+                                        description=f'[{ms_outlook_exported_event.get("Subject")}]'))
+
+    def plan_changes_single_event(self,
+                                  ms_outlook_to_g_calendar: bool,
+                                  g_calendar_to_ms_outlook: bool):
+        ms_outlook_events = self.snapshot.ms_outlook_single_events
+        g_calendar_events = self.snapshot.g_calendar_events
+        mapped_pairs = dict()
+        for ms_outlook_id, g_calendar_id in self.snapshot.mapping['single_events'].items():
+            if ms_outlook_id in ms_outlook_events and g_calendar_id in g_calendar_events and ms_outlook_id not in self._claimed:
+                mapped_pairs[ms_outlook_id] = g_calendar_id
+        ms_outlook_instances = CalendarInstance.import_many({ms_outlook_id: ms_outlook_events[ms_outlook_id] for ms_outlook_id in mapped_pairs},
+                                                           EventSide.MS_OUTLOOK)
+        g_calendar_instances = CalendarInstance.import_many({g_calendar_id: g_calendar_events[g_calendar_id] for g_calendar_id in mapped_pairs.values()},
+                                                           EventSide.G_CALENDAR)
+        for ms_outlook_id, g_calendar_id in mapped_pairs.items():
+            ms_outlook_instance = ms_outlook_instances[ms_outlook_id]
+            g_calendar_instance = g_calendar_instances[g_calendar_id]
+            ms_outlook_fingerprint = ms_outlook_instance.fingerprint()
+            g_calendar_fingerprint = g_calendar_instance.fingerprint()
+            stored_fingerprint = self.snapshot.get_fingerprint(ms_outlook_id) or dict()
+            stored_ms_outlook = stored_fingerprint.get(EventSide.MS_OUTLOOK.value)
+            stored_g_calendar = stored_fingerprint.get(EventSide.G_CALENDAR.value)
+            fingerprints = {
+                    EventSide.MS_OUTLOOK.value: ms_outlook_fingerprint,
+                    EventSide.G_CALENDAR.value: g_calendar_fingerprint}
+            if not stored_ms_outlook or not stored_g_calendar:
+                # first time this pair is seen with fingerprints: take the current state as the baseline
+                self.plan.add(SyncOperation(SyncAction.REPAIR_MAPPING,
+                                            SyncKind.SINGLE,
+                                            None,
+                                            ms_outlook_id,
+                                            g_calendar_id,
+                                            payload={
+                                                    'fingerprints': fingerprints},
+                                            description='fingerprint baseline'))
+                continue
+            ms_outlook_changed = ms_outlook_fingerprint != stored_ms_outlook
+            g_calendar_changed = g_calendar_fingerprint != stored_g_calendar
+            if not ms_outlook_changed and not g_calendar_changed:
+                continue
+            conflict = 'changed on both sides, ' if ms_outlook_changed and g_calendar_changed else ''
+            if ms_outlook_changed and ms_outlook_to_g_calendar:
+                g_calendar_body = dict(g_calendar_events[g_calendar_id])
+                g_calendar_body.update({g_calendar_key: g_calendar_value for g_calendar_key, g_calendar_value in ms_outlook_instance.export_g_calendar().items() if g_calendar_key != 'iCalUID'})
+                self.plan.add(SyncOperation(SyncAction.UPDATE,
+                                            SyncKind.SINGLE,
+                                            EventSide.G_CALENDAR,
+                                            ms_outlook_id,
+                                            g_calendar_id,
+                                            payload={
+                                                    'body'        : g_calendar_body,
+                                                    'fingerprints': fingerprints},
+                                            description=f'{conflict}[Microsoft Outlook] wins' if conflict else ''))
+            elif g_calendar_changed and g_calendar_to_ms_outlook:
+                self.plan.add(SyncOperation(SyncAction.UPDATE,
+                                            SyncKind.SINGLE,
+                                            EventSide.MS_OUTLOOK,
+                                            ms_outlook_id,
+                                            g_calendar_id,
+                                            payload={
+                                                    'body'        : g_calendar_instance.export_ms_outlook(),
+                                                    'fingerprints': fingerprints},
+                                            description=f'{conflict}[Google Calendar] wins' if conflict else ''))
@@ -0,0 +1,280 @@
+import ctypes
+import logging
+import threading
+import time
+from functools import partial
+from typing import Callable
+
+import system.constants as constants
+from system.dirty_queue import ms_outlook_dirty_queue
+from system.g_calendar_push import g_calendar_push
+from system.job_scheduler import JobScheduler
+from system.sync_engine import SyncEngine
+from system.sync_engine import TRIGGER_GOOGLE
+from system.sync_engine import TRIGGER_OUTLOOK
+from system.sync_engine import TRIGGER_SCHEDULE
+from system.sync_engine import TRIGGER_USER
+from system.sync_pacer import sync_pacer
+from system.tools import line_number
+from system.tools import print_display
+
+# scheduler jobs
+JOB_OBSERVER = 'observer'
+JOB_SYNC = 'sync'
+JOB_CHANGE_WATCH = 'change watch'
+JOB_G_CALENDAR_PUSH = 'google push'
+
+logger = logging.getLogger('CalendarSync Logger')
+
+
+class SystemObserver:
+    def __init__(self):
+        self.enabled = True
+        self.continuous = 0x80000000
+        self.system_required = 0x00000001
+        self.display_required = 0x00000002
+
+    def system_observer_state(self):
+        if self.enabled:
+            print_display(f'{line_number()} System observing state...')
+            ctypes.windll.kernel32.SetThreadExecutionState(self.continuous | self.system_required | self.display_required)
+
+    def system_original_state(self):
+        if self.enabled:
+            print_display(f'{line_number()} System continuous system state...')
+            ctypes.windll.kernel32.SetThreadExecutionState(self.continuous)
+
+
+class SyncService:
+    """The scheduler, its jobs and the sync engine, without any user interface.
+
+    The tray app and the headless service both run one of these; the tray
+    follows the jobs through on_jobs_changed, which is called with the number
+    of wrapped jobs running every time it changes.
+    """
+
+    def __init__(self,
+                 on_jobs_changed: Callable[[int], None] = None):
+        self.paused = threading.Event()
+        self.paused.set()  # set = NOT paused (running)
+        self.stop_event = threading.Event()
+        self.job_scheduler = JobScheduler(self.stop_event,
+                                          self.paused,
+                                          workers=constants.SCHEDULER_WORKERS)
+        # the mapping, both connectors and their caches, kept for the whole process
+        self.sync_engine = SyncEngine(self.stop_event)
+        self.on_jobs_changed = on_jobs_changed
+        self.active_jobs = 0
+        self._active_jobs_lock = threading.Lock()
+        self.started_at: float | None = None
+
+    # ---- pause-aware helpers ----------------------------------------------
+
+    def interruptible_sleep(self,
+                            seconds: float,
+                            interval: float = 0.5):
+        """Sleep for `seconds`, honoring pause and stop at each interval tick."""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if self.stop_event.is_set():
+                raise StopIteration('stop requested')
+            if not self.paused.is_set():
+                self.paused.wait()
+                deadline = time.monotonic() + (deadline - time.monotonic())
+            remaining = deadline - time.monotonic()
+            time.sleep(min(interval,
+                           max(remaining,
+                               0)))
+
+    def check_pause(self):
+        """Block if paused; raise StopIteration if stop was requested."""
+        if self.stop_event.is_set():
+            raise StopIteration('stop requested')
+        if not self.paused.is_set():
+            self.paused.wait()
+        if self.stop_event.is_set():
+            raise StopIteration('stop requested')
+
+    # ---- jobs -------------------------------------------------------------
+
+    def _job_wrapper(self,
+                     function,
+                     *args,
+                     **kwargs):
+        with self._active_jobs_lock:
+            self.active_jobs += 1
+            self._jobs_changed()
+        try:
+            function(*args,
+                     **kwargs)
+        finally:
+            with self._active_jobs_lock:
+                self.active_jobs -= 1
+                self._jobs_changed()
+
+    def _jobs_changed(self):
+        if self.on_jobs_changed is not None:
+            self.on_jobs_changed(self.active_jobs)
+
+    def function_observer(self):
+        logger.info('[Observer] started')
+        system_observer = SystemObserver()
+        try:
+            self.check_pause()
+            system_observer.system_observer_state()
+            self.interruptible_sleep(3)
+        except StopIteration:
+            logger.warning('[Observer] interrupted')
+            system_observer.system_original_state()
+        logger.info('[Observer] Cycled')
+
+    def function_sync_job(self,
+                          trigger: str = TRIGGER_SCHEDULE):
+        logger.info(f'[Sync Job] started ({trigger})')
+        # pywin32 and the connectors are imported by the first job that needs them, not at startup
+        import pythoncom
+        pythoncom.CoInitialize()
+        try:
+            self.check_pause()
+            self.sync_engine.run_cycle(trigger)
+            self.interruptible_sleep(4)
+        except StopIteration:
+            logger.warning('[Sync Job] interrupted')
+        finally:
+            # Always uninitialize COM to clean up resources
+            pythoncom.CoUninitialize()
+        logger.info('[Sync Job] Cycled')
+
+    def function_change_watch(self):
+        # cheap and frequent: settled Outlook events or Google notifications start the sync job
+        if self.job_scheduler.is_running(JOB_SYNC):
+            return
+        if constants.SYNC_EVENTS_ENABLED and ms_outlook_dirty_queue.ready():
+            self.job_scheduler.run_now(JOB_SYNC,
+                                       trigger=TRIGGER_OUTLOOK)
+        elif constants.G_CALENDAR_PUSH_ENABLED and g_calendar_push.ready():
+            self.job_scheduler.run_now(JOB_SYNC,
+                                       trigger=TRIGGER_GOOGLE)
+
+    @staticmethod
+    def function_g_calendar_push():
+        # keep a channel open; while there is none the sync job polls at its usual pace
+        sync_pacer.set_push_live(g_calendar_push.maintain())
+
+    def function_outlook_events(self):
+        # Outlook calendar events, on a thread that owns its own Outlook connection
+        from connector.ms_outlook_events import MicrosoftOutlookEventWatcher
+        event_watcher = MicrosoftOutlookEventWatcher()
+        while not self.stop_event.is_set():
+            event_watcher.run(self.stop_event)
+            # Outlook went away: listen again once it may be back
+            self.stop_event.wait(60)
+
+    # ---- lifecycle --------------------------------------------------------
+
+    def start(self):
+        """Register the jobs and start the scheduler and the Outlook event thread; returns at once."""
+        self.job_scheduler.add_job(JOB_OBSERVER,
+                                   partial(self._job_wrapper,
+                                           self.function_observer),
+                                   constants.INTERVAL_OBSERVER)
+        # sooner while the calendars are busy and later while they are quiet
+        self.job_scheduler.add_job(JOB_SYNC,
+                                   partial(self._job_wrapper,
+                                           self.function_sync_job),
+                                   sync_pacer.interval,
+                                   jitter=constants.SYNC_JOB_JITTER)
+        if constants.SYNC_EVENTS_ENABLED or constants.G_CALENDAR_PUSH_ENABLED:
+            self.job_scheduler.add_job(JOB_CHANGE_WATCH,
+                                       self.function_change_watch,
+                                       constants.INTERVAL_CHANGE_WATCH)
+        if constants.G_CALENDAR_PUSH_ENABLED and constants.G_CALENDAR_PUSH_ADDRESS:
+            try:
+                g_calendar_push.start()
+                self.job_scheduler.add_job(JOB_G_CALENDAR_PUSH,
+                                           self.function_g_calendar_push,
+                                           60)
+            except OSError as os_error:
+                logger.warning(f'[Google Calendar] push receiver not started, polling only: {os_error}')
+        self.job_scheduler.start()
+        # Outlook calendar events feed the scheduler's dirty queue
+        if constants.SYNC_EVENTS_ENABLED:
+            threading.Thread(target=self.function_outlook_events,
+                             daemon=True).start()
+        self.started_at = time.time()
+        logger.info(f'Scheduler started: jobs [{", ".join(self.job_scheduler.jobs())}] workers [{self.job_scheduler.workers}]')
+
+    def stop(self):
+        self.job_scheduler.stop()
+        # a job blocked on the pause flag sees the stop once released
+        self.paused.set()
+        self.sync_engine.stop()
+        if constants.G_CALENDAR_PUSH_ENABLED:
+            g_calendar_push.stop()
+
+    @property
+    def is_paused(self) -> bool:
+        return not self.paused.is_set()
+
+    def pause(self) -> bool:
+        """False when already paused."""
+        if self.is_paused:
+            return False
+        self.paused.clear()
+        logger.info('Paused by user')
+        self.job_scheduler.wake()
+        return True
+
+    def resume(self) -> bool:
+        """False when not paused."""
+        if not self.is_paused:
+            return False
+        self.paused.set()
+        logger.info('Resumed by user')
+        self.job_scheduler.wake()
+        return True
+
+    def sync_now(self) -> bool:
+        """Ask for a full sync cycle now; False when one is already running."""
+        if self.job_scheduler.run_now(JOB_SYNC,
+                                      trigger=TRIGGER_USER):
+            logger.info('Sync requested by user')
+            return True
+        logger.warning('Sync Job still running — request ignored')
+        return False
+
+    def cancel_sync(self) -> bool:
+        """Give up the running sync cycle; False when none is running."""
+        if self.sync_engine.cancel():
+            logger.info('Sync cancelled by user')
+            return True
+        logger.warning('No sync running — cancel ignored')
+        return False
+
+    def status(self) -> dict:
+        time_now = time.monotonic()
+        jobs = dict()
+        for name, job in self.job_scheduler.jobs().items():
+            jobs[name] = {
+                    'running'   : job.running,
+                    'runs'      : job.runs,
+                    'pending'   : len(job.pending),
+                    'next_in'   : round(job.next_run - time_now,
+                                        1) if job.next_run is not None else None,
+                    'last_error': job.last_error}
+        return {
+                'paused'     : self.is_paused,
+                'started_at' : self.started_at,
+                'active_jobs': self.active_jobs,
+                'jobs'       : jobs,
+                'sync'       : self.sync_engine.statistics(),
+                'push_live'  : g_calendar_push.live}
+
+    def control_commands(self) -> dict:
+        """What the control socket of this process answers to."""
+        return {
+                'status': self.status,
+                'pause' : self.pause,
+                'resume': self.resume,
+                'sync'  : self.sync_now,
+                'cancel': self.cancel_sync}
@@ -0,0 +1,563 @@
+import json
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from googleapiclient.errors import HttpError
+
+import system.constants as constants
+
+from connector.event_mapping import EventMapping
+from connector.g_calendar import GoogleCalendarConnector
+from connector.ms_outlook import MicrosoftOutlookConnector
+from system.recurrence_rule import RecurrenceRule
+from system.snapshot_cache import SnapshotCache
+from system.sync_window import SyncWindow
+from system.tools import create_date_id
+from system.tools import g_calendar_start_key
+from system.tools import line_number
+from system.tools import local_date_key
+from system.tools import parse_exdates
+from system.tools import print_box
+from system.tools import print_display
+from system.tools import recover_date_id
+from system.tools import utc_key
+
+
+class SyncSnapshot:
+    """Both calendars and the event mapping, read once per sync cycle.
+
+    Every SyncTask phase reads from here instead of listing the calendars
+    again, and every write goes through the mutation helpers below so the
+    snapshot (and the persisted EventMapping) stay in step for later phases.
+    """
+
+    def __init__(self,
+                 ms_outlook_connection: MicrosoftOutlookConnector,
+                 g_calendar_connection: GoogleCalendarConnector,
+                 event_mapping: EventMapping,
+                 sync_window: SyncWindow = None,
+                 snapshot_cache: SnapshotCache = None):
+        self.ms_outlook_connection = ms_outlook_connection
+        self.g_calendar_connection = g_calendar_connection
+        self.event_mapping = event_mapping
+        # range both calendars are listed over; the full DAY_PAST/DAY_NEXT window by default
+        self.window = sync_window or SyncWindow()
+        # listings of the previous full-window snapshot, optional
+        self.snapshot_cache = snapshot_cache
+        # Microsoft Outlook: date ID => data (occurrences expanded), date ID => master
+        self.ms_outlook_instances: dict[str, dict] = dict()
+        self.ms_outlook_recurrences: dict[str, dict] = dict()
+        # Microsoft Outlook: EntryID => data, non-recurring items only
+        self.ms_outlook_single_events: dict[str, dict] = dict()
+        # Microsoft Outlook: every EntryID seen in the window (singles, masters, occurrences)
+        self.ms_outlook_entry_ids: set[str] = set()
+        # Microsoft Outlook: master EntryID => master data, from the recurrences listing
+        self.ms_outlook_masters: dict[str, dict] = dict()
+        # Microsoft Outlook: master EntryID => utc_key (and local YYYYMMDD) of each live occurrence
+        self.ms_outlook_occurrence_starts: dict[str, set[str]] = dict()
+        # Google Calendar: id => event, singleEvents=True and singleEvents=False listings
+        self.g_calendar_events: dict[str, dict] = dict()
+        self.g_calendar_masters: dict[str, dict] = dict()
+        # Google Calendar: id => cancelled occurrence, from the same showDeleted listing
+        self.g_calendar_cancelled: dict[str, dict] = dict()
+        # Google Calendar: mapped single events found alive by ID outside a narrow tier's listing
+        self.g_calendar_confirmed: set[str] = set()
+        # master-level recurrence mode: Outlook master EntryID => exceptions (see get_recurrence_exceptions)
+        self.ms_outlook_exceptions: dict[str, list[dict]] = dict()
+        # event mapping copy plus reverse indexes
+        self.mapping: dict = dict()
+        self.single_by_g_calendar: dict[str, str] = dict()
+        self.recurrent_by_g_calendar: dict[str, str] = dict()
+        self.occurrence_by_g_calendar: dict[str, tuple[str, str]] = dict()
+        self.occurrence_master: dict[str, str] = dict()
+
+    def capture(self) -> 'SyncSnapshot':
+        fetched_at = datetime.now(timezone.utc)
+        # a full window can start from the previous one and read only what moved or changed
+        delta = self.snapshot_cache is not None and self.snapshot_cache.usable(self.window)
+        if self.window.full and self.snapshot_cache is not None:
+            self.snapshot_cache.count(delta)
+        self.ms_outlook_instances = self.ms_outlook_connection.get_all_instances_ms_outlook(self.window,
+                                                                                            self.snapshot_cache.ms_outlook_instances if delta else None)
+        self.ms_outlook_recurrences = self.ms_outlook_connection.get_all_recurrences_ms_outlook(self.window)
+        self.g_calendar_events = dict()
+        self.g_calendar_masters = dict()
+        self.g_calendar_cancelled = dict()
+        self.ms_outlook_exceptions = dict()
+        self.mapping = self.event_mapping.get_all_instances()
+        master_mode = constants.RECURRENCE_SYNC_MODE == constants.RECURRENCE_MODE_MASTER
+        if delta:
+            self._capture_g_calendar_delta()
+        elif master_mode:
+            self._capture_masters(self.window)
+        else:
+            self._capture_occurrences(self.window)
+        if master_mode:
+            self._capture_ms_outlook_exceptions()
+        self._index()
+        if not self.window.full:
+            self._confirm_singles_outside_listing()
+        elif self.snapshot_cache is not None:
+            self.snapshot_cache.store(self,
+                                      fetched_at)
+        print_box(f'{line_number()} [SNAPSHOT] [{self.window}]{" (delta)" if delta else ""} [Microsoft Outlook] instances: [{len(self.ms_outlook_instances)}] recurrences: [{len(self.ms_outlook_recurrences)}] / '
+                  f'[Google Calendar] events: [{len(self.g_calendar_events)}] masters: [{len(self.g_calendar_masters)}] cancelled: [{len(self.g_calendar_cancelled)}] / '
+                  f'[EVENT MAPPING] single: [{len(self.mapping["single_events"])}] recurrent: [{len(self.mapping["recurrent_events"])}]')
+        return self
+
+    def _capture_occurrences(self,
+                             sync_window: SyncWindow):
+        for g_calendar_id, g_calendar_event in self.g_calendar_connection.get_all_sub_instances_g_calendar(include_cancelled=True,
+                                                                                                               sync_window=sync_window).items():
+            if g_calendar_event.get('status') == 'cancelled':
+                self.g_calendar_cancelled[g_calendar_id] = g_calendar_event
+            else:
+                self.g_calendar_events[g_calendar_id] = g_calendar_event
+        self.g_calendar_masters.update(self.g_calendar_connection.get_all_masters_g_calendar(sync_window=sync_window))
+
+    def _capture_masters(self,
+                         sync_window: SyncWindow):
+        # one singleEvents=False listing: series stay unexpanded, only their exceptions are listed
+        for g_calendar_id, g_calendar_event in self.g_calendar_connection.get_all_masters_g_calendar(include_cancelled=True,
+                                                                                                         sync_window=sync_window).items():
+            if g_calendar_event.get('status') == 'cancelled':
+                self.g_calendar_cancelled[g_calendar_id] = g_calendar_event
+            elif 'recurrence' in g_calendar_event:
+                self.g_calendar_masters[g_calendar_id] = g_calendar_event
+            else:
+                self.g_calendar_events[g_calendar_id] = g_calendar_event
+
+    def _capture_ms_outlook_exceptions(self):
+        # one pattern read per mapped series in the window
+        ms_outlook_master_ids = {recover_date_id(ms_outlook_key) for ms_outlook_key in self.ms_outlook_recurrences}
+        for ms_outlook_master_id in self.mapping['recurrent_events']:
+            if ms_outlook_master_id in ms_outlook_master_ids:
+                self.ms_outlook_exceptions[ms_outlook_master_id] = self.ms_outlook_connection.get_recurrence_exceptions(ms_outlook_master_id)
+
+    # ---- sliding window delta (full window only, see SnapshotCache) --------
+
+    def _capture_g_calendar_delta(self):
+        snapshot_cache = self.snapshot_cache
+        self.g_calendar_events = dict(snapshot_cache.g_calendar_events)
+        self.g_calendar_masters = dict(snapshot_cache.g_calendar_masters)
+        self.g_calendar_cancelled = dict(snapshot_cache.g_calendar_cancelled)
+        # past edge (and a shrunk window): whatever fell off is dropped
+        dropped = 0
+        for g_calendar_listing in (self.g_calendar_events,
+                                   self.g_calendar_masters,
+                                   self.g_calendar_cancelled):
+            for g_calendar_id in [g_calendar_id for g_calendar_id, g_calendar_event in g_calendar_listing.items() if not self._g_calendar_in_window(g_calendar_event)]:
+                del g_calendar_listing[g_calendar_id]
+                dropped += 1
+        # future edge (and a window grown in the settings): the new range is listed in full
+        edges = list()
+        if self.window.end > snapshot_cache.window.end:
+            edges.append(SyncWindow.between('edge',
+                                            max(snapshot_cache.window.end,
+                                                self.window.begin),
+                                            self.window.end))
+        if self.window.begin < snapshot_cache.window.begin:
+            edges.append(SyncWindow.between('edge',
+                                            self.window.begin,
+                                            min(snapshot_cache.window.begin,
+                                                self.window.end)))
+        for edge_window in edges:
+            if constants.RECURRENCE_SYNC_MODE == constants.RECURRENCE_MODE_MASTER:
+                self._capture_masters(edge_window)
+            else:
+                self._capture_occurrences(edge_window)
+        # middle: only what was modified or deleted since the previous listing, with a margin for clock skew
+        updated_min = (snapshot_cache.fetched_at - timedelta(minutes=5)).isoformat().replace('+00:00',
+                                                                                             'Z')
+        g_calendar_changes = self.g_calendar_connection.get_changed_g_calendar(updated_min)
+        for g_calendar_id, g_calendar_event in g_calendar_changes.items():
+            self._merge_g_calendar_change(g_calendar_id,
+                                          g_calendar_event)
+        print_display(f'{line_number()} [SNAPSHOT] [Google Calendar] delta: dropped [{dropped}] edges {edges} changed [{len(g_calendar_changes)}]')
+
+    def _g_calendar_in_window(self,
+                              g_calendar_event: dict) -> bool:
+        if 'recurrence' in g_calendar_event:
+            # a series stays until its UNTIL falls behind the window
+            for g_calendar_rule in g_calendar_event['recurrence']:
+                if g_calendar_rule.upper().startswith('RRULE'):
+                    g_calendar_until = RecurrenceRule.parse(g_calendar_rule).until
+                    if not g_calendar_until:
+                        return True
+                    # day precision is enough to tell a finished series
+                    return datetime.strptime(g_calendar_until[:8],
+                                             '%Y%m%d').replace(tzinfo=timezone.utc) >= self.window.begin - timedelta(days=1)
+            return True
+        g_calendar_start = g_calendar_event.get('start') or g_calendar_event.get('originalStartTime')
+        if not g_calendar_start:
+            # a deleted event comes back without its times: keep it for this cycle
+            return True
+        g_calendar_end = g_calendar_event.get('end') or g_calendar_start
+        return self.window.overlaps(g_calendar_start.get('dateTime') or g_calendar_start.get('date'),
+                                    g_calendar_end.get('dateTime') or g_calendar_end.get('date'))
+
+    def _merge_g_calendar_change(self,
+                                 g_calendar_id: str,
+                                 g_calendar_event: dict):
+        master_mode = constants.RECURRENCE_SYNC_MODE == constants.RECURRENCE_MODE_MASTER
+        self.g_calendar_events.pop(g_calendar_id,
+                                   None)
+        if self.g_calendar_masters.pop(g_calendar_id,
+                                       None) is not None and not master_mode:
+            # the series changed or went: its expanded occurrences are listed again below, or dropped
+            for g_calendar_instance_id in [g_calendar_key for g_calendar_key, g_calendar_instance in self.g_calendar_events.items() if g_calendar_instance.get('recurringEventId') == g_calendar_id]:
+                del self.g_calendar_events[g_calendar_instance_id]
+        self.g_calendar_cancelled.pop(g_calendar_id,
+                                      None)
+        if g_calendar_event.get('status') == 'cancelled':
+            self.g_calendar_cancelled[g_calendar_id] = g_calendar_event
+            return
+        if not self._g_calendar_in_window(g_calendar_event):
+            # moved out of the window: absent, as a full listing would have it
+            return
+        if master_mode:
+            if 'recurrence' in g_calendar_event:
+                self.g_calendar_masters[g_calendar_id] = g_calendar_event
+            else:
+                self.g_calendar_events[g_calendar_id] = g_calendar_event
+            return
+        # occurrence mode mirrors both listings: singleEvents=False holds everything, singleEvents=True the expansion
+        self.g_calendar_masters[g_calendar_id] = g_calendar_event
+        if 'recurrence' not in g_calendar_event:
+            self.g_calendar_events[g_calendar_id] = g_calendar_event
+            return
+        g_calendar_instances = self.g_calendar_connection.get_all_single_instances_inside_recurrence_g_calendar(g_calendar_id).get('items',
+                                                                                                                                   [])
+        for g_calendar_instance in g_calendar_instances:
+            if g_calendar_instance.get('status') != 'cancelled':
+                self.g_calendar_events[g_calendar_instance['id']] = g_calendar_instance
+
+    def _confirm_singles_outside_listing(self):
+        """A narrow tier lists only part of the calendars: a mapped single event dated
+        inside it but missing from the listing may have moved out of it, so it is
+        looked up by ID before the planner may read its absence as a deletion."""
+        self.g_calendar_confirmed = set()
+        confirmed = 0
+        for ms_outlook_id, g_calendar_id in self.mapping['single_events'].items():
+            if not g_calendar_id or not self.single_in_window(ms_outlook_id):
+                continue
+            if ms_outlook_id not in self.ms_outlook_entry_ids and self.ms_outlook_connection.item_exists_ms_outlook(ms_outlook_id):
+                self.ms_outlook_entry_ids.add(ms_outlook_id)
+                confirmed += 1
+            if g_calendar_id not in self.g_calendar_events:
+                try:
+                    g_calendar_event = self.g_calendar_connection.get_single_instance_g_calendar(g_calendar_id)
+                except HttpError as http_error:
+                    if http_error.status_code not in (404,
+                                                      410):
+                        raise
+                    continue
+                if g_calendar_event and g_calendar_event.get('status') != 'cancelled':
+                    self.g_calendar_confirmed.add(g_calendar_id)
+                    confirmed += 1
+        if confirmed:
+            print_box(f'{line_number()} [SNAPSHOT] [{confirmed}] mapped events moved outside the [{self.window.name}] window')
+
+    def _index(self):
+        self.ms_outlook_single_events = dict()
+        self.ms_outlook_entry_ids = set()
+        self.ms_outlook_occurrence_starts = dict()
+        for ms_outlook_key, ms_outlook_event in self.ms_outlook_instances.items():
+            ms_outlook_entry_id = recover_date_id(ms_outlook_key)
+            self.ms_outlook_entry_ids.add(ms_outlook_entry_id)
+            if not ms_outlook_event.get('IsRecurring',
+                                        False):
+                self.ms_outlook_single_events[ms_outlook_entry_id] = ms_outlook_event
+                continue
+            # the restriction expands recurrences, so the occurrences are already here: no COM call per occurrence
+            ms_outlook_starts = self.ms_outlook_occurrence_starts.setdefault(ms_outlook_entry_id,
+                                                                             set())
+            ms_outlook_start_key = utc_key(ms_outlook_event.get('StartUTC'))
+            if ms_outlook_start_key:
+                ms_outlook_starts.add(ms_outlook_start_key)
+            ms_outlook_date_key = local_date_key(ms_outlook_event.get('Start'))
+            if ms_outlook_date_key:
+                ms_outlook_starts.add(ms_outlook_date_key)
+        self.ms_outlook_masters = dict()
+        for ms_outlook_key, ms_outlook_event in self.ms_outlook_recurrences.items():
+            self.ms_outlook_entry_ids.add(recover_date_id(ms_outlook_key))
+            self.ms_outlook_masters.setdefault(recover_date_id(ms_outlook_key),
+                                               ms_outlook_event)
+        self.single_by_g_calendar = {g_calendar_id: ms_outlook_id for ms_outlook_id, g_calendar_id in self.mapping['single_events'].items() if g_calendar_id}
+        self.recurrent_by_g_calendar = dict()
+        self.occurrence_by_g_calendar = dict()
+        self.occurrence_master = dict()
+        for ms_outlook_master_id, master_data in self.mapping['recurrent_events'].items():
+            self.recurrent_by_g_calendar[master_data['g_calendar_master_id']] = ms_outlook_master_id
+            for ms_outlook_instance_id, g_calendar_instance_id in master_data['instances'].items():
+                self.occurrence_by_g_calendar[g_calendar_instance_id] = (ms_outlook_master_id,
+                                                                         ms_outlook_instance_id)
+                self.occurrence_master[ms_outlook_instance_id] = ms_outlook_master_id
+
+    # ---- calendar views ----------------------------------------------------
+
+    def g_calendar_single_events(self) -> dict[str, dict]:
+        return {g_calendar_id: g_calendar_event for g_calendar_id, g_calendar_event in self.g_calendar_events.items() if 'recurrence' not in g_calendar_event and 'recurringEventId' not in g_calendar_event}
+
+    def g_calendar_occurrences(self) -> dict[str, dict]:
+        return {g_calendar_id: g_calendar_event for g_calendar_id, g_calendar_event in self.g_calendar_events.items() if 'recurringEventId' in g_calendar_event}
+
+    def g_calendar_exceptions(self,
+                              g_calendar_master_id: str) -> tuple[set[str], dict[str, dict]]:
+        """Start keys deleted from a Google series (EXDATE or cancelled) and its listed occurrences by start key."""
+        g_calendar_master = self.g_calendar_masters.get(g_calendar_master_id, dict())
+        g_calendar_deleted = parse_exdates(g_calendar_master.get('recurrence'))
+        g_calendar_deleted.update(g_calendar_start_key(g_calendar_event) for g_calendar_event in self.g_calendar_cancelled.values() if g_calendar_event.get('recurringEventId') == g_calendar_master_id)
+        g_calendar_modified = {g_calendar_start_key(g_calendar_event): g_calendar_event for g_calendar_event in self.g_calendar_events.values() if g_calendar_event.get('recurringEventId') == g_calendar_master_id}
+        g_calendar_deleted.discard(None)
+        return g_calendar_deleted, g_calendar_modified
+
+    def ms_outlook_recurrence(self,
+                              ms_outlook_master_id: str) -> dict | None:
+        return self.ms_outlook_masters.get(recover_date_id(ms_outlook_master_id))
+
+    def g_calendar_event(self,
+                         g_calendar_id: str) -> dict | None:
+        return self.g_calendar_events.get(g_calendar_id) or self.g_calendar_masters.get(g_calendar_id)
+
+    def single_in_window(self,
+                         ms_outlook_id: str) -> bool:
+        """Whether a mapped single event belongs to this cycle's window, so its absence means something."""
+        if self.window.full:
+            return True
+        return self.window.contains(self.mapping['single_events_date'].get(ms_outlook_id))
+
+    def ms_outlook_exists(self,
+                          ms_outlook_id: str) -> bool:
+        return recover_date_id(ms_outlook_id) in self.ms_outlook_entry_ids
+
+    def ms_outlook_occurrence_exists(self,
+                                     ms_outlook_master_id: str,
+                                     start_key: str) -> bool | None:
+        """None when the master has no occurrence in the window, so nothing can be decided."""
+        ms_outlook_starts = self.ms_outlook_occurrence_starts.get(recover_date_id(ms_outlook_master_id))
+        if not ms_outlook_starts:
+            return None
+        return start_key in ms_outlook_starts
+
+    # ---- mapping lookups (no lock, no per-call logging) -------------------
+
+    def get_instance_pair(self,
+                          event_id: str) -> tuple[str, str] | None:
+        single_events = self.mapping['single_events']
+        if event_id in single_events:
+            return event_id, single_events[event_id]
+        ms_outlook_id = self.single_by_g_calendar.get(event_id)
+        if ms_outlook_id:
+            return ms_outlook_id, event_id
+        return None
+
+    def get_recurrent_pair(self,
+                           master_id: str) -> tuple[str, str] | None:
+        recurrent_events = self.mapping['recurrent_events']
+        ms_outlook_master_id = master_id if master_id in recurrent_events else self.recurrent_by_g_calendar.get(master_id)
+        if not ms_outlook_master_id:
+            return None
+        return ms_outlook_master_id, recurrent_events[ms_outlook_master_id]['g_calendar_master_id']
+
+    def get_fingerprint(self,
+                        ms_outlook_id: str) -> dict | None:
+        fingerprint = self.mapping['fingerprints'].get(ms_outlook_id)
+        return dict(fingerprint) if fingerprint else None
+
+    # ---- calendar patches --------------------------------------------------
+
+    def add_g_calendar_event(self,
+                             g_calendar_event: dict):
+        if not g_calendar_event or 'id' not in g_calendar_event:
+            return
+        if 'recurrence' in g_calendar_event:
+            self.g_calendar_masters[g_calendar_event['id']] = g_calendar_event
+        else:
+            self.g_calendar_events[g_calendar_event['id']] = g_calendar_event
+
+    def remove_g_calendar_event(self,
+                                g_calendar_id: str):
+        self.g_calendar_events.pop(g_calendar_id,
+                                   None)
+        if self.g_calendar_masters.pop(g_calendar_id,
+                                       None) is not None:
+            # a deleted series takes its expanded instances with it
+            for g_calendar_instance_id in [g_calendar_key for g_calendar_key, g_calendar_event in self.g_calendar_events.items() if g_calendar_event.get('recurringEventId') == g_calendar_id]:
+                del self.g_calendar_events[g_calendar_instance_id]
+
+    def add_ms_outlook_event(self,
+                             ms_outlook_event: dict):
+        if not ms_outlook_event or 'EntryID' not in ms_outlook_event or 'StartUTC' not in ms_outlook_event:
+            return
+        ms_outlook_key = create_date_id(ms_outlook_event['EntryID'],
+                                        ms_outlook_event['StartUTC'])
+        if ms_outlook_event.get('IsRecurring',
+                                False):
+            self.ms_outlook_recurrences[ms_outlook_key] = ms_outlook_event
+            self.ms_outlook_masters[ms_outlook_event['EntryID']] = ms_outlook_event
+        else:
+            self.ms_outlook_instances[ms_outlook_key] = ms_outlook_event
+            self.ms_outlook_single_events[ms_outlook_event['EntryID']] = ms_outlook_event
+        self.ms_outlook_entry_ids.add(ms_outlook_event['EntryID'])
+
+    def remove_ms_outlook_event(self,
+                                ms_outlook_id: str):
+        ms_outlook_entry_id = recover_date_id(ms_outlook_id)
+        for ms_outlook_listing in (self.ms_outlook_instances,
+                                   self.ms_outlook_recurrences):
+            for ms_outlook_key in [ms_outlook_key for ms_outlook_key in ms_outlook_listing if recover_date_id(ms_outlook_key) == ms_outlook_entry_id]:
+                del ms_outlook_listing[ms_outlook_key]
+        self.ms_outlook_single_events.pop(ms_outlook_entry_id,
+                                          None)
+        self.ms_outlook_occurrence_starts.pop(ms_outlook_entry_id,
+                                              None)
+        self.ms_outlook_masters.pop(ms_outlook_entry_id,
+                                    None)
+        self.ms_outlook_exceptions.pop(ms_outlook_entry_id,
+                                       None)
+        self.ms_outlook_entry_ids.discard(ms_outlook_entry_id)
+
+    # ---- mapping writes: persisted through EventMapping, mirrored here ----
+
+    def insert_instance(self,
+                        ms_outlook_id: str,
+                        g_calendar_id: str,
+                        instance_name: str = None,
+                        instance_end=None) -> bool:
+        if not self.event_mapping.insert_instance(ms_outlook_id,
+                                                  g_calendar_id,
+                                                  instance_name,
+                                                  instance_end):
+            return False
+        self.mapping['single_events'][ms_outlook_id] = g_calendar_id
+        self.single_by_g_calendar[g_calendar_id] = ms_outlook_id
+        return True
+
+    def remove_instance(self,
+                        event_id: str) -> bool:
+        event_pair = self.get_instance_pair(event_id)
+        if not event_pair:
+            # not mapped in this snapshot: leave the EventMapping alone
+            return False
+        if not self.event_mapping.remove_instance(event_id):
+            return False
+        ms_outlook_id, g_calendar_id = event_pair
+        for mapping_section in ('single_events',
+                                'single_events_meta',
+                                'single_events_date',
+                                'fingerprints'):
+            self.mapping[mapping_section].pop(ms_outlook_id,
+                                              None)
+        self.single_by_g_calendar.pop(g_calendar_id,
+                                      None)
+        return True
+
+    def set_fingerprint(self,
+                        ms_outlook_id: str,
+                        ms_outlook_fingerprint: str = None,
+                        g_calendar_fingerprint: str = None) -> bool:
+        if not self.event_mapping.set_fingerprint(ms_outlook_id,
+                                                  ms_outlook_fingerprint,
+                                                  g_calendar_fingerprint):
+            return False
+        self.mapping['fingerprints'][ms_outlook_id] = self.event_mapping.get_fingerprint(ms_outlook_id)
+        return True
+
+    def insert_recurrence(self,
+                          ms_outlook_master_id: str,
+                          g_calendar_master_id: str,
+                          instance_name: str = None) -> bool:
+        if not self.event_mapping.insert_recurrence(ms_outlook_master_id,
+                                                    g_calendar_master_id,
+                                                    instance_name):
+            return False
+        self.mapping['recurrent_events'][ms_outlook_master_id] = {
+                'g_calendar_master_id': g_calendar_master_id,
+                'instance_name'       : f'[{instance_name}]',
+                'instances'           : {}}
+        self.recurrent_by_g_calendar[g_calendar_master_id] = ms_outlook_master_id
+        return True
+
+    def insert_occurrence(self,
+                          master_id: str,
+                          ms_outlook_instance_id: str,
+                          g_calendar_instance_id: str) -> bool:
+        master_pair = self.get_recurrent_pair(master_id)
+        if not master_pair or not self.event_mapping.insert_occurrence(master_id,
+                                                                       ms_outlook_instance_id,
+                                                                       g_calendar_instance_id):
+            return False
+        ms_outlook_master_id = master_pair[0]
+        self.mapping['recurrent_events'][ms_outlook_master_id]['instances'][ms_outlook_instance_id] = g_calendar_instance_id
+        self.occurrence_by_g_calendar[g_calendar_instance_id] = (ms_outlook_master_id,
+                                                                 ms_outlook_instance_id)
+        self.occurrence_master[ms_outlook_instance_id] = ms_outlook_master_id
+        return True
+
+    def _drop_recurrence(self,
+                         ms_outlook_master_id: str):
+        master_data = self.mapping['recurrent_events'].pop(ms_outlook_master_id,
+                                                           None)
+        if not master_data:
+            return
+        self.recurrent_by_g_calendar.pop(master_data['g_calendar_master_id'],
+                                         None)
+        for ms_outlook_instance_id, g_calendar_instance_id in master_data['instances'].items():
+            self.occurrence_by_g_calendar.pop(g_calendar_instance_id,
+                                              None)
+            self.occurrence_master.pop(ms_outlook_instance_id,
+                                       None)
+
+    def remove_g_calendar_recurrence(self,
+                                     g_calendar_master_id: str) -> bool:
+        if not self.event_mapping.remove_g_calendar_recurrence(g_calendar_master_id):
+            return False
+        self._drop_recurrence(self.recurrent_by_g_calendar.get(g_calendar_master_id))
+        return True
+
+    def remove_ms_outlook_recurrence(self,
+                                     ms_outlook_master_id: str) -> bool:
+        if not self.event_mapping.remove_ms_outlook_recurrence(ms_outlook_master_id):
+            return False
+        self._drop_recurrence(ms_outlook_master_id)
+        return True
+
+    def remove_generic_occurrence(self,
+                                  generic_instance_id: str,
+                                  keep_master: bool = False) -> bool:
+        if not self.event_mapping.remove_generic_occurrence(generic_instance_id,
+                                                            keep_master):
+            return False
+        if generic_instance_id in self.occurrence_by_g_calendar:
+            ms_outlook_master_id, ms_outlook_instance_id = self.occurrence_by_g_calendar[generic_instance_id]
+        else:
+            ms_outlook_master_id = self.occurrence_master.get(generic_instance_id)
+            ms_outlook_instance_id = generic_instance_id
+        master_data = self.mapping['recurrent_events'].get(ms_outlook_master_id)
+        if not master_data:
+            return True
+        g_calendar_instance_id = master_data['instances'].pop(ms_outlook_instance_id,
+                                                              None)
+        self.occurrence_by_g_calendar.pop(g_calendar_instance_id,
+                                          None)
+        self.occurrence_master.pop(ms_outlook_instance_id,
+                                   None)
+        # EventMapping drops a master once its last occurrence is gone
+        if not master_data['instances'] and not keep_master:
+            self._drop_recurrence(ms_outlook_master_id)
+        return True
+
+    def __repr__(self) -> str:
+        return json.dumps({
+                'ms_outlook_instances'  : len(self.ms_outlook_instances),
+                'ms_outlook_recurrences': len(self.ms_outlook_recurrences),
+                'g_calendar_events'     : len(self.g_calendar_events),
+                'g_calendar_masters'    : len(self.g_calendar_masters),
+                'g_calendar_cancelled'  : len(self.g_calendar_cancelled),
+                'ms_outlook_exceptions' : sum(len(ms_outlook_exceptions) for ms_outlook_exceptions in self.ms_outlook_exceptions.values()),
+                'single_events'         : len(self.mapping.get('single_events',
+                                                               {})),
+                'recurrent_events'      : len(self.mapping.get('recurrent_events',
+                                                               {}))})
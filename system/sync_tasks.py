@@ -1,18 +1,28 @@
-from connector.calendar_instance import CalendarInstance
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import system.constants as constants
 from connector.event_mapping import EventMapping
 from connector.g_calendar import GoogleCalendarConnector
 from connector.ms_outlook import MicrosoftOutlookConnector
-from system.tools import convert_com_object_to_dictionary
-from system.tools import create_date_id
-from system.tools import extract_date_full
-from system.tools import get_master_id
+from system.retry_queue import RetryQueue
+from system.snapshot_cache import SnapshotCache
+from system.sync_executor import SyncExecutor
+from system.sync_journal import SyncJournal
+from system.sync_pacer import sync_pacer
+from system.sync_plan import SyncPlan
+from system.sync_planner import SyncPlanner
+from system.sync_snapshot import SyncSnapshot
+from system.sync_window import SyncWindow
+from system.sync_window import WINDOW_DIRTY
+from system.sync_window import sync_window_schedule
 from system.tools import line_number
 from system.tools import print_box
 from system.tools import print_display
 from system.tools import recover_date_id
-from system.tools import sort_json_list
-from system.tools import strip_symbols
-from system.tools import trim_id
+from system.tools import to_utc_datetime
 
 # FIX: keep a single MicrosoftOutlookConnector alive for the lifetime of the
 # process.  The original code constructed a new instance inside SyncTask.__init__
@@ -25,6 +35,18 @@ from system.tools import trim_id
 # singleton is discarded and a fresh connector is created on next access.
 _ms_outlook_connector: MicrosoftOutlookConnector | None = None
 
+# what a SyncTask is doing, reported through the control socket
+PHASE_PREPARING = 'preparing'
+PHASE_RECONCILING = 'reconciling'
+PHASE_PROBING = 'probing'
+PHASE_READING = 'reading'
+PHASE_PLANNING = 'planning'
+PHASE_EXECUTING = 'executing'
+
+# The last full-window listings, kept for the process lifetime like the
+# connector, so the next full window reads only its edges and what changed.
+_snapshot_cache = SnapshotCache()
+
 
 def _get_ms_outlook_connector() -> MicrosoftOutlookConnector:
     global _ms_outlook_connector
@@ -42,282 +64,138 @@ def _get_ms_outlook_connector() -> MicrosoftOutlookConnector:
 
 
 class SyncTask:
-    def __init__(self):
+    def __init__(self,
+                 stop_event: threading.Event = None,
+                 snapshot_cache: SnapshotCache = None,
+                 cancel_event: threading.Event = None):
         self.event_mapping = EventMapping()
+        # operations of the running cycle, replayed into the mapping if the cycle never finishes
+        self.sync_journal = SyncJournal()
+        # failed operations waiting out their backoff, and quarantined ones
+        self.retry_queue = RetryQueue()
+        self.stop_event = stop_event
+        # set to give up the running cycle only; the next one plans again whatever it left
+        self.cancel_event = cancel_event
         # FIX: reuse the module-level singleton instead of creating a fresh
         # connector (and throwing away the warm cache) on every sync cycle.
         self.ms_outlook_connection = _get_ms_outlook_connector()
         self.g_calendar_connection = GoogleCalendarConnector(event_mapping=self.event_mapping)
+        # Google lane of the executor, kept with the task so each worker keeps its own Google service
+        self.g_calendar_pool = ThreadPoolExecutor(max_workers=max(1,
+                                                                  constants.SYNC_G_CALENDAR_WORKERS),
+                                                  thread_name_prefix='GoogleCalendarLane')
+        # both calendars and the mapping, read once per cycle by take_snapshot()
+        self.snapshot: SyncSnapshot | None = None
+        self.snapshot_cache = snapshot_cache or _snapshot_cache
+        self.phase = PHASE_PREPARING
+        # window and executor statistics of the last cycle; statistics stay None for a skipped or dry run
+        self.last_window: SyncWindow | None = None
+        self.statistics: dict | None = None
+
+    def refresh_connections(self):
+        # a SyncTask kept across cycles: Outlook may have restarted since the last one
+        self.phase = PHASE_PREPARING
+        self.ms_outlook_connection = _get_ms_outlook_connector()
+
+    def close(self):
+        """Let the Google workers go; the task is not used after this."""
+        self.g_calendar_pool.shutdown(wait=False,
+                                      cancel_futures=True)
 
     def clear_map(self):
         self.event_mapping.clear_map()
         print_display(f'{line_number()} Cleared event mapping data...')
 
-    def replicate_deletion_from_ms_outlook_to_g_calendar_single_event(self):
-        print_display(f'{line_number()} [Microsoft Outlook] 0) DELETE TO [Google Calendar] SINGLE')
-        current_ms_outlook_events = self.ms_outlook_connection.get_all_instances_ms_outlook()
-        ms_outlook_mapped_single_events = set(self.event_mapping.get_all_instances()['single_events'].keys()) - {recover_date_id(ms_outlook_key) for ms_outlook_key in current_ms_outlook_events.keys()}
-        for ms_outlook_id in ms_outlook_mapped_single_events:
-            event_pair = self.event_mapping.get_instance_pair(ms_outlook_id)
-            print_display(f'{line_number()} [Microsoft Outlook] 1) DELETE TO [Google Calendar] SINGLE [{ms_outlook_id}] Event Pair: [{event_pair}]')
-            if not event_pair:
-                continue
-            google_event_id = event_pair[1]
-            google_event = self.g_calendar_connection.get_single_instance_g_calendar(google_event_id)
-            if not google_event:
-                print_display(f'{line_number()} [Microsoft Outlook] 2) DELETE TO [Google Calendar] SINGLE [{trim_id(google_event_id)}] <= CLEANING MAP [{ms_outlook_id}]')
-                self.event_mapping.remove_instance(ms_outlook_id)
-                continue
-            if 'recurrence' not in google_event and 'recurringEventId' not in google_event:
-                try:
-                    print_display(f'{line_number()} [Microsoft Outlook] 3) DELETE TO [Google Calendar] SINGLE [{trim_id(google_event_id)}] <= DELETE [{ms_outlook_id}]')
-                    self.g_calendar_connection.g_calendar_delete_instance(google_event_id)
-                    self.event_mapping.remove_instance(ms_outlook_id)
-                except Exception as exception:
-                    print_display(f'{line_number()} [Microsoft Outlook] 4) DELETE TO [Google Calendar] SINGLE - ERROR: [{exception}]')
-
-    def replicate_deletion_from_g_calendar_to_ms_outlook_single_event(self):
-        print_display(f'{line_number()} Checking for deleted single events in [Google Calendar]...')
-        current_g_calendar_events = self.g_calendar_connection.get_all_sub_instances_g_calendar()
-        all_mappings = self.event_mapping.get_all_instances()
-        mapped_g_calendar_ids = set(all_mappings['single_events'].values())
-        mapped_g_calendar_ids.discard(None)
-        g_calendar_mapped_single_events = mapped_g_calendar_ids - set(current_g_calendar_events.keys())
-        for g_calendar_id in g_calendar_mapped_single_events:
-            event_pair = self.event_mapping.get_instance_pair(g_calendar_id)
-            if event_pair:
-                ms_outlook_event_id = event_pair[0]
-                ms_outlook_event = self.ms_outlook_connection.get_item_ms_outlook(ms_outlook_event_id)
-                if not ms_outlook_event:
-                    print_display(f'{line_number()} [Microsoft Outlook] event [{trim_id(ms_outlook_event_id)}] already deleted, cleaning mapping')
-                    self.event_mapping.remove_instance(g_calendar_id)
-                    continue
-                if not ms_outlook_event.get('IsRecurring',
-                                            False):
-                    print_display(f'{line_number()} Deleting [Microsoft Outlook] single event [{trim_id(ms_outlook_event_id)}] ([Google Calendar] source deleted)')
-                    try:
-                        print_display(f'{line_number()} ms_outlook_delete_event [{trim_id(ms_outlook_event_id)}]')
-                        self.ms_outlook_connection.delete_instance_ms_outlook(ms_outlook_event_id)
-                        print_display(f'{line_number()} remove_single_event [{trim_id(g_calendar_id)}]')
-                        self.event_mapping.remove_instance(g_calendar_id)
-                    except Exception as exception:
-                        print_display(f'{line_number()} Error deleting [Microsoft Outlook] event: [{exception}]')
-
-    def replicate_deletion_of_single_event_from_g_calendar_to_ms_outlook_recurrent_event(self):
-        print_display(f'{line_number()} Checking for deleted recurrent events in [Google Calendar]...')
-        master_pair = self.event_mapping.get_all_instances()
-        for ms_outlook_id in master_pair['recurrent_events']:
-            for instance_event in master_pair['recurrent_events'][ms_outlook_id]['instances']:
-                g_calendar_id = master_pair['recurrent_events'][ms_outlook_id]['instances'][instance_event]
-                g_calendar_instance = self.g_calendar_connection.get_single_instance_g_calendar(g_calendar_id)
-                if g_calendar_instance['status'] == 'cancelled':
-                    g_calendar_date_item = extract_date_full(g_calendar_id)
-                    print_display(f'{line_number()} Detected deleted [Google Calendar] instance [{trim_id(g_calendar_id)}] with date ID [{g_calendar_date_item}]')
-                    try:
-                        print_display(f'{line_number()} Deleting [Microsoft Outlook] instance [{trim_id(ms_outlook_id)}] ([Google Calendar] instance [{trim_id(g_calendar_id)}] was deleted)')
-                        g_calendar_id_master = get_master_id(g_calendar_id)
-                        ms_outlook_delete = self.ms_outlook_connection.delete_occurrence_by_g_calendar_master_and_start(g_calendar_id_master,
-                                                                                                                        g_calendar_date_item)
-                        if ms_outlook_delete:
-                            print_display(f'{line_number()} Successfully deleted [Microsoft Outlook] instance')
-                            self.event_mapping.remove_generic_occurrence(g_calendar_id)
-                            print_display(f'{line_number()} Deleted instance in mapping...')
-                    except ValueError as value_error:
-                        print_display(f'{line_number()} Error deleting [Microsoft Outlook] instance: [{value_error}]')
-
-    def replicate_deletion_of_single_event_from_ms_outlook_to_g_calendar_recurrent_event(self):
-        print_display(f'{line_number()} [Microsoft Outlook] 1) DELETE TO [Google Calendar] SINGLE 2 RECURRENT')
-        master_pair = self.event_mapping.get_all_instances()
-        for ms_outlook_id in master_pair['recurrent_events']:
-            for instance_event in master_pair['recurrent_events'][ms_outlook_id]['instances']:
-                g_calendar_id = master_pair['recurrent_events'][ms_outlook_id]['instances'][instance_event]
-                g_calendar_date_item = extract_date_full(g_calendar_id)
-                print_display(f'{line_number()} [Microsoft Outlook] 2) DELETE TO [Google Calendar] SINGLE 2 RECURRENT [{trim_id(g_calendar_id)}]/[{g_calendar_date_item}] <= DELETE [{ms_outlook_id}]')
-                try:
-                    g_calendar_id_master = get_master_id(g_calendar_id)
-                    result = self.ms_outlook_connection.get_occurrence_by_g_calendar_master_and_start(g_calendar_id_master,
-                                                                                                      g_calendar_date_item)
-                    if not result:
-                        print_display(f'{line_number()} [Microsoft Outlook] 3) DELETE TO [Google Calendar] SINGLE 2 RECURRENT [{trim_id(g_calendar_id)}]/[{g_calendar_date_item}] <= DELETE [{ms_outlook_id}]')
-                        g_calendar_delete = self.g_calendar_connection.g_calendar_delete_instance(g_calendar_id)
-                        if g_calendar_delete != 'Failed':
-                            print_display(f'{line_number()} [Microsoft Outlook] 4) DELETE TO [Google Calendar] SINGLE 2 RECURRENT [{trim_id(g_calendar_id)}]/[{g_calendar_date_item}] <= DELETED! [{ms_outlook_id}]')
-                            self.event_mapping.remove_generic_occurrence(g_calendar_id)
-                            print_display(f'{line_number()} [Microsoft Outlook] 5) DELETE TO [Google Calendar] SINGLE 2 RECURRENT [{trim_id(g_calendar_id)}]/[{g_calendar_date_item}] <= MAP DELETED! [{ms_outlook_id}]')
-                except ValueError as value_error:
-                    print_display(f'{line_number()} [Microsoft Outlook] 6) DELETE TO [Google Calendar] SINGLE 2 RECURRENT - ERROR: [{value_error}]')
-
-    def replicate_deletion_from_ms_outlook_to_g_calendar_recurrent_event(self):
-        print_display(f'{line_number()} [Microsoft Outlook] 1) DELETE TO [Google Calendar] RECURRENT')
-        recurrent_events = self.event_mapping.get_all_instances()['recurrent_events']
-        for ms_outlook_master_id, master_data in recurrent_events.items():
-            g_calendar_id = master_data['g_calendar_master_id']
-            g_calendar_master_id = get_master_id(g_calendar_id)
-            g_calendar_instance_exists = self.g_calendar_connection.get_single_instance_g_calendar(g_calendar_id)
-            ms_outlook_instance_exists = self.ms_outlook_connection.get_master_by_g_calendar_id(g_calendar_master_id)
-            ms_outlook_master_id_item = convert_com_object_to_dictionary(ms_outlook_instance_exists)
-            if not ms_outlook_master_id_item and g_calendar_instance_exists['status'] != 'cancelled':
-                self.g_calendar_connection.g_calendar_delete_instance(g_calendar_id)
-                print_display(f'{line_number()} [Microsoft Outlook] 2) DELETE TO [Google Calendar] RECURRENT [{trim_id(g_calendar_id)}] <= DELETED!')
-                self.event_mapping.remove_g_calendar_recurrence(g_calendar_master_id)
-                print_display(f'{line_number()} [Microsoft Outlook] 3) DELETE TO [Google Calendar] RECURRENT [{trim_id(g_calendar_id)}] <= MAP DELETED!')
-
-    def replicate_deletion_from_g_calendar_to_ms_outlook_recurrent_event(self):
-        print_display(f'{line_number()} Checking for deleted recurrent event in [Google Calendar]...')
-        recurrent_events = self.event_mapping.get_all_instances()['recurrent_events']
-        for ms_outlook_master_id, master_data in recurrent_events.items():
-            g_calendar_id = master_data['g_calendar_master_id']
-            g_calendar_master_id = get_master_id(g_calendar_id)
-            g_calendar_instance_exists = self.g_calendar_connection.get_single_instance_g_calendar(g_calendar_id)
-            ms_outlook_instance_exists = self.ms_outlook_connection.get_master_by_g_calendar_id(g_calendar_master_id)
-            ms_outlook_master_id_item = convert_com_object_to_dictionary(ms_outlook_instance_exists)
-            if 'EntryID' in ms_outlook_master_id_item:
-                ms_outlook_master_index = ms_outlook_master_id_item['EntryID']
-                g_calendar_instance_id = trim_id(g_calendar_instance_exists['id'])
-                print_display(f'{line_number()} Checking master event [Microsoft Outlook] [{ms_outlook_master_index}] <=> [Google Calendar] [{trim_id(g_calendar_master_id)}]')
-                print_display(f'{line_number()} Checking master event [Microsoft Outlook] [{ms_outlook_master_index}] <=> [Google Calendar] [{g_calendar_instance_id}]')
-                if g_calendar_instance_exists['status'] == 'cancelled':
-                    self.ms_outlook_connection.delete_instance_ms_outlook(ms_outlook_master_index)
-                    print_display(f'{line_number()} Successfully deleted [Google Calendar] instance')
-                    self.event_mapping.remove_ms_outlook_recurrence(ms_outlook_master_index)
-                    print_display(f'{line_number()} Deleted instance in mapping...')
-
-    def copy_ms_outlook_single_event_to_g_calendar(self):
-        print_display(f'{line_number()} Checking for new single events in [Microsoft Outlook]...')
-        print_display(f'{line_number()} [Microsoft Outlook] 1) COPY TO [Google Calendar] SINGLE')
-        ms_outlook_events = self.ms_outlook_connection.get_all_instances_ms_outlook()
-        for ms_outlook_current_id, ms_outlook_current_event in ms_outlook_events.items():
-            if not ms_outlook_current_event.get('IsRecurring',
-                                                False):
-                single_pair = self.event_mapping.get_instance_pair(recover_date_id(ms_outlook_current_id))
-                if single_pair:
-                    continue
-                calendar_event = CalendarInstance()
-                calendar_event.import_ms_outlook(ms_outlook_current_event)
-                g_calendar_exported_event = calendar_event.export_g_calendar()
-                print_display(f'{line_number()} [Microsoft Outlook] 2) COPY TO [Google Calendar] SINGLE [{trim_id(ms_outlook_current_id)}]')
-                g_calendar_inserted_appointment = self.g_calendar_connection.g_calendar_insert_instance(g_calendar_exported_event)
-                if not g_calendar_inserted_appointment:
-                    print_display(f'{line_number()} [Microsoft Outlook] 3) COPY TO [Google Calendar] SINGLE - ERROR: [NO APPOINTMENT CREATED]')
-                    continue
-                g_calendar_master_id = g_calendar_inserted_appointment.get('id')
-                print_display(f'{line_number()} [Microsoft Outlook] 4) COPY TO [Google Calendar] SINGLE [{trim_id(ms_outlook_current_id)}] => [{trim_id(g_calendar_master_id)}]')
-                self.event_mapping.insert_instance(recover_date_id(ms_outlook_current_id),
-                                                   g_calendar_master_id,
-                                                   g_calendar_exported_event['summary'])
-
-    def copy_g_calendar_single_event_to_ms_outlook(self):
-        print_display(f'{line_number()} Checking for new single events in [Google Calendar]...')
-        g_calendar_all_events = self.g_calendar_connection.get_all_sub_instances_g_calendar()
-        for g_calendar_event_id, g_calendar_event_item in g_calendar_all_events.items():
-            recurrence_one = 'recurrence' in g_calendar_event_item
-            recurrence_two = 'recurringEventId' in g_calendar_event_item
-            if not recurrence_one and not recurrence_two:
-                single_pair = self.event_mapping.get_instance_pair(g_calendar_event_id)
-                if not single_pair:
-                    calendar_event = CalendarInstance()
-                    calendar_event.import_g_calendar(g_calendar_event_item)
-                    ms_outlook_exported_event = calendar_event.export_ms_outlook()
-                    print_display(f'{line_number()} [Microsoft Outlook] INSERTING EVENT: [{trim_id(g_calendar_event_id)}]')
-                    ms_outlook_inserted_appointment = self.ms_outlook_connection.insert_instance_ms_outlook(ms_outlook_exported_event)
-                    if ms_outlook_inserted_appointment:
-                        ms_outlook_event_id = ms_outlook_inserted_appointment.EntryID
-                        print_display(f'{line_number()} [Microsoft Outlook] ADDING EVENT: [{trim_id(g_calendar_event_id)}] => [{trim_id(ms_outlook_event_id)}]')
-                        self.event_mapping.insert_instance(ms_outlook_event_id,
-                                                           g_calendar_event_id,
-                                                           ms_outlook_exported_event['Subject'])
-
-    def copy_ms_outlook_recurrent_event_to_g_calendar(self):
-        print_display(f'{line_number()} [Microsoft Outlook] 1) COPY TO [Google Calendar] RECURRENT')
-        ms_outlook_events = self.ms_outlook_connection.get_all_recurrences_ms_outlook()
-        for ms_outlook_current_id, ms_outlook_current_event in ms_outlook_events.items():
-            if not ms_outlook_current_event.get('IsRecurring',
-                                                False):
-                continue
-            master_pair = self.event_mapping.get_recurrent_pair(recover_date_id(ms_outlook_current_id))
-            print_display(f'{line_number()} [Microsoft Outlook] 2) COPY TO [Google Calendar] RECURRENT [{trim_id(ms_outlook_current_id)}] => [{master_pair}]')
-            if not master_pair:
-                calendar_event = CalendarInstance()
-                calendar_event.import_ms_outlook(ms_outlook_current_event)
-                g_calendar_exported_event = calendar_event.export_g_calendar()
-                g_calendar_inserted_appointment = self.g_calendar_connection.g_calendar_insert_instance(g_calendar_exported_event)
-                if not g_calendar_inserted_appointment:
-                    print_display(f'{line_number()} [Microsoft Outlook] 3) COPY TO [Google Calendar] RECURRENT - ERROR: [NO APPOINTMENT CREATED]')
-                    continue
-
-                g_calendar_id = g_calendar_inserted_appointment.get('id')
-                g_calendar_master_id = get_master_id(g_calendar_id)
-                print_display(f'{line_number()} [Microsoft Outlook] 4) COPY TO [Google Calendar] RECURRENT [{trim_id(ms_outlook_current_id)}] => [{trim_id(g_calendar_id)}]')
-                self.event_mapping.insert_recurrence(recover_date_id(ms_outlook_current_id),
-                                                     g_calendar_id,
-                                                     g_calendar_exported_event['summary'])
-                ms_outlook_instances = self.ms_outlook_connection.get_recurrence_instances(ms_outlook_current_id)
-                g_calendar_instances = self.g_calendar_connection.get_all_single_instances_inside_recurrence_g_calendar(g_calendar_id).get('items',
-                                                                                                                                           [])
-                self.ms_outlook_connection.set_recurrence_id(recover_date_id(ms_outlook_current_id),
-                                                             g_calendar_master_id)
-                for ms_outlook_instance, g_calendar_instance in zip(ms_outlook_instances,
-                                                                    sort_json_list(g_calendar_instances,
-                                                                                   'start.dateTime')):
-                    ms_outlook_instance_string = trim_id(ms_outlook_instance['EntryID'])
-                    g_calendar_instance_string = trim_id(g_calendar_instance['id'])
-                    print_display(f'{line_number()} [Microsoft Outlook] 5) COPY TO [Google Calendar] RECURRENT [{trim_id(ms_outlook_current_id)}] => [{trim_id(g_calendar_id)}] / [{ms_outlook_instance_string}] <=> [{g_calendar_instance_string}]')
-                    ms_outlook_instance_string = create_date_id(ms_outlook_instance['EntryID'],
-                                                                ms_outlook_instance['StartUTC'])
-                    print_display(f'{line_number()} [Microsoft Outlook] 6) COPY TO [Google Calendar] RECURRENT - CREATE ID: [{ms_outlook_instance_string}]')
-                    # TODO: OCCURRENCE IS RECURRENCE?
-                    self.event_mapping.insert_occurrence(recover_date_id(ms_outlook_current_id),
-                                                         ms_outlook_instance_string,
-                                                         g_calendar_instance['id'])
-
-    def copy_g_calendar_recurrent_event_to_ms_outlook(self):
-        print_display(f'{line_number()} Checking for new recurrent events in [Google Calendar]...')
-        g_calendar_events_local = self.g_calendar_connection.get_all_instances_g_calendar()
-        g_calendar_total_items = g_calendar_events_local.items()
-        g_calendar_total_items_progress = 0
-        g_calendar_total_items_count = len(g_calendar_total_items)
-        for g_calendar_event_id, g_calendar_event_data in g_calendar_total_items:
-            g_calendar_total_items_progress += 1
-            if 'recurringEventId' not in g_calendar_event_data:
-                continue
-            g_calendar_master_id = get_master_id(g_calendar_event_id)
-            master_pair = self.event_mapping.get_recurrent_pair(g_calendar_master_id)
-
-            # master_pair = self.event_mapping.get_recurrent_pair(g_calendar_event_id)
-
-            if not master_pair:
-                calendar_event = CalendarInstance()
-                calendar_event.import_g_calendar(g_calendar_event_data)
-                ms_outlook_exported_event = calendar_event.export_ms_outlook()
-                ms_outlook_inserted_appointment = self.ms_outlook_connection.insert_instance_ms_outlook(ms_outlook_exported_event)
-                if ms_outlook_inserted_appointment:
-                    ms_outlook_entry_id = ms_outlook_inserted_appointment.EntryID
-                    print_display(f'{line_number()} 01-({g_calendar_total_items_progress}/{g_calendar_total_items_count}) [] ADDING RECURRENCE MASTER: [{trim_id(g_calendar_event_id)}] => [{trim_id(ms_outlook_entry_id)}]')
-                    self.event_mapping.insert_recurrence(ms_outlook_entry_id,
-                                                         g_calendar_event_id,
-                                                         ms_outlook_exported_event['Subject'])
-                    g_calendar_instances = self.g_calendar_connection.get_all_single_instances_inside_recurrence_g_calendar(g_calendar_event_id).get('items',
-                                                                                                                                                     [])
-                    ms_outlook_instances = self.ms_outlook_connection.get_recurrence_instances(ms_outlook_entry_id)
-                    self.ms_outlook_connection.set_recurrence_id(ms_outlook_entry_id,
-                                                                 g_calendar_event_id)
-                    ms_outlook_total_items_progress = 0
-                    ms_outlook_total_items_count = len(ms_outlook_instances)
-                    for g_calendar_instance, ms_outlook_instance in zip(sort_json_list(g_calendar_instances,
-                                                                                       'start.dateTime'),
-                                                                        ms_outlook_instances):
-                        ms_outlook_total_items_progress += 1
-                        g_calendar_instance_string = trim_id(g_calendar_instance['id'])
-                        ms_outlook_instance_string = trim_id(ms_outlook_instance['EntryID'])
-                        print_display(f'{line_number()} 02-({ms_outlook_total_items_progress}/{ms_outlook_total_items_count}) [] ADDING RECURRENCE INSTANCE: [{trim_id(ms_outlook_entry_id)}] [Google Calendar] [{g_calendar_instance_string}] <=> [Microsoft Outlook] [{ms_outlook_instance_string}]')
-                        ms_outlook_start = strip_symbols(ms_outlook_instance['StartUTC'])
-                        ms_outlook_end = strip_symbols(ms_outlook_instance['EndUTC'])
-                        ms_outlook_entry_id_string = ms_outlook_instance['EntryID']
-                        self.event_mapping.insert_occurrence(ms_outlook_entry_id,
-                                                             f'{ms_outlook_entry_id_string}{ms_outlook_start}{ms_outlook_end}',
-                                                             g_calendar_instance['id'])
-
-    def sync_task(self):
+    def take_snapshot(self,
+                      sync_window: SyncWindow = None) -> SyncSnapshot:
+        self.snapshot = SyncSnapshot(self.ms_outlook_connection,
+                                     self.g_calendar_connection,
+                                     self.event_mapping,
+                                     sync_window,
+                                     self.snapshot_cache).capture()
+        return self.snapshot
+
+    def plan_sync(self,
+                  ms_outlook_to_g_calendar: bool,
+                  g_calendar_to_ms_outlook: bool) -> SyncPlan:
+        # pure in-memory diff of the snapshot: no remote calls
+        sync_plan = SyncPlanner(self.snapshot,
+                                self.retry_queue).build(ms_outlook_to_g_calendar,
+                                                        g_calendar_to_ms_outlook)
+        print_box(f'{line_number()} {sync_plan.report(detailed=constants.DEBUG_MODE)}')
+        return sync_plan
+
+    def execute_plan(self,
+                     sync_plan: SyncPlan) -> dict:
+        # the budget starts with the first operation, so a slow snapshot cannot defer the whole plan
+        deadline = time.monotonic() + constants.SYNC_CYCLE_BUDGET if constants.SYNC_CYCLE_BUDGET else None
+        self.sync_journal.open_cycle(sync_plan)
+        statistics = SyncExecutor(self.snapshot,
+                                  self.ms_outlook_connection,
+                                  self.g_calendar_connection,
+                                  sync_journal=self.sync_journal,
+                                  stop_event=self.stop_event,
+                                  retry_queue=self.retry_queue,
+                                  deadline=deadline,
+                                  cancel_event=self.cancel_event,
+                                  g_calendar_pool=self.g_calendar_pool).execute(sync_plan)
+        self.retry_queue.save()
+        # only reached once the mapping is saved; a crash before this leaves the cycle to reconcile()
+        self.sync_journal.close_cycle()
+        return statistics
+
+    def cancelled(self) -> bool:
+        if self.cancel_event is None or not self.cancel_event.is_set():
+            return False
+        print_box(f'{line_number()} SYNC CYCLE CANCELLED during [{self.phase}]')
+        return True
+
+    def dirty_window(self,
+                     dirty_batch: dict) -> SyncWindow | None:
+        """The span of the items the Outlook event sink reported, and of where the mapping last
+        saw them; the full window for removals and series, None when all of it is outside."""
+        full_window = SyncWindow()
+        dirty_items = dirty_batch['items']
+        if dirty_batch['removed'] or any(item['recurring'] or item['start'] is None for item in dirty_items.values()):
+            return full_window
+        dates = list()
+        for item in dirty_items.values():
+            dates.extend([item['start'],
+                          item['end'] or item['start']])
+        # a moved item: its old position is read too, so the copy left there is found
+        for ms_outlook_id, end_value in self.event_mapping.get_all_instances()['single_events_date'].items():
+            if recover_date_id(ms_outlook_id) in dirty_items:
+                dates.append(to_utc_datetime(end_value))
+        dates = [date for date in dates if date is not None]
+        begin = max(min(dates) - timedelta(minutes=1),
+                    full_window.begin)
+        end = min(max(dates) + timedelta(minutes=1),
+                  full_window.end)
+        if begin > end:
+            return None
+        return SyncWindow.between(WINDOW_DIRTY,
+                                  begin,
+                                  end)
+
+    def sync_dirty(self,
+                   dirty_batch: dict,
+                   dry_run: bool = constants.SYNC_DRY_RUN) -> SyncPlan:
+        """Targeted cycle over the Outlook items the event sink reported changed."""
+        sync_window = self.dirty_window(dirty_batch)
+        if sync_window is None:
+            print_box(f'{line_number()} [DIRTY QUEUE] changed items are outside the sync window: nothing to do')
+            return SyncPlan()
+        # the cached full listing may predate the change that was reported: read Outlook again
+        self.ms_outlook_connection.invalidate_cache()
+        # the events already say something changed: no probe
+        return self.sync_task(dry_run,
+                              sync_window,
+                              probe=False)
+
+    def sync_task(self,
+                  dry_run: bool = constants.SYNC_DRY_RUN,
+                  sync_window: SyncWindow = None,
+                  probe: bool = True) -> SyncPlan:
         ms_outlook_to_g_calendar = 'Microsoft Outlook to Google Calendar'
         g_calendar_to_ms_outlook = 'Google Calendar to Microsoft Outlook'
 
@@ -336,22 +214,56 @@ class SyncTask:
         elif g_calendar_to_ms_outlook in ways:
             print_box(f'{line_number()} Starting synchronization task: [Google Calendar] => [Microsoft Outlook]')
 
-        if ms_outlook_to_g_calendar in ways:
-            # Microsoft Outlook to Google Calendar
-            self.replicate_deletion_from_ms_outlook_to_g_calendar_single_event()
-            self.replicate_deletion_of_single_event_from_ms_outlook_to_g_calendar_recurrent_event()
-            self.replicate_deletion_from_ms_outlook_to_g_calendar_recurrent_event()
-            self.copy_ms_outlook_single_event_to_g_calendar()
-            self.copy_ms_outlook_recurrent_event_to_g_calendar()
-        if g_calendar_to_ms_outlook in ways:
-            # Google Calendar to Microsoft Outlook
-            self.replicate_deletion_from_g_calendar_to_ms_outlook_single_event()
-            self.replicate_deletion_of_single_event_from_g_calendar_to_ms_outlook_recurrent_event()
-            self.replicate_deletion_from_g_calendar_to_ms_outlook_recurrent_event()
-            self.copy_g_calendar_single_event_to_ms_outlook()
-            self.copy_g_calendar_recurrent_event_to_ms_outlook()
-
-        # TODO: IF EVENT INFORMATION CHANGES, SYNC DATA (HOW TO KNOW WHO CHANGED?) HASH1<=>HASH1 / HASH1<=>HASH_C / HASH_C<=>HASH1
+        self.statistics = None
+        sync_pacer.begin_cycle()
+        # Map whatever an interrupted cycle wrote but never saved, before planning again
+        self.phase = PHASE_RECONCILING
+        self.sync_journal.reconcile(self.event_mapping)
+
+        # Drop mapping entries that left the sync window (at most once a day)
+        self.event_mapping.compact_map()
+
+        # Read both calendars and the mapping once, over the widest tier that is due; the planner works off this
+        sync_window = sync_window or sync_window_schedule.next_window()
+        print_box(f'{line_number()} SYNC WINDOW: [{sync_window}]')
+        self.last_window = sync_window
+
+        # A cheap look at both calendars first: a narrow tier with nothing new to read is skipped
+        self.phase = PHASE_PROBING
+        changed = sync_pacer.probe(sync_window,
+                                   self.ms_outlook_connection,
+                                   self.g_calendar_connection,
+                                   self.retry_queue) if probe and constants.SYNC_PROBE_ENABLED else True
+        if not changed and not sync_window.full:
+            sync_pacer.record_cycle(0)
+            sync_window_schedule.mark_done(sync_window)
+            sync_pacer.report_skipped(sync_window)
+            return SyncPlan()
+        if self.cancelled():
+            return SyncPlan()
+        self.phase = PHASE_READING
+        self.take_snapshot(sync_window)
+
+        # Plan every insert, delete, update and mapping repair first, then apply it
+        self.phase = PHASE_PLANNING
+        sync_plan = self.plan_sync(ms_outlook_to_g_calendar in ways,
+                                   g_calendar_to_ms_outlook in ways)
+        if dry_run:
+            print_box(f'{line_number()} DRY RUN: nothing was written')
+            return sync_plan
+        if self.cancelled():
+            # nothing was started; the tier stays due
+            return SyncPlan()
+        self.phase = PHASE_EXECUTING
+        statistics = self.execute_plan(sync_plan)
+        self.statistics = statistics
+        finished = not statistics['stopped'] and not statistics['deferred']
+        if finished:
+            # an unfinished cycle leaves its tier due, so the next wake-up runs it again
+            sync_window_schedule.mark_done(sync_window)
+        sync_pacer.record_cycle(len(sync_plan),
+                                finished)
+        return sync_plan
 
 
 if __name__ == '__main__':
@@ -0,0 +1,146 @@
+import time
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from threading import Lock
+
+import system.constants as constants
+
+from system.tools import to_utc_datetime
+
+# tiers, narrowest first
+TIER_HOT = 'hot'
+TIER_NEAR = 'near'
+TIER_FULL = 'full'
+# not a tier: the span of the Outlook items the event sink reported changed
+WINDOW_DIRTY = 'dirty'
+
+
+def _tiers() -> list[tuple[str, float, float, int]]:
+    """(name, days past, days next, interval in seconds), read from constants on every call
+    so the settings screen takes effect without a restart."""
+    if not constants.SYNC_TIERS_ENABLED:
+        return [(TIER_FULL, constants.DAY_PAST, constants.DAY_NEXT, constants.INTERVAL_SYNC_JOB)]
+    return [(TIER_HOT, 0, constants.SYNC_TIER_HOT_HOURS / 24, constants.SYNC_TIER_HOT_INTERVAL),
+            (TIER_NEAR, 0, constants.SYNC_TIER_NEAR_DAYS, constants.SYNC_TIER_NEAR_INTERVAL),
+            (TIER_FULL, constants.DAY_PAST, constants.DAY_NEXT, constants.SYNC_TIER_FULL_INTERVAL)]
+
+
+def covered_tiers(name: str) -> list[str]:
+    """The tier and every narrower one: a cycle over a wider tier covers them all."""
+    tier_names = [tier[0] for tier in _tiers()]
+    if name not in tier_names:
+        return []
+    return tier_names[:tier_names.index(name) + 1]
+
+
+class SyncWindow:
+    """Time range one sync cycle reads from both calendars.
+
+    The bounds are fixed when the window is built, so the Outlook restriction,
+    the Google timeMin/timeMax and the planner all agree on them.  Only the
+    full window lets the planner read absence as deletion for everything in
+    the mapping; a narrower tier only for what the mapping dates inside it.
+    """
+
+    def __init__(self,
+                 name: str = TIER_FULL,
+                 days_past: float = None,
+                 days_next: float = None):
+        time_now = datetime.now(timezone.utc)
+        self.name = name
+        self.begin = time_now - timedelta(days=constants.DAY_PAST if days_past is None else days_past)
+        self.end = time_now + timedelta(days=constants.DAY_NEXT if days_next is None else days_next)
+
+    @classmethod
+    def for_tier(cls,
+                 name: str) -> 'SyncWindow':
+        for tier_name, days_past, days_next, _ in _tiers():
+            if tier_name == name:
+                return cls(tier_name,
+                           days_past,
+                           days_next)
+        return cls()
+
+    @classmethod
+    def between(cls,
+                name: str,
+                begin: datetime,
+                end: datetime) -> 'SyncWindow':
+        sync_window = cls(name)
+        sync_window.begin = begin
+        sync_window.end = end
+        return sync_window
+
+    @property
+    def full(self) -> bool:
+        return self.name == TIER_FULL
+
+    def time_min(self) -> str:
+        return self.begin.isoformat().replace('+00:00',
+                                              'Z')
+
+    def time_max(self) -> str:
+        return self.end.isoformat().replace('+00:00',
+                                            'Z')
+
+    def ms_outlook_begin(self) -> datetime:
+        # Outlook restrictions compare local wall-clock times
+        return self.begin.astimezone().replace(tzinfo=None)
+
+    def ms_outlook_end(self) -> datetime:
+        return self.end.astimezone().replace(tzinfo=None)
+
+    def contains(self,
+                 date_time_value) -> bool:
+        date_time = to_utc_datetime(date_time_value)
+        if date_time is None:
+            return False
+        return self.begin <= date_time <= self.end
+
+    def overlaps(self,
+                 start_value,
+                 end_value) -> bool:
+        start = to_utc_datetime(start_value)
+        end = to_utc_datetime(end_value) or start
+        if start is None:
+            return False
+        return start <= self.end and end >= self.begin
+
+    def __repr__(self) -> str:
+        return f'{self.name.upper()} [{self.time_min()}] - [{self.time_max()}]'
+
+
+class SyncWindowSchedule:
+    """When each tier last ran; a wider tier covers the narrower ones, so running it resets them too."""
+
+    def __init__(self):
+        self._lock = Lock()
+        # tier name => time.monotonic() of its last finished cycle
+        self._last_run: dict[str, float] = dict()
+
+    def interval(self) -> int:
+        """How often the sync job has to wake up: the shortest tier interval."""
+        return min(tier[3] for tier in _tiers())
+
+    def next_window(self) -> SyncWindow:
+        """The widest tier that is due, or the narrowest one when none is."""
+        time_now = time.monotonic()
+        tiers = _tiers()
+        with self._lock:
+            for name, _, _, interval in reversed(tiers):
+                last_run = self._last_run.get(name)
+                if last_run is None or time_now - last_run >= interval:
+                    return SyncWindow.for_tier(name)
+        return SyncWindow.for_tier(tiers[0][0])
+
+    def mark_done(self,
+                  sync_window: SyncWindow):
+        time_now = time.monotonic()
+        with self._lock:
+            for name in covered_tiers(sync_window.name):
+                self._last_run[name] = time_now
+
+
+# one schedule per process, like the Outlook connector in sync_tasks
+sync_window_schedule = SyncWindowSchedule()
@@ -18,9 +18,9 @@ from platform import system
 from sys import platform as sys_platform
 
 import pywintypes
-from dateutil import parser
 
 import system.constants as constants
+from system.recurrence_rule import RecurrenceRule
 
 _gui_log_queue = None
 _OUTLOOK_MAX_DATE = datetime(2080,
@@ -85,16 +85,8 @@ def release_com_object_memory(com_object_for_deletion):
 
 
 def parse_rule(rule: str):
-    if ':' in rule:
-        rule = rule.split(':',
-                          1)[1]
-    rule_parts = rule.split(';')
-    rule = {rule_part.split('=')[0].strip().lower(): rule_part.split('=')[1].strip() for rule_part in rule_parts if '=' in rule_part}
-    if 'freq' in rule:
-        if rule['freq'] == 'DAILY':
-            if 'interval' not in rule:
-                rule['interval'] = '1'
-    return dict(sorted(rule.items()))
+    parsed_rule = RecurrenceRule.parse(rule)
+    return parsed_rule.to_dict() if parsed_rule else dict()
 
 
 def compare_rule(rule_one: str,
@@ -105,15 +97,10 @@ def compare_rule(rule_one: str,
     if isinstance(rule_two,
                   list):
         rule_two = rule_two[0]
-    print_display(f'{line_number()} [{rule_one}]')
-    print_display(f'{line_number()} [{rule_two}]')
     if not rule_one and not rule_two:
         return True
-    rule_one_string = parse_rule(rule_one)
-    rule_two_string = parse_rule(rule_two)
-    print_display(f'{line_number()} [{rule_one_string}]')
-    print_display(f'{line_number()} [{rule_two_string}]')
-    return rule_one_string == rule_two_string
+    # parsed once and memoized, then compared on the canonical form
+    return RecurrenceRule.parse(rule_one) == RecurrenceRule.parse(rule_two)
 
 
 def get_nested_value(data,
@@ -359,7 +346,7 @@ def print_display(*arguments):
     display_text = display_text.rstrip()
     if display_text == constants.DEFAULT_L:
         return
-    if constants.RUN_GUI:
+    if constants.RUN_GUI or constants.RUN_HEADLESS:
         display_text = ' '.join(map(str,
                                     arguments)).rstrip()
         logger = logging.getLogger('CalendarSync Logger')
@@ -387,6 +374,11 @@ def utc_to_outlook_local(dt_utc):
     return dt_local.replace(tzinfo=None)
 
 
+def outlook_local_to_utc(dt_local):
+    # a naive value is read as local time with the offset in force on that date, DST included
+    return dt_local.replace(tzinfo=None).astimezone(timezone.utc)
+
+
 def convert_to_utc(date_time_value):
     if isinstance(date_time_value,
                   str):
@@ -475,6 +467,8 @@ def remove_timezone_info(date_time):
         return None
     if isinstance(date_time,
                   str):
+        # dateutil is imported on first use: it is slow to load and the tray does not need it to start
+        from dateutil import parser
         date_time = parser.parse(date_time)
     wall_clock = date_time.replace(tzinfo=None)
     return wall_clock.strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -497,3 +491,125 @@ def create_date_id(instance_id,
 
 def recover_date_id(instance_id):
     return instance_id.split('_')[0]
+
+
+def to_utc_datetime(date_time_value):
+    if date_time_value is None:
+        return None
+    if isinstance(date_time_value,
+                  str):
+        try:
+            date_time = datetime.fromisoformat(date_time_value.replace('Z',
+                                                                       '+00:00'))
+        except ValueError:
+            return None
+    elif isinstance(date_time_value,
+                    datetime):
+        date_time = date_time_value
+    else:
+        return None
+    if date_time.tzinfo is None:
+        date_time = date_time.replace(tzinfo=timezone.utc)
+    return date_time.astimezone(timezone.utc)
+
+
+def extract_date_id(text: str) -> datetime | None:
+    if not text:
+        return None
+    date_full = extract_date_full(text)
+    if date_full:
+        return datetime.strptime(date_full,
+                                 '%Y-%m-%d-%H-%M-%S').replace(tzinfo=timezone.utc)
+    match = re.search(r'(\d{4})_(\d{2})_(\d{2})[T_](\d{2})_(\d{2})_(\d{2})',
+                      text)
+    if not match:
+        return None
+    year, month, day, hour, minute, second = (int(date_part) for date_part in match.groups())
+    try:
+        return datetime(year,
+                        month,
+                        day,
+                        hour,
+                        minute,
+                        second,
+                        tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def utc_key(date_time_value) -> str | None:
+    """Normalised UTC start used to match occurrences across calendars: YYYYMMDDTHHMMSSZ."""
+    date_time = to_utc_datetime(date_time_value)
+    if date_time is None:
+        return None
+    return date_time.strftime('%Y%m%dT%H%M%SZ')
+
+
+def utc_key_from_id(text: str) -> str | None:
+    """utc_key of a Google Calendar instance ID; all-day instances only carry YYYYMMDD."""
+    if not text:
+        return None
+    match = re.search(r'_(\d{8}(?:T\d{6}Z)?)$',
+                      text)
+    if not match:
+        return None
+    return match.group(1)
+
+
+def local_date_key(date_time_value) -> str | None:
+    """YYYYMMDD of a local start, either a datetime or the 'YYYY-MM-DDTHH:MM:SS' text read from Outlook."""
+    if hasattr(date_time_value,
+               'strftime'):
+        return date_time_value.strftime('%Y%m%d')
+    if isinstance(date_time_value,
+                  str) and len(date_time_value) >= 10:
+        return date_time_value[:10].replace('-',
+                                            '')
+    return None
+
+
+def g_calendar_start_key(g_calendar_event: dict) -> str | None:
+    """utc_key of a Google Calendar occurrence (its original start when it was moved); YYYYMMDD when all-day."""
+    g_calendar_start = g_calendar_event.get('originalStartTime') or g_calendar_event.get('start',
+                                                                                         dict())
+    if 'dateTime' in g_calendar_start:
+        return utc_key(g_calendar_start['dateTime'])
+    if 'date' in g_calendar_start:
+        return g_calendar_start['date'].replace('-',
+                                                '')
+    return None
+
+
+def parse_exdates(recurrence_lines: list) -> set[str]:
+    """Start keys of every EXDATE line of a Google Calendar recurrence list."""
+    exdates = set()
+    for recurrence_line in recurrence_lines or []:
+        if not recurrence_line.upper().startswith('EXDATE'):
+            continue
+        exdate_parameters, _, exdate_values = recurrence_line.partition(':')
+        exdate_timezone = None
+        for exdate_parameter in exdate_parameters.split(';')[1:]:
+            parameter_name, _, parameter_value = exdate_parameter.partition('=')
+            if parameter_name.upper() == 'TZID':
+                from dateutil import tz
+                exdate_timezone = tz.gettz(parameter_value)
+        for exdate_value in exdate_values.split(','):
+            exdate_value = exdate_value.strip()
+            if len(exdate_value) == 8:
+                exdates.add(exdate_value)
+                continue
+            try:
+                exdate = datetime.strptime(exdate_value.rstrip('Z'),
+                                           '%Y%m%dT%H%M%S')
+            except ValueError:
+                continue
+            if not exdate_value.endswith('Z') and exdate_timezone is not None:
+                exdate = exdate.replace(tzinfo=exdate_timezone)
+            exdates.add(utc_key(exdate))
+    return exdates
+
+
+def format_exdate(start_key: str) -> str:
+    if len(start_key) == 8:
+        return f'EXDATE;VALUE=DATE:{start_key}'
+    return f'EXDATE:{start_key}'
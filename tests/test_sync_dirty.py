@@ -0,0 +1,154 @@
+# test_sync_dirty.py - event-driven cycles read Outlook again instead of the cached full listing
+#   python -m unittest discover tests
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+sys.path.insert(0,
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the connectors import pywin32 and the Google API client, as the app does
+DEPENDENCIES = all(importlib.util.find_spec(name) is not None for name in ('win32com',
+                                                                           'googleapiclient'))
+
+MS_OUTLOOK_ID = 'OUTLOOK0001'
+G_CALENDAR_ID = 'google0001'
+
+
+class _MicrosoftOutlookCalendar:
+    """Answers the full window from its cache until invalidated, like MicrosoftOutlookConnector."""
+
+    def __init__(self,
+                 ms_outlook_instances: dict):
+        self.ms_outlook_instances = ms_outlook_instances
+        self.ms_outlook_cache = None
+
+    def invalidate_cache(self):
+        self.ms_outlook_cache = None
+
+    def get_all_instances_ms_outlook(self,
+                                     sync_window=None,
+                                     ms_outlook_known: dict = None) -> dict:
+        if sync_window.full and self.ms_outlook_cache is not None:
+            return self.ms_outlook_cache
+        ms_outlook_listing = dict(self.ms_outlook_instances)
+        if sync_window.full:
+            self.ms_outlook_cache = ms_outlook_listing
+        return ms_outlook_listing
+
+    def get_all_recurrences_ms_outlook(self,
+                                       sync_window=None) -> dict:
+        return dict()
+
+
+class _GoogleCalendar:
+    def __init__(self,
+                 g_calendar_events: dict):
+        self.g_calendar_events = g_calendar_events
+
+    def get_all_sub_instances_g_calendar(self,
+                                         include_cancelled: bool = False,
+                                         sync_window=None) -> dict:
+        return dict(self.g_calendar_events)
+
+    def get_all_masters_g_calendar(self,
+                                   include_cancelled: bool = False,
+                                   sync_window=None) -> dict:
+        return dict()
+
+
+class _SyncJournal:
+    def reconcile(self,
+                  event_mapping):
+        pass
+
+
+@unittest.skipUnless(DEPENDENCIES,
+                     'needs pywin32 and the Google API client')
+class SyncDirtyTest(unittest.TestCase):
+    def setUp(self):
+        from connector.event_mapping import EventMapping
+        from system.sync_tasks import SyncTask
+
+        start = (datetime.now(timezone.utc) + timedelta(days=1)).replace(microsecond=0)
+        end = start + timedelta(hours=1)
+        ms_outlook_event = {
+                'EntryID'    : MS_OUTLOOK_ID,
+                'Subject'    : 'Dentist',
+                'IsRecurring': False,
+                'Start'      : start.astimezone().replace(tzinfo=None).isoformat(),
+                'End'        : end.astimezone().replace(tzinfo=None).isoformat(),
+                'StartUTC'   : start.isoformat(),
+                'EndUTC'     : end.isoformat()}
+        g_calendar_event = {
+                'id'     : G_CALENDAR_ID,
+                'summary': 'Dentist',
+                'status' : 'confirmed',
+                'start'  : {
+                        'dateTime': start.isoformat()},
+                'end'    : {
+                        'dateTime': end.isoformat()}}
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        event_mapping = EventMapping()
+        # written to a scratch file, the app's map is left alone
+        event_mapping.event_map_file = os.path.join(self.temporary_directory.name,
+                                                    'event_map.json')
+        event_mapping.event_map_archive_file = os.path.join(self.temporary_directory.name,
+                                                            'event_map_archive.jsonl')
+        event_mapping.event_map = event_mapping._get_default_structure()
+        event_mapping.event_map['single_events'][MS_OUTLOOK_ID] = G_CALENDAR_ID
+        event_mapping.event_map['single_events_date'][MS_OUTLOOK_ID] = end.isoformat()
+        self.ms_outlook_calendar = _MicrosoftOutlookCalendar({
+                f'{MS_OUTLOOK_ID}_{start.strftime("%Y%m%d%H%M%S")}': ms_outlook_event})
+        self.sync_task = SyncTask.__new__(SyncTask)
+        self.sync_task.event_mapping = event_mapping
+        self.sync_task.sync_journal = _SyncJournal()
+        self.sync_task.retry_queue = None
+        self.sync_task.stop_event = None
+        self.sync_task.cancel_event = None
+        self.sync_task.ms_outlook_connection = self.ms_outlook_calendar
+        self.sync_task.g_calendar_connection = _GoogleCalendar({
+                G_CALENDAR_ID: g_calendar_event})
+        self.sync_task.snapshot = None
+        self.sync_task.snapshot_cache = None
+        self.sync_task.last_window = None
+        self.sync_task.statistics = None
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def _g_calendar_deletes(self,
+                            sync_plan) -> list:
+        from connector.event_mapping import EventSide
+        from system.sync_plan import SyncAction
+
+        return [operation for operation in sync_plan if operation.action == SyncAction.DELETE and operation.target == EventSide.G_CALENDAR and operation.g_calendar_id == G_CALENDAR_ID]
+
+    def test_removal_after_full_listing_plans_g_calendar_delete(self):
+        from system.sync_window import SyncWindow
+
+        # a full cycle lists Outlook and leaves the listing cached
+        sync_plan = self.sync_task.sync_task(True,
+                                             SyncWindow(),
+                                             probe=False)
+        self.assertEqual(self._g_calendar_deletes(sync_plan),
+                         [])
+        # the user deletes the event in Outlook; ItemRemove does not say which
+        self.ms_outlook_calendar.ms_outlook_instances.clear()
+        sync_plan = self.sync_task.sync_dirty({
+                'items'  : dict(),
+                'removed': 1},
+                True)
+        self.assertEqual(self.sync_task.last_window.full,
+                         True)
+        self.assertEqual(len(self._g_calendar_deletes(sync_plan)),
+                         1)
+
+
+if __name__ == '__main__':
+    unittest.main()